@@ -0,0 +1,150 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth import get_guest_session_id
+from backend.cache import TTLCache
+from backend.chat_writer import chat_writer
+from backend.database import ChatSession, create_chat_session
+from backend.guest_store import (
+    GUEST_PERSIST_AFTER, GUEST_STATE_MAX_BYTES, dump_guest_state, guest_stats, load_guest_state,
+    persist_guest_conversation
+)
+
+# Active chat session per user/guest -> (chat_sessions.id, created_at), so steady-state
+# chats resolve their session without a DB read
+ACTIVE_SESSION_CACHE_TTL = int(os.getenv("ACTIVE_SESSION_CACHE_TTL", "3600"))
+active_session_cache = TTLCache(maxsize=int(os.getenv("ACTIVE_SESSION_CACHE_SIZE", "10000")), ttl=ACTIVE_SESSION_CACHE_TTL)
+
+
+def session_expired(created_at: datetime) -> bool:
+    """Registered users start a new chat session once the current one is over a day old"""
+    return (datetime.utcnow() - created_at).days > 1
+
+
+async def resolve_chat_session_id(db: AsyncSession, current_user: Optional[dict],
+                                  guest_state: Optional[str] = None) -> Optional[int]:
+    if current_user and current_user.get("user_type") in ["user", "admin"]:
+        # Registered user - create or get session
+        cache_key = ("user", current_user["user_id"])
+        cached = active_session_cache.get(cache_key)
+        if cached and not session_expired(cached[1]):
+            return cached[0]
+
+        result = await db.execute(
+            select(ChatSession).where(
+                ChatSession.user_id == current_user["user_id"]
+            ).order_by(ChatSession.created_at.desc()).limit(1)
+        )
+        chat_session = result.scalars().first()
+
+        if not chat_session or session_expired(chat_session.created_at):
+            chat_session = await create_chat_session(db, user_id=current_user["user_id"])
+    elif current_user and current_user.get("user_type") == "guest":
+        # Guest user - no row until the conversation is persisted, see save_chat_turn
+        session_id = current_user.get("email", "").replace("guest_", "")
+        cache_key = ("guest", session_id)
+        cached = active_session_cache.get(cache_key)
+        if cached:
+            return cached[0]
+        if load_guest_state(guest_state, session_id):
+            return None
+
+        # Sessions claimed by an account no longer take the guest token's turns
+        result = await db.execute(
+            select(ChatSession).where(ChatSession.session_id == session_id, ChatSession.user_id.is_(None))
+            .order_by(ChatSession.created_at.desc()).limit(1)
+        )
+        chat_session = result.scalars().first()
+
+        if not chat_session:
+            return None
+    else:
+        return None
+
+    active_session_cache.set(cache_key, (chat_session.id, chat_session.created_at))
+    return chat_session.id
+
+
+def invalidate_active_session(chat_session):
+    """Forget the cached active session if it is the one being deleted.
+
+    Takes anything with the id, user_id and session_id of a chat_sessions row.
+    """
+    if chat_session.user_id is not None:
+        cache_key = ("user", chat_session.user_id)
+    else:
+        cache_key = ("guest", chat_session.session_id)
+    cached = active_session_cache.pop(cache_key)
+    if cached and cached[0] != chat_session.id:
+        active_session_cache.set(cache_key, cached)
+
+
+async def save_chat_turn(db: AsyncSession, current_user: Optional[dict], chat_session_id: Optional[int],
+                         turn: dict, guest_state: Optional[str] = None) -> Optional[str]:
+    """Queue a finished chat turn; guest turns ride in the returned guest_state until the conversation is worth keeping"""
+    if current_user and current_user.get("user_type") == "guest":
+        session_id = current_user.get("email", "").replace("guest_", "")
+        turns = load_guest_state(guest_state, session_id)
+        if chat_session_id:
+            # Turns buffered by a concurrent request before the session existed
+            for buffered in turns:
+                chat_writer.enqueue(session_id=chat_session_id, owner=("guest", session_id), **buffered)
+        else:
+            turns.append(turn)
+            guest_stats["buffered_turns"] += 1
+            if len(turns) < GUEST_PERSIST_AFTER:
+                guest_state = dump_guest_state(session_id, turns)
+                if len(guest_state) <= GUEST_STATE_MAX_BYTES:
+                    return guest_state
+            chat_session = await persist_guest_conversation(db, session_id, turns)
+            active_session_cache.set(("guest", session_id), (chat_session.id, chat_session.created_at))
+            return None
+
+    if chat_session_id:
+        chat_writer.enqueue(session_id=chat_session_id, owner=_owner(current_user), **turn)
+    return None
+
+
+def _owner(current_user: dict):
+    if current_user.get("user_type") == "guest":
+        return ("guest", current_user.get("email", "").replace("guest_", ""))
+    return ("user", current_user["user_id"])
+
+
+async def reassign_orphaned_turn(db: AsyncSession, owner) -> Optional[int]:
+    """Session for a turn whose cached chat session was deleted, e.g. on another replica"""
+    kind, key = owner
+    active_session_cache.pop(owner)
+    if kind == "user":
+        return await resolve_chat_session_id(db, {"user_id": key, "user_type": "user"})
+    chat_session_id = await resolve_chat_session_id(db, {"email": f"guest_{key}", "user_type": "guest"})
+    if chat_session_id:
+        return chat_session_id
+    chat_session = await create_chat_session(db, session_id=key)
+    active_session_cache.set(owner, (chat_session.id, chat_session.created_at))
+    return chat_session.id
+
+
+chat_writer.resolve_orphan = reassign_orphaned_turn
+
+
+async def claim_guest_conversation(db: AsyncSession, credentials: Optional[HTTPAuthorizationCredentials], user_id: int,
+                                   guest_state: Optional[str] = None):
+    """Attach the chats of the guest token the client still holds to the account it signed in to"""
+    session_id = get_guest_session_id(credentials)
+    if not session_id:
+        return
+    await persist_guest_conversation(db, session_id, load_guest_state(guest_state, session_id), user_id=user_id)
+    await db.execute(
+        update(ChatSession)
+        .where(ChatSession.session_id == session_id, ChatSession.user_id.is_(None))
+        .values(user_id=user_id)
+    )
+    await db.commit()
+    active_session_cache.pop(("guest", session_id))
+    active_session_cache.pop(("user", user_id))
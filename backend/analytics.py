@@ -0,0 +1,186 @@
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import ChatSession, ChatMessage
+from backend.cache import TTLCache
+
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+ANALYTICS_SETTLE_SECONDS = int(os.getenv("ANALYTICS_SETTLE_SECONDS", "60"))
+# Closed buckets are rebuilt from scratch after this long, so retention purges show up eventually
+ANALYTICS_REBUILD_SECONDS = int(os.getenv("ANALYTICS_REBUILD_SECONDS", "3600"))
+
+INTERVALS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+DEFAULT_SPAN = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+MAX_BUCKETS = 2000
+
+analytics_cache = TTLCache(maxsize=256, ttl=ANALYTICS_CACHE_TTL)
+# interval -> {"buckets": {bucket: rows}, "start", "end", "built_at"}; closed buckets only
+closed_buckets: Dict[str, dict] = {}
+
+
+def floor_to_interval(value: datetime, interval: str) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if interval == "day" else value
+
+
+def bucket_expression(dialect: str, column, interval: str):
+    if dialect == "postgresql":
+        return func.date_trunc(interval, column)
+    # SQLite stores timestamps as ISO strings
+    return func.strftime("%Y-%m-%d %H:00:00" if interval == "hour" else "%Y-%m-%d 00:00:00", column)
+
+
+def to_datetime(value) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+async def query_message_groups(db: AsyncSession, interval: str, start: datetime, end: datetime) -> Dict[datetime, List[dict]]:
+    """Grouped message counts for [start, end), keyed by bucket start"""
+    bucket = bucket_expression(db.bind.dialect.name, ChatMessage.created_at, interval).label("bucket")
+    is_guest = case((ChatSession.user_id.is_(None), 1), else_=0).label("is_guest")
+    query = (
+        select(
+            bucket,
+            is_guest,
+            ChatMessage.language,
+            ChatMessage.complexity,
+            ChatMessage.provider,
+            func.count().label("messages"),
+            func.sum(case((ChatMessage.cached.is_(True), 1), else_=0)).label("cached"),
+            func.coalesce(func.sum(ChatMessage.input_tokens), 0).label("input_tokens"),
+            func.coalesce(func.sum(ChatMessage.output_tokens), 0).label("output_tokens"),
+            func.coalesce(func.sum(ChatMessage.latency_ms), 0).label("latency_sum"),
+            func.count(ChatMessage.latency_ms).label("latency_count"),
+        )
+        .join(ChatSession, ChatMessage.session_id == ChatSession.id)
+        .where(ChatMessage.created_at >= start, ChatMessage.created_at < end)
+        .group_by(bucket, is_guest, ChatMessage.language, ChatMessage.complexity, ChatMessage.provider)
+    )
+    groups: Dict[datetime, List[dict]] = {}
+    for row in (await db.execute(query)).mappings():
+        groups.setdefault(to_datetime(row["bucket"]), []).append(dict(row))
+    return groups
+
+
+async def query_new_sessions(db: AsyncSession, interval: str, start: datetime, end: datetime) -> Dict[datetime, dict]:
+    bucket = bucket_expression(db.bind.dialect.name, ChatSession.created_at, interval).label("bucket")
+    query = (
+        select(
+            bucket,
+            func.count().label("sessions"),
+            func.sum(case((ChatSession.user_id.is_(None), 1), else_=0)).label("guest_sessions"),
+        )
+        .where(ChatSession.created_at >= start, ChatSession.created_at < end)
+        .group_by(bucket)
+    )
+    return {to_datetime(row["bucket"]): dict(row) for row in (await db.execute(query)).mappings()}
+
+
+async def load_buckets(db: AsyncSession, interval: str, start: datetime, end: datetime) -> Dict[datetime, dict]:
+    """Raw grouped rows per bucket for [start, end), reusing closed buckets already computed"""
+    now = datetime.utcnow()
+    settled = floor_to_interval(now - timedelta(seconds=ANALYTICS_SETTLE_SECONDS), interval)
+
+    cache = closed_buckets.get(interval)
+    if (cache is None or start < cache["start"] or cache["end"] < start
+            or time.monotonic() - cache["built_at"] > ANALYTICS_REBUILD_SECONDS):
+        cache = {"buckets": {}, "start": start, "end": start, "built_at": time.monotonic()}
+        closed_buckets[interval] = cache
+
+    # Only the part of the range past the cached closed buckets hits the database
+    query_from = max(start, cache["end"])
+    fresh: Dict[datetime, dict] = {}
+    if query_from < end:
+        messages = await query_message_groups(db, interval, query_from, end)
+        sessions = await query_new_sessions(db, interval, query_from, end)
+        for bucket in set(messages) | set(sessions):
+            fresh[bucket] = {"groups": messages.get(bucket, []), "sessions": sessions.get(bucket)}
+        closed_until = min(settled, end)
+        for bucket, rows in fresh.items():
+            if bucket < closed_until:
+                cache["buckets"][bucket] = rows
+        cache["end"] = max(cache["end"], closed_until)
+
+    buckets = {bucket: rows for bucket, rows in cache["buckets"].items() if start <= bucket < end}
+    buckets.update(fresh)
+    return buckets
+
+
+def summarize_bucket(rows: Optional[dict]) -> dict:
+    groups = rows["groups"] if rows else []
+    sessions = rows["sessions"] if rows and rows["sessions"] else {}
+    messages = sum(g["messages"] for g in groups)
+    guest = sum(g["messages"] for g in groups if g["is_guest"])
+    latency_count = sum(g["latency_count"] for g in groups)
+    return {
+        "messages": messages,
+        "guest_messages": guest,
+        "registered_messages": messages - guest,
+        "cached_messages": sum(g["cached"] for g in groups),
+        "input_tokens": sum(g["input_tokens"] for g in groups),
+        "output_tokens": sum(g["output_tokens"] for g in groups),
+        "avg_latency_ms": round(sum(g["latency_sum"] for g in groups) / latency_count, 1) if latency_count else None,
+        "new_sessions": sessions.get("sessions", 0),
+        "new_guest_sessions": sessions.get("guest_sessions") or 0,
+    }
+
+
+def mix(groups: List[dict], field: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for group in groups:
+        name = group[field] or "unknown"
+        counts[name] = counts.get(name, 0) + group["messages"]
+    return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+
+async def get_chat_analytics(db: AsyncSession, interval: str = "hour", start: Optional[datetime] = None,
+                             end: Optional[datetime] = None, refresh: bool = False) -> dict:
+    if interval not in INTERVALS:
+        raise ValueError("interval must be 'hour' or 'day'")
+    cache_key = (interval, start, end)
+    if not refresh:
+        cached = analytics_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    range_end = floor_to_interval(end or datetime.utcnow(), interval) + INTERVALS[interval]
+    range_start = floor_to_interval(start or range_end - DEFAULT_SPAN[interval], interval)
+    bucket_count = (range_end - range_start) // INTERVALS[interval]
+    if bucket_count <= 0 or bucket_count > MAX_BUCKETS:
+        raise ValueError(f"Range must cover between 1 and {MAX_BUCKETS} {interval}s")
+
+    buckets = await load_buckets(db, interval, range_start, range_end)
+
+    # Zero-filled series so charts get a point for every bucket
+    series = []
+    for i in range(bucket_count):
+        bucket = range_start + i * INTERVALS[interval]
+        series.append({"bucket": bucket.isoformat(), **summarize_bucket(buckets.get(bucket))})
+
+    groups = [group for rows in buckets.values() for group in rows["groups"]]
+    totals = summarize_bucket({"groups": groups, "sessions": {
+        "sessions": sum(point["new_sessions"] for point in series),
+        "guest_sessions": sum(point["new_guest_sessions"] for point in series),
+    }})
+    result = {
+        "interval": interval,
+        "start": range_start.isoformat(),
+        "end": range_end.isoformat(),
+        "totals": {
+            **totals,
+            "guest_share": round(totals["guest_messages"] / totals["messages"], 4) if totals["messages"] else 0.0,
+            "cache_hit_rate": round(totals["cached_messages"] / totals["messages"], 4) if totals["messages"] else 0.0,
+        },
+        "language_mix": mix(groups, "language"),
+        "complexity_mix": mix(groups, "complexity"),
+        "provider_mix": mix(groups, "provider"),
+        "series": series,
+        "generated_at": datetime.utcnow().isoformat()
+    }
+    analytics_cache.set(cache_key, result)
+    return result
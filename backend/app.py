@@ -1,53 +1,64 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, HTTPException, Depends, UploadFile, File
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, validator
 from datetime import datetime, timedelta
-from typing import Literal, Dict, Optional, List
-from typing import Literal, Dict, Optional, List
+from typing import Literal, Optional
 import logging
 import os
-import hashlib
-import uuid
-from fastapi import status
 import uuid
+import time
 from fastapi import status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from dotenv import load_dotenv
 from backend.database import (
-    SessionLocal, Info, User, ChatSession, ChatMessage, init_db,
-    get_user_by_email, create_user, create_chat_session, create_chat_message
+    AsyncSessionLocal, Info, User, ChatSession, ChatMessage, init_db, get_db, get_pool_stats,
+    get_user_by_email, create_user, get_chat_sessions_page
 )
-from backend.database import (
-    SessionLocal, Info, User, ChatSession, ChatMessage, init_db,
-    get_user_by_email, create_user, create_chat_session, create_chat_message
+from backend.chat_writer import chat_writer
+from backend.guest_store import get_guest_stats, make_turn
+from backend.active_sessions import (
+    active_session_cache, resolve_chat_session_id, invalidate_active_session, save_chat_turn, claim_guest_conversation
 )
-from backend.claude_api import ask_claude, clear_cache, cleanup_cache
-from backend.auth import (
-    authenticate_user, create_access_token, get_password_hash, 
-    get_current_user, get_current_admin_user, create_guest_token,
-    UserCreate, UserLogin, Token, UserUpdate
+from backend.retention import run_retention, get_archived_session, start_retention_job, stop_retention_job
+from backend.stats import get_stats_snapshot, refresh_stats_snapshot, start_stats_refresher, stop_stats_refresher
+from backend.cache import TTLCache
+from backend.assets import AssetStaticFiles, STATIC_DIR, asset_url, build_assets
+from backend.pages import PageCache
+from backend.responses import FastJSONResponse, CompressionMiddleware, compression_stats
+from backend.rate_limit import RateLimitMiddleware, rate_limiter, get_client_ip, get_rate_limit_stats
+from backend.pagination import encode_cursor, decode_cursor
+from backend.search import search_messages
+from backend.export import iter_export_batches, stream_ndjson, stream_csv
+from backend.info_import import import_info_file
+from backend.analytics import get_chat_analytics
+from backend.claude_api import ask_claude_with_usage, clear_cache, cleanup_cache, detect_language
+from backend.token_quota import (
+    get_quota_keys, check_token_budgets, record_token_usage,
+    cleanup_token_usage, get_token_usage_summary
 )
-from backend.chatgpt_api import ask_openai
-from backend.email_service import send_feedback_email
 from backend.auth import (
-    authenticate_user, create_access_token, get_password_hash, 
-    get_current_user, get_current_admin_user, create_guest_token,
-    UserCreate, UserLogin, Token, UserUpdate
+    authenticate_user, create_access_token, hash_password, verify_password_async,
+    get_current_user, get_current_user_from_claims, get_current_admin_user, create_guest_token,
+    invalidate_principal, UserCreate, UserLogin, Token
 )
-from backend.chatgpt_api import ask_openai
-from backend.email_service import send_feedback_email
+from backend.chatgpt_api import ask_openai_with_usage
+from backend.feedback import save_feedback, list_feedback, start_feedback_digest, stop_feedback_digest
+from backend.email_outbox import start_email_worker, stop_email_worker, get_email_stats
 
 load_dotenv()
 
 logging.basicConfig(filename='logs/chat_logs.txt', level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-app = FastAPI(docs_url=None, redoc_url=None)
+app = FastAPI(docs_url=None, redoc_url=None, default_response_class=FastJSONResponse)
 
+# Added before CORS so that 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -55,53 +66,80 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so everything the app sends can be compressed
+app.add_middleware(CompressionMiddleware)
 
 templates = Jinja2Templates(directory="frontend/templates")
-app.mount("/static", StaticFiles(directory="/app/frontend/static"), name="static")
+templates.env.globals["asset_url"] = asset_url
+# Pages don't depend on the request; they are rendered once and served as bytes
+page_cache = PageCache(templates)
+app.mount("/static", AssetStaticFiles(directory=STATIC_DIR), name="static")
 
 security = HTTPBearer()
+# Login and registration accept an optional guest token to carry the guest's chats over
+optional_bearer = HTTPBearer(auto_error=False)
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-# Simple rate limiting (use Redis in production)
-rate_limit_storage: Dict[str, Dict] = {}
-
-def get_client_ip(request: Request) -> str:
-    """Get client IP for rate limiting"""
-    x_forwarded_for = request.headers.get("X-Forwarded-For")
-    if x_forwarded_for:
-        return x_forwarded_for.split(",")[0].strip()
-    return request.client.host
-
-def check_rate_limit(client_ip: str, limit: int = 50, window: int = 3600) -> bool:
-    """Check if client has exceeded rate limit (30 requests per hour)"""
-    now = datetime.now()
-    
-    if client_ip not in rate_limit_storage:
-        rate_limit_storage[client_ip] = {"count": 1, "window_start": now}
-        return True
-    
-    client_data = rate_limit_storage[client_ip]
-    
-    # Reset window if expired
-    if now - client_data["window_start"] > timedelta(seconds=window):
-        client_data["count"] = 1
-        client_data["window_start"] = now
-        return True
+# Total session counts are cached briefly, so history pages don't run COUNT(*) on every request
+session_count_cache = TTLCache(maxsize=4096, ttl=60)
+
+async def count_chat_sessions(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    cache_key = user_id if user_id is not None else "all"
+    total = session_count_cache.get(cache_key)
+    if total is None:
+        query = select(func.count()).select_from(ChatSession)
+        if user_id is not None:
+            query = query.where(ChatSession.user_id == user_id)
+        total = await db.scalar(query)
+        session_count_cache.set(cache_key, total)
+    return total
+
+async def paginate_chat_sessions(
+    db: AsyncSession,
+    page: int,
+    limit: int,
+    cursor: Optional[str],
+    include_total: bool,
+    user_id: Optional[int] = None
+):
+    """Keyset pagination over (created_at, id); page numbers are still accepted for old clients"""
+    page = max(page, 1)
+    limit = max(1, min(limit, 100))
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    # Check if within limit
-    if client_data["count"] >= limit:
-        return False
+    # Fetch one extra row to know whether another page exists
+    sessions = await get_chat_sessions_page(
+        db, user_id=user_id, offset=(page - 1) * limit, limit=limit + 1, after=after
+    )
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
     
-    client_data["count"] += 1
-    return True
+    page_info = {
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(sessions[-1].created_at, sessions[-1].id) if has_more else None
+    }
+    if not cursor:
+        page_info["page"] = page
+    if include_total:
+        total_sessions = await count_chat_sessions(db, user_id)
+        page_info["total"] = total_sessions
+        page_info["total_pages"] = (total_sessions + limit - 1) // limit
+    return sessions, page_info
 
 def verify_admin_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if credentials.credentials != ADMIN_TOKEN:
         raise HTTPException(status_code=403, detail="Invalid admin token")
     return credentials
 
-class ChatMessage(BaseModel):
+class ChatRequest(BaseModel):
     message: str
+    guest_state: Optional[str] = None  # Echoed back from the previous guest response
     
     @validator('message')
     def validate_message(cls, v):
@@ -126,20 +164,6 @@ class UserProfileUpdate(BaseModel):
             raise ValueError("New password must be at least 6 characters long")
         return v
 
-class GuestLogin(BaseModel):
-    session_id: Optional[str] = None
-
-class UserProfileUpdate(BaseModel):
-    full_name: Optional[str] = None
-    current_password: Optional[str] = None
-    new_password: Optional[str] = None
-    
-    @validator('new_password')
-    def validate_new_password(cls, v, values):
-        if v and len(v) < 6:
-            raise ValueError("New password must be at least 6 characters long")
-        return v
-
 class InfoCreate(BaseModel):
     category: str
     key: str
@@ -169,13 +193,24 @@ class FeedbackMessage(BaseModel):
 async def startup():
     init_db()
     # Create default admin user
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         from backend.database import create_admin_user_if_not_exists
-        admin_user = create_admin_user_if_not_exists(db)
+        admin_user = await create_admin_user_if_not_exists(db)
         logging.info(f"Admin user ready: {admin_user.email}")
-    finally:
-        db.close()
+    
+    # Fingerprinted copies of frontend/static for asset_url(); only missing files are written
+    try:
+        build_assets()
+    except OSError as e:
+        logging.error(f"Static asset build failed, serving unhashed URLs: {e}")
+    # Rendered after the build so pages link the hashed asset URLs
+    page_cache.prerender()
+    
+    await chat_writer.start()
+    start_stats_refresher()
+    start_retention_job()
+    start_email_worker()
+    start_feedback_digest()
     
     os.makedirs("logs", exist_ok=True)
     logging.info("=== SYSTEM STARTUP COMPLETE ===")
@@ -183,6 +218,12 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     """Cleanup on shutdown"""
+    # Flush queued chat messages before the process exits
+    await chat_writer.stop()
+    await stop_stats_refresher()
+    await stop_retention_job()
+    await stop_feedback_digest()
+    await stop_email_worker()
     clear_cache()
     logging.info("=== SYSTEM SHUTDOWN COMPLETE ===")
 
@@ -191,474 +232,136 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
 @app.post("/chat")
-async def chat_api(request: Request, msg: ChatMessage, current_user: dict = Depends(get_current_user)):
-async def chat_api(request: Request, msg: ChatMessage, current_user: dict = Depends(get_current_user)):
+async def chat_api(
+    request: Request,
+    msg: ChatRequest,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    chat_session_id = None
+    quota_keys = []
+    started = time.perf_counter()
     try:
-        # Rate limiting
+        # Request limits are enforced by RateLimitMiddleware; the address keys anonymous token quotas
         client_ip = get_client_ip(request)
-        if not check_rate_limit(client_ip):
+        
+        # Token budget check (rolling window, separate from request count); rejected
+        # requests never reach the session lookup, so they don't create rows
+        quota_keys = get_quota_keys(current_user, client_ip)
+        if not check_token_budgets(quota_keys):
             raise HTTPException(
-                status_code=429, 
-                detail="Rate limit exceeded. Please try again later."
+                status_code=429,
+                detail="Token quota exceeded. Please try again later."
             )
         
         # Handle chat session for different user types
-        db = SessionLocal()
-        try:
-            chat_session = None
-            
-            if current_user and current_user.get("user_type") in ["user", "admin"]:
-                # Registered user - create or get session
-                existing_session = db.query(ChatSession).filter(
-                    ChatSession.user_id == current_user["user_id"]
-                ).order_by(ChatSession.created_at.desc()).first()
-                
-                if not existing_session or (datetime.utcnow() - existing_session.created_at).days > 1:
-                    chat_session = create_chat_session(db, user_id=current_user["user_id"])
-                else:
-                    chat_session = existing_session
-            elif current_user and current_user.get("user_type") == "guest":
-                # Guest user - create session with session_id
-                session_id = current_user.get("email", "").replace("guest_", "")
-                existing_session = db.query(ChatSession).filter(
-                    ChatSession.session_id == session_id
-                ).first()
-                
-                if not existing_session:
-                    chat_session = create_chat_session(db, session_id=session_id)
-                else:
-                    chat_session = existing_session
-        finally:
-            db.close()
-        # Handle chat session for different user types
-        db = SessionLocal()
-        try:
-            chat_session = None
-            
-            if current_user and current_user.get("user_type") in ["user", "admin"]:
-                # Registered user - create or get session
-                existing_session = db.query(ChatSession).filter(
-                    ChatSession.user_id == current_user["user_id"]
-                ).order_by(ChatSession.created_at.desc()).first()
-                
-                if not existing_session or (datetime.utcnow() - existing_session.created_at).days > 1:
-                    chat_session = create_chat_session(db, user_id=current_user["user_id"])
-                else:
-                    chat_session = existing_session
-            elif current_user and current_user.get("user_type") == "guest":
-                # Guest user - create session with session_id
-                session_id = current_user.get("email", "").replace("guest_", "")
-                existing_session = db.query(ChatSession).filter(
-                    ChatSession.session_id == session_id
-                ).first()
-                
-                if not existing_session:
-                    chat_session = create_chat_session(db, session_id=session_id)
-                else:
-                    chat_session = existing_session
-        finally:
-            db.close()
-        
-        response = ask_claude(msg.message)
-        
-        # Save chat message to database
-        if chat_session:
-            db = SessionLocal()
-            try:
-                create_chat_message(
-                    db, 
-                    session_id=chat_session.id,
-                    message=msg.message,
-                    response=response,
-                    message_type="conversation"
-                )
-            finally:
-                db.close()
+        chat_session_id = await resolve_chat_session_id(db, current_user, msg.guest_state)
         
+        response, usage = await ask_claude_with_usage(msg.message)
+        for quota_key in quota_keys:
+            record_token_usage(quota_key, usage["input_tokens"] + usage["output_tokens"])
         
-        # Save chat message to database
-        if chat_session:
-            db = SessionLocal()
-            try:
-                create_chat_message(
-                    db, 
-                    session_id=chat_session.id,
-                    message=msg.message,
-                    response=response,
-                    message_type="conversation"
-                )
-            finally:
-                db.close()
+        # Queue chat message for batched write; the response doesn't wait on it
+        guest_state = await save_chat_turn(db, current_user, chat_session_id, make_turn(
+            msg.message,
+            response,
+            provider="claude",
+            latency_ms=int((time.perf_counter() - started) * 1000),
+            **usage
+        ), msg.guest_state)
         
         logging.info(f"User: {msg.message[:100]}{'...' if len(msg.message) > 100 else ''}")
         logging.info(f"Claude: {response[:100]}{'...' if len(response) > 100 else ''}")
         
-        return {"response": response, "source": "claude"}
+        return {"response": response, "source": "claude", "guest_state": guest_state}
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
         logging.error(f"Chat error: {str(e)}")
         try:
-            response = ask_openai(msg.message)
-            return {"response": response, "source": "openai"}
+            response, usage = await run_in_threadpool(ask_openai_with_usage, msg.message)
+            for quota_key in quota_keys:
+                record_token_usage(quota_key, usage["input_tokens"] + usage["output_tokens"])
+            guest_state = await save_chat_turn(db, current_user, chat_session_id, make_turn(
+                msg.message,
+                response,
+                provider="openai",
+                cached=False,
+                language=detect_language(msg.message),
+                latency_ms=int((time.perf_counter() - started) * 1000),
+                **usage
+            ), msg.guest_state)
+            return {"response": response, "source": "openai", "guest_state": guest_state}
         except Exception as openai_error:
             logging.error(f"OpenAI fallback error: {str(openai_error)}")
             raise HTTPException(status_code=500, detail="AI services temporarily unavailable")
 
 # Authentication endpoints
 @app.post("/auth/register", response_model=Token)
-async def register(user: UserCreate):
-    db = SessionLocal()
-    try:
-        # Check if user already exists
-        existing_user = get_user_by_email(db, user.email)
-        if existing_user:
-            raise HTTPException(
-                status_code=400,
-                detail="Email already registered"
-            )
-        
-        # Create new user
-        hashed_password = get_password_hash(user.password)
-        db_user = create_user(
-            db, 
-            email=user.email, 
-            hashed_password=hashed_password, 
-            full_name=user.full_name
-        )
-        
-        # Create access token
-        access_token_expires = timedelta(minutes=30)
-        access_token = create_access_token(
-            data={"sub": user.email, "user_type": "user", "user_id": db_user.id},
-            expires_delta=access_token_expires
-        )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user_type": "user",
-            "user_id": db_user.id
-        }
-    finally:
-        db.close()
-
-@app.post("/auth/login", response_model=Token)
-async def login(user: UserLogin):
-    authenticated_user = authenticate_user(user.email, user.password)
-    if not authenticated_user:
+async def register(
+    user: UserCreate,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    db: AsyncSession = Depends(get_db)
+):
+    # Check if user already exists
+    existing_user = await get_user_by_email(db, user.email)
+    if existing_user:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
+            status_code=400,
+            detail="Email already registered"
         )
     
+    # Create new user
+    hashed_password = await hash_password(user.password)
+    db_user = await create_user(
+        db, 
+        email=user.email, 
+        hashed_password=hashed_password, 
+        full_name=user.full_name
+    )
+    
+    # Keep the chats made as a guest before signing up
+    await claim_guest_conversation(db, credentials, db_user.id, user.guest_state)
+    
+    # Create access token
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": authenticated_user.email, "user_type": authenticated_user.user_type, "user_id": authenticated_user.id},
+        data={"sub": user.email, "user_type": "user", "user_id": db_user.id, "full_name": db_user.full_name},
         expires_delta=access_token_expires
     )
     
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user_type": authenticated_user.user_type,
-        "user_id": authenticated_user.id
+        "user_type": "user",
+        "user_id": db_user.id
     }
 
-@app.post("/auth/guest", response_model=Token)
-async def guest_login(guest: GuestLogin):
-    session_id = guest.session_id or str(uuid.uuid4())
-    access_token = create_guest_token(session_id)
-    
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user_type": "guest"
-    }
-
-@app.get("/auth/me")
-async def get_current_user_info(current_user: dict = Depends(get_current_user)):
-    if not current_user:
-        return {"user_type": "anonymous"}
-    return current_user
-
-# User profile and chat history endpoints
-@app.get("/user/profile")
-async def get_user_profile(current_user: dict = Depends(get_current_user)):
-    if not current_user or current_user.get("user_type") == "guest":
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.id == current_user["user_id"]).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        return {
-            "id": user.id,
-            "email": user.email,
-            "full_name": user.full_name,
-            "user_type": user.user_type,
-            "created_at": user.created_at.isoformat()
-        }
-    finally:
-        db.close()
-
-@app.put("/user/profile")
-async def update_user_profile(profile_data: UserProfileUpdate, current_user: dict = Depends(get_current_user)):
-    if not current_user or current_user.get("user_type") == "guest":
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.id == current_user["user_id"]).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Update full name if provided
-        if profile_data.full_name:
-            user.full_name = profile_data.full_name
-        
-        # Update password if provided
-        if profile_data.new_password and profile_data.current_password:
-            from backend.auth import verify_password
-            if not verify_password(profile_data.current_password, user.hashed_password):
-                raise HTTPException(status_code=400, detail="Current password is incorrect")
-            user.hashed_password = get_password_hash(profile_data.new_password)
-        
-        db.commit()
-        return {"message": "Profile updated successfully"}
-    finally:
-        db.close()
-
-@app.get("/user/chat-history")
-async def get_user_chat_history(
-    page: int = 1, 
-    limit: int = 10,
-    current_user: dict = Depends(get_current_user)
-):
-    if not current_user or current_user.get("user_type") == "guest":
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    db = SessionLocal()
-    try:
-        offset = (page - 1) * limit
-        
-        # Get user's chat sessions
-        sessions = db.query(ChatSession).filter(
-            ChatSession.user_id == current_user["user_id"]
-        ).order_by(ChatSession.created_at.desc()).offset(offset).limit(limit).all()
-        
-        result = []
-        for session in sessions:
-            messages = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session.id
-            ).order_by(ChatMessage.created_at.asc()).all()
-            
-            session_data = {
-                "session_id": session.id,
-                "created_at": session.created_at.isoformat(),
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "message": msg.message,
-                        "response": msg.response,
-                        "created_at": msg.created_at.isoformat()
-                    }
-                    for msg in messages
-                ]
-            }
-            result.append(session_data)
-        
-        # Get total count
-        total_sessions = db.query(ChatSession).filter(
-            ChatSession.user_id == current_user["user_id"]
-        ).count()
-        
-        return {
-            "sessions": result,
-            "total": total_sessions,
-            "page": page,
-            "limit": limit,
-            "total_pages": (total_sessions + limit - 1) // limit
-        }
-    finally:
-        db.close()
-
-@app.delete("/user/chat-session/{session_id}")
-async def delete_user_chat_session(session_id: int, current_user: dict = Depends(get_current_user)):
-    if not current_user or current_user.get("user_type") == "guest":
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    db = SessionLocal()
-    try:
-        # Verify session belongs to user
-        session = db.query(ChatSession).filter(
-            ChatSession.id == session_id,
-            ChatSession.user_id == current_user["user_id"]
-        ).first()
-        
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        # Delete messages first
-        db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-        
-        # Delete session
-        db.delete(session)
-        db.commit()
-        
-        return {"message": "Chat session deleted successfully"}
-    finally:
-        db.close()
-
-@app.post("/auth/logout")
-async def logout():
-    return {"message": "Logged out successfully"}
-
-# Admin dashboard endpoints
-@app.get("/admin/chat-history")
-async def get_chat_history(
-    page: int = 1, 
-    limit: int = 50,
-    current_user: dict = Depends(get_current_admin_user)
-):
-    db = SessionLocal()
-    try:
-        offset = (page - 1) * limit
-        
-        # Get chat sessions with messages
-        sessions = db.query(ChatSession).order_by(ChatSession.created_at.desc()).offset(offset).limit(limit).all()
-        
-        result = []
-        for session in sessions:
-            messages = db.query(ChatMessage).filter(ChatMessage.session_id == session.id).order_by(ChatMessage.created_at.asc()).all()
-            
-            user_info = "Guest"
-            if session.user:
-                user_info = f"{session.user.full_name} ({session.user.email})"
-            elif session.session_id:
-                user_info = f"Guest ({session.session_id[:8]}...)"
-            
-            session_data = {
-                "session_id": session.id,
-                "user_info": user_info,
-                "created_at": session.created_at.isoformat(),
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "message": msg.message,
-                        "response": msg.response,
-                        "created_at": msg.created_at.isoformat()
-                    }
-                    for msg in messages
-                ]
-            }
-            result.append(session_data)
-        
-        # Get total count
-        total_sessions = db.query(ChatSession).count()
-        
-        return {
-            "sessions": result,
-            "total": total_sessions,
-            "page": page,
-            "limit": limit,
-            "total_pages": (total_sessions + limit - 1) // limit
-        }
-    finally:
-        db.close()
-
-@app.get("/admin/users")
-async def get_users(current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        users = db.query(User).all()
-        return [
-            {
-                "id": user.id,
-                "email": user.email,
-                "full_name": user.full_name,
-                "user_type": user.user_type,
-                "is_active": user.is_active,
-                "created_at": user.created_at.isoformat()
-            }
-            for user in users
-        ]
-    finally:
-        db.close()
-
-@app.delete("/admin/chat-session/{session_id}")
-async def delete_chat_session(session_id: int, current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        # Delete messages first
-        db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-        
-        # Delete session
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        db.delete(session)
-        db.commit()
-        
-        return {"message": "Chat session deleted successfully"}
-    finally:
-        db.close()
-
-# Authentication endpoints
-@app.post("/auth/register", response_model=Token)
-async def register(user: UserCreate):
-    db = SessionLocal()
-    try:
-        # Check if user already exists
-        existing_user = get_user_by_email(db, user.email)
-        if existing_user:
-            raise HTTPException(
-                status_code=400,
-                detail="Email already registered"
-            )
-        
-        # Create new user
-        hashed_password = get_password_hash(user.password)
-        db_user = create_user(
-            db, 
-            email=user.email, 
-            hashed_password=hashed_password, 
-            full_name=user.full_name
-        )
-        
-        # Create access token
-        access_token_expires = timedelta(minutes=30)
-        access_token = create_access_token(
-            data={"sub": user.email, "user_type": "user", "user_id": db_user.id},
-            expires_delta=access_token_expires
-        )
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user_type": "user",
-            "user_id": db_user.id
-        }
-    finally:
-        db.close()
-
 @app.post("/auth/login", response_model=Token)
-async def login(user: UserLogin):
-    authenticated_user = authenticate_user(user.email, user.password)
+async def login(
+    user: UserLogin,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    db: AsyncSession = Depends(get_db)
+):
+    authenticated_user = await authenticate_user(db, user.email, user.password)
     if not authenticated_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if not authenticated_user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account is deactivated")
+    await claim_guest_conversation(db, credentials, authenticated_user.id, user.guest_state)
     
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": authenticated_user.email, "user_type": authenticated_user.user_type, "user_id": authenticated_user.id},
+        data={
+            "sub": authenticated_user.email,
+            "user_type": authenticated_user.user_type,
+            "user_id": authenticated_user.id,
+            "full_name": authenticated_user.full_name
+        },
         expires_delta=access_token_expires
     )
     
@@ -681,140 +384,122 @@ async def guest_login(guest: GuestLogin):
     }
 
 @app.get("/auth/me")
-async def get_current_user_info(current_user: dict = Depends(get_current_user)):
+async def get_current_user_info(current_user: dict = Depends(get_current_user_from_claims)):
     if not current_user:
         return {"user_type": "anonymous"}
     return current_user
 
 # User profile and chat history endpoints
 @app.get("/user/profile")
-async def get_user_profile(current_user: dict = Depends(get_current_user)):
+async def get_user_profile(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     if not current_user or current_user.get("user_type") == "guest":
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.id == current_user["user_id"]).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        return {
-            "id": user.id,
-            "email": user.email,
-            "full_name": user.full_name,
-            "user_type": user.user_type,
-            "created_at": user.created_at.isoformat()
-        }
-    finally:
-        db.close()
+    user = await db.get(User, current_user["user_id"])
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return {
+        "id": user.id,
+        "email": user.email,
+        "full_name": user.full_name,
+        "user_type": user.user_type,
+        "created_at": user.created_at.isoformat()
+    }
 
 @app.put("/user/profile")
-async def update_user_profile(profile_data: UserProfileUpdate, current_user: dict = Depends(get_current_user)):
+async def update_user_profile(
+    profile_data: UserProfileUpdate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
     if not current_user or current_user.get("user_type") == "guest":
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.id == current_user["user_id"]).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Update full name if provided
-        if profile_data.full_name:
-            user.full_name = profile_data.full_name
-        
-        # Update password if provided
-        if profile_data.new_password and profile_data.current_password:
-            from backend.auth import verify_password
-            if not verify_password(profile_data.current_password, user.hashed_password):
-                raise HTTPException(status_code=400, detail="Current password is incorrect")
-            user.hashed_password = get_password_hash(profile_data.new_password)
-        
-        db.commit()
-        return {"message": "Profile updated successfully"}
-    finally:
-        db.close()
+    user = await db.get(User, current_user["user_id"])
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Update full name if provided
+    if profile_data.full_name:
+        user.full_name = profile_data.full_name
+    
+    # Update password if provided
+    if profile_data.new_password and profile_data.current_password:
+        if not await verify_password_async(profile_data.current_password, user.hashed_password):
+            raise HTTPException(status_code=400, detail="Current password is incorrect")
+        user.hashed_password = await hash_password(profile_data.new_password)
+    
+    await db.commit()
+    invalidate_principal(user.id)
+    return {"message": "Profile updated successfully"}
 
 @app.get("/user/chat-history")
 async def get_user_chat_history(
     page: int = 1, 
     limit: int = 10,
-    current_user: dict = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    current_user: dict = Depends(get_current_user_from_claims),
+    db: AsyncSession = Depends(get_db)
 ):
     if not current_user or current_user.get("user_type") == "guest":
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    db = SessionLocal()
-    try:
-        offset = (page - 1) * limit
-        
-        # Get user's chat sessions
-        sessions = db.query(ChatSession).filter(
-            ChatSession.user_id == current_user["user_id"]
-        ).order_by(ChatSession.created_at.desc()).offset(offset).limit(limit).all()
-        
-        result = []
-        for session in sessions:
-            messages = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session.id
-            ).order_by(ChatMessage.created_at.asc()).all()
-            
-            session_data = {
-                "session_id": session.id,
-                "created_at": session.created_at.isoformat(),
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "message": msg.message,
-                        "response": msg.response,
-                        "created_at": msg.created_at.isoformat()
-                    }
-                    for msg in messages
-                ]
-            }
-            result.append(session_data)
-        
-        # Get total count
-        total_sessions = db.query(ChatSession).filter(
-            ChatSession.user_id == current_user["user_id"]
-        ).count()
-        
-        return {
-            "sessions": result,
-            "total": total_sessions,
-            "page": page,
-            "limit": limit,
-            "total_pages": (total_sessions + limit - 1) // limit
+    # Get user's chat sessions
+    sessions, page_info = await paginate_chat_sessions(
+        db, page, limit, cursor, include_total, user_id=current_user["user_id"]
+    )
+    
+    result = []
+    for session in sessions:
+        session_data = {
+            "session_id": session.id,
+            "created_at": session.created_at.isoformat(),
+            "messages": [
+                {
+                    "id": msg.id,
+                    "message": msg.message,
+                    "response": msg.response,
+                    "created_at": msg.created_at.isoformat()
+                }
+                for msg in session.messages
+            ]
         }
-    finally:
-        db.close()
+        result.append(session_data)
+    
+    return FastJSONResponse({"sessions": result, **page_info})
 
 @app.delete("/user/chat-session/{session_id}")
-async def delete_user_chat_session(session_id: int, current_user: dict = Depends(get_current_user)):
+async def delete_user_chat_session(
+    session_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
     if not current_user or current_user.get("user_type") == "guest":
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    db = SessionLocal()
-    try:
-        # Verify session belongs to user
-        session = db.query(ChatSession).filter(
+    # Verify session belongs to user
+    result = await db.execute(
+        select(ChatSession).where(
             ChatSession.id == session_id,
             ChatSession.user_id == current_user["user_id"]
-        ).first()
-        
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        # Delete messages first
-        db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-        
-        # Delete session
-        db.delete(session)
-        db.commit()
-        
-        return {"message": "Chat session deleted successfully"}
-    finally:
-        db.close()
+        )
+    )
+    session = result.scalars().first()
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    # Delete messages first
+    await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
+    
+    # Delete session
+    await db.delete(session)
+    await db.commit()
+    invalidate_active_session(session)
+    
+    return {"message": "Chat session deleted successfully"}
 
 @app.post("/auth/logout")
 async def logout():
@@ -825,114 +510,160 @@ async def logout():
 async def get_chat_history(
     page: int = 1, 
     limit: int = 50,
-    current_user: dict = Depends(get_current_admin_user)
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    current_user: dict = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    db = SessionLocal()
-    try:
-        offset = (page - 1) * limit
-        
-        # Get chat sessions with messages
-        sessions = db.query(ChatSession).order_by(ChatSession.created_at.desc()).offset(offset).limit(limit).all()
-        
-        result = []
-        for session in sessions:
-            messages = db.query(ChatMessage).filter(ChatMessage.session_id == session.id).order_by(ChatMessage.created_at.asc()).all()
-            
-            user_info = "Guest"
-            if session.user:
-                user_info = f"{session.user.full_name} ({session.user.email})"
-            elif session.session_id:
-                user_info = f"Guest ({session.session_id[:8]}...)"
-            
-            session_data = {
-                "session_id": session.id,
-                "user_info": user_info,
-                "created_at": session.created_at.isoformat(),
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "message": msg.message,
-                        "response": msg.response,
-                        "created_at": msg.created_at.isoformat()
-                    }
-                    for msg in messages
-                ]
-            }
-            result.append(session_data)
-        
-        # Get total count
-        total_sessions = db.query(ChatSession).count()
-        
-        return {
-            "sessions": result,
-            "total": total_sessions,
-            "page": page,
-            "limit": limit,
-            "total_pages": (total_sessions + limit - 1) // limit
+    # Get chat sessions with messages
+    sessions, page_info = await paginate_chat_sessions(db, page, limit, cursor, include_total)
+    
+    result = []
+    for session in sessions:
+        user_info = "Guest"
+        if session.user:
+            user_info = f"{session.user.full_name} ({session.user.email})"
+        elif session.session_id:
+            user_info = f"Guest ({session.session_id[:8]}...)"
+        
+        session_data = {
+            "session_id": session.id,
+            "user_info": user_info,
+            "created_at": session.created_at.isoformat(),
+            "messages": [
+                {
+                    "id": msg.id,
+                    "message": msg.message,
+                    "response": msg.response,
+                    "created_at": msg.created_at.isoformat(),
+                    "language": msg.language,
+                    "provider": msg.provider,
+                    "cached": msg.cached,
+                    "input_tokens": msg.input_tokens,
+                    "output_tokens": msg.output_tokens,
+                    "latency_ms": msg.latency_ms
+                }
+                for msg in session.messages
+            ]
         }
-    finally:
-        db.close()
+        result.append(session_data)
+    
+    # Returned as a response so FastAPI skips its jsonable_encoder pass over every message
+    return FastJSONResponse({"sessions": result, **page_info})
+
+@app.get("/admin/search")
+async def search_chat_history(
+    q: str,
+    page: int = 1,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query is required")
+    page = max(page, 1)
+    limit = max(1, min(limit, 100))
+    
+    # One extra row tells us whether another page exists
+    rows = await search_messages(db, q, limit=limit + 1, offset=(page - 1) * limit)
+    has_more = len(rows) > limit
+    
+    results = []
+    for row in rows[:limit]:
+        user_info = "Guest"
+        if row["user_id"]:
+            user_info = f"{row['full_name']} ({row['email']})"
+        elif row["guest_session_id"]:
+            user_info = f"Guest ({row['guest_session_id'][:8]}...)"
+        results.append({
+            "message_id": row["id"],
+            "session_id": row["session_id"],
+            "user_info": user_info,
+            "created_at": row["created_at"].isoformat(),
+            "score": row["score"],
+            "message_snippet": row["message_snippet"],
+            "response_snippet": row["response_snippet"]
+        })
+    
+    return {"query": q, "results": results, "page": page, "limit": limit, "has_more": has_more}
 
 @app.get("/admin/users")
-async def get_users(current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        users = db.query(User).all()
-        return [
-            {
-                "id": user.id,
-                "email": user.email,
-                "full_name": user.full_name,
-                "user_type": user.user_type,
-                "is_active": user.is_active,
-                "created_at": user.created_at.isoformat()
-            }
-            for user in users
-        ]
-    finally:
-        db.close()
+async def get_users(current_user: dict = Depends(get_current_admin_user), db: AsyncSession = Depends(get_db)):
+    users = (await db.execute(select(User))).scalars().all()
+    return FastJSONResponse([
+        {
+            "id": user.id,
+            "email": user.email,
+            "full_name": user.full_name,
+            "user_type": user.user_type,
+            "is_active": user.is_active,
+            "created_at": user.created_at.isoformat()
+        }
+        for user in users
+    ])
+
+@app.post("/admin/users/{user_id}/deactivate")
+async def deactivate_user(user_id: int, current_user: dict = Depends(get_current_admin_user), db: AsyncSession = Depends(get_db)):
+    if user_id == current_user["user_id"]:
+        raise HTTPException(status_code=400, detail="You cannot deactivate your own account")
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    user.is_active = False
+    await db.commit()
+    # Existing tokens stop working on the next request
+    invalidate_principal(user_id)
+    logging.info(f"User {user.email} deactivated by {current_user['email']}")
+    return {"status": "deactivated"}
+
+@app.post("/admin/users/{user_id}/activate")
+async def activate_user(user_id: int, current_user: dict = Depends(get_current_admin_user), db: AsyncSession = Depends(get_db)):
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    user.is_active = True
+    await db.commit()
+    invalidate_principal(user_id)
+    return {"status": "activated"}
 
 @app.delete("/admin/chat-session/{session_id}")
-async def delete_chat_session(session_id: int, current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        # Delete messages first
-        db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
-        
-        # Delete session
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        db.delete(session)
-        db.commit()
-        
-        return {"message": "Chat session deleted successfully"}
-    finally:
-        db.close()
+async def delete_chat_session(
+    session_id: int,
+    current_user: dict = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await db.get(ChatSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    # Delete messages first
+    await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session_id))
+    
+    # Delete session
+    await db.delete(session)
+    await db.commit()
+    invalidate_active_session(session)
+    
+    return {"message": "Chat session deleted successfully"}
 
 @app.post("/feedback")
-async def submit_feedback(request: Request, feedback: FeedbackMessage):
+async def submit_feedback(feedback: FeedbackMessage, db: AsyncSession = Depends(get_db)):
     try:
-        # Rate limiting for feedback
-        client_ip = get_client_ip(request)
-        if not check_rate_limit(client_ip, limit=5, window=3600):  # 5 feedback per hour
-            raise HTTPException(
-                status_code=429, 
-                detail="Too many feedback submissions. Please try again later."
-            )
-        
-        send_feedback_email(
+        # Stored first; the auto-reply and the team digest go out through the email outbox
+        await save_feedback(
+            db,
             name=feedback.name,
             email=feedback.email,
             category=feedback.category,
             subject=feedback.subject,
             message=feedback.message
         )
-        return JSONResponse(status_code=200, content={
+        return {
             "success": True,
             "message": "Feedback sent successfully."
-        })
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -943,22 +674,54 @@ async def submit_feedback(request: Request, feedback: FeedbackMessage):
             "error_type": type(e).__name__
         })
 
+@app.get("/admin/feedback")
+async def get_feedback(
+    page: int = 1,
+    limit: int = 20,
+    category: Optional[str] = None,
+    current_user: dict = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    page = max(page, 1)
+    limit = max(1, min(limit, 100))
+    
+    # One extra row tells us whether another page exists
+    rows = await list_feedback(db, offset=(page - 1) * limit, limit=limit + 1, category=category)
+    return {
+        "feedback": [
+            {
+                "id": item.id,
+                "name": item.name,
+                "email": item.email,
+                "category": item.category,
+                "subject": item.subject,
+                "message": item.message,
+                "created_at": item.created_at.isoformat(),
+                "digested_at": item.digested_at.isoformat() if item.digested_at else None
+            }
+            for item in rows[:limit]
+        ],
+        "page": page,
+        "limit": limit,
+        "has_more": len(rows) > limit
+    }
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return page_cache.response("index.html", request)
 
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return page_cache.response("login.html", request)
 
 @app.get("/register", response_class=HTMLResponse)
 async def register_page(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+    return page_cache.response("register.html", request)
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard_page(request: Request):
     # Remove the admin check here - we'll do it in JavaScript
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return page_cache.response("dashboard.html", request)
 
 # Add this test endpoint for debugging:
 @app.get("/test-admin")  # REMOVE AFTER TESTING
@@ -976,123 +739,158 @@ async def debug_auth(current_user: dict = Depends(get_current_user)):
 
 @app.get("/profile", response_class=HTMLResponse)
 async def profile_page(request: Request):
-    return templates.TemplateResponse("profile.html", {"request": request})
+    return page_cache.response("profile.html", request)
 
 @app.get("/about", response_class=HTMLResponse)
 async def about(request: Request):
-    return templates.TemplateResponse("about.html", {"request": request})
+    return page_cache.response("about.html", request)
 
 @app.get("/contact", response_class=HTMLResponse)
 async def contact(request: Request):
-    return templates.TemplateResponse("contact.html", {"request": request})
+    return page_cache.response("contact.html", request)
 
 # Admin endpoints with additional optimizations
 @app.post("/admin/info/add")
-async def add_info(data: InfoCreate, current_user: dict = Depends(get_current_admin_user)):
-async def add_info(data: InfoCreate, current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        # Clear cache when new info is added
-        clear_cache()
-        
-        db.add(Info(category=data.category, key=data.key, value=data.value))
-        db.commit()
-        return {"status": "success"}
-    finally:
-        db.close()
+async def add_info(data: InfoCreate, current_user: dict = Depends(get_current_admin_user), db: AsyncSession = Depends(get_db)):
+    # Clear cache when new info is added
+    clear_cache()
+    
+    db.add(Info(category=data.category, key=data.key, value=data.value))
+    await db.commit()
+    return {"status": "success"}
+
+@app.post("/admin/info/import")
+async def import_info(file: UploadFile = File(...), current_user: dict = Depends(get_current_admin_user)):
+    if not file.filename.lower().endswith((".csv", ".jsonl", ".ndjson")):
+        raise HTTPException(status_code=400, detail="Upload a .csv or .jsonl file")
+    summary = await import_info_file(await file.read(), file.filename)
+    logging.info(f"Info import by {current_user['email']}: {file.filename}")
+    return summary
 
 @app.get("/admin/info")
-async def list_info(current_user: dict = Depends(get_current_admin_user)):
-async def list_info(current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        results = db.query(Info).all()
-        return [{"id": r.id, "category": r.category, "key": r.key, "value": r.value} for r in results]
-    finally:
-        db.close()
+async def list_info(current_user: dict = Depends(get_current_admin_user), db: AsyncSession = Depends(get_db)):
+    results = (await db.execute(select(Info))).scalars().all()
+    return FastJSONResponse([{"id": r.id, "category": r.category, "key": r.key, "value": r.value} for r in results])
 
 @app.delete("/admin/info/{info_id}")
-async def delete_info(info_id: int, current_user: dict = Depends(get_current_admin_user)):
-async def delete_info(info_id: int, current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        record = db.query(Info).filter(Info.id == info_id).first()
-        if not record:
-            raise HTTPException(status_code=404, detail="Record not found")
-        
-        # Clear cache when info is deleted
-        clear_cache()
-        
-        db.delete(record)
-        db.commit()
-        return {"status": "deleted"}
-    finally:
-        db.close()
+async def delete_info(info_id: int, current_user: dict = Depends(get_current_admin_user), db: AsyncSession = Depends(get_db)):
+    record = await db.get(Info, info_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    
+    # Clear cache when info is deleted
+    clear_cache()
+    
+    await db.delete(record)
+    await db.commit()
+    return {"status": "deleted"}
 
 @app.put("/admin/info/{info_id}")
-async def update_info(info_id: int, data: InfoCreate, current_user: dict = Depends(get_current_admin_user)):
-async def update_info(info_id: int, data: InfoCreate, current_user: dict = Depends(get_current_admin_user)):
-    db = SessionLocal()
-    try:
-        record = db.query(Info).filter(Info.id == info_id).first()
-        if not record:
-            raise HTTPException(status_code=404, detail="Record not found")
-        
-        # Clear cache when info is updated
-        clear_cache()
-        
-        record.category = data.category
-        record.key = data.key
-        record.value = data.value
-        db.commit()
-        
-        return {"status": "updated"}
-    finally:
-        db.close()
+async def update_info(
+    info_id: int,
+    data: InfoCreate,
+    current_user: dict = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    record = await db.get(Info, info_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    
+    # Clear cache when info is updated
+    clear_cache()
+    
+    record.category = data.category
+    record.key = data.key
+    record.value = data.value
+    await db.commit()
+    
+    return {"status": "updated"}
 
 # Admin cache management endpoints
 @app.post("/admin/cache/clear")
-async def clear_cache_endpoint(current_user: dict = Depends(get_current_admin_user)):
 async def clear_cache_endpoint(current_user: dict = Depends(get_current_admin_user)):
     clear_cache()
+    page_cache.clear()
     return {"status": "cache cleared"}
 
 @app.post("/admin/cache/cleanup") 
-async def cleanup_cache_endpoint(current_user: dict = Depends(get_current_admin_user)):
 async def cleanup_cache_endpoint(current_user: dict = Depends(get_current_admin_user)):
     cleanup_cache()
+    cleanup_token_usage()
+    rate_limiter.sweep()
     return {"status": "cache cleanup completed"}
 
-# Periodic cleanup task (run this via cron or scheduler in production)
-@app.get("/admin/stats")
-async def get_stats(current_user: dict = Depends(get_current_admin_user)):
-    return {
-        "rate_limit_entries": len(rate_limit_storage),
-        "total_users": SessionLocal().query(User).count(),
-        "total_chat_sessions": SessionLocal().query(ChatSession).count(),
-        "timestamp": datetime.now()
-    }
-
+@app.post("/admin/retention/run")
+async def run_retention_endpoint(current_user: dict = Depends(get_current_admin_user)):
+    return await run_retention()
+
+@app.get("/admin/archive/{session_id}")
+async def get_archived_session_endpoint(session_id: int, current_user: dict = Depends(get_current_admin_user)):
+    archived = await get_archived_session(session_id)
+    if archived is None:
+        raise HTTPException(status_code=404, detail="Archived session not found")
+    return archived
+
+@app.get("/admin/export")
+async def export_chat_history(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    current_user: dict = Depends(get_current_admin_user)
+):
+    # Rows are streamed straight from a server-side cursor, never held in memory
+    batches = iter_export_batches(start=start, end=end, user_id=user_id)
+    if format == "csv":
+        body, media_type = stream_csv(batches), "text/csv; charset=utf-8"
+    else:
+        body, media_type = stream_ndjson(batches), "application/x-ndjson"
+    
+    filename = f"chat_export_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+    logging.info(f"Chat export started by {current_user['email']}: format={format}, start={start}, end={end}, user_id={user_id}")
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/admin/analytics")
+async def chat_analytics(
+    interval: Literal["hour", "day"] = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    refresh: bool = False,
+    current_user: dict = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        return await get_chat_analytics(db, interval=interval, start=start, end=end, refresh=refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # ... all your existing code ...
+@app.get("/admin/token-usage")
+async def get_token_usage(limit: int = 50, current_user: dict = Depends(get_current_admin_user)):
+    return get_token_usage_summary(limit=limit)
 
+# Periodic cleanup task (run this via cron or scheduler in production)
 @app.get("/admin/stats")
-async def get_stats(current_user: dict = Depends(get_current_admin_user)):
+async def get_stats(refresh: bool = False, current_user: dict = Depends(get_current_admin_user)):
+    # Counters come from the periodic snapshot; pass refresh=true to recompute now
+    snapshot = await refresh_stats_snapshot() if refresh else await get_stats_snapshot()
     return {
-        "rate_limit_entries": len(rate_limit_storage),
-        "total_users": SessionLocal().query(User).count(),
-        "total_chat_sessions": SessionLocal().query(ChatSession).count(),
-        "total_users": SessionLocal().query(User).count(),
-        "total_chat_sessions": SessionLocal().query(ChatSession).count(),
+        **snapshot,
+        "rate_limit_entries": len(rate_limiter),
+        "rate_limiter": get_rate_limit_stats(),
+        "db_pool": get_pool_stats(),
+        "chat_writer": chat_writer.get_stats(),
+        "email_outbox": get_email_stats(),
+        "active_session_cache": active_session_cache.stats(),
+        "page_cache": page_cache.get_stats(),
+        "compression": compression_stats,
+        "guest_store": get_guest_stats(),
         "timestamp": datetime.now()
     }
 
-# ADD THE NEW CODE HERE ↓↓↓
 @app.get("/debug-users")  # REMOVE AFTER USE
-async def debug_users():
-    db = SessionLocal()
+async def debug_users(db: AsyncSession = Depends(get_db)):
     try:
-        users = db.query(User).all()
+        users = (await db.execute(select(User))).scalars().all()
         return {
             "total_users": len(users),
             "users": [
@@ -1108,31 +906,27 @@ async def debug_users():
         }
     except Exception as e:
         return {"error": str(e)}
-    finally:
-        db.close()
 
 @app.get("/create-admin-now")  # CHANGED TO GET - REMOVE AFTER USE
-async def create_admin_now():
-    db = SessionLocal()
+async def create_admin_now(db: AsyncSession = Depends(get_db)):
     try:
         admin_email = "admin@yoursite.com"  # CHANGE THIS
         admin_password = "admin123456"      # CHANGE THIS TO SOMETHING SECURE
         
         # Check if admin exists
-        existing = get_user_by_email(db, admin_email)
+        existing = await get_user_by_email(db, admin_email)
         if existing:
             if existing.user_type == "admin":
                 return {"message": "Admin already exists!", "email": admin_email, "password": admin_password}
             else:
                 # Upgrade existing user to admin
                 existing.user_type = "admin"
-                db.commit()
+                await db.commit()
                 return {"message": "User upgraded to admin!", "email": admin_email}
         
         # Create new admin user
-        from backend.auth import get_password_hash
-        hashed_password = get_password_hash(admin_password)
-        admin_user = create_user(
+        hashed_password = await hash_password(admin_password)
+        admin_user = await create_user(
             db, 
             email=admin_email, 
             hashed_password=hashed_password, 
@@ -1147,6 +941,4 @@ async def create_admin_now():
             "next_step": "Go to /login and use these credentials"
         }
     except Exception as e:
-        return {"error": str(e)}
-    finally:
-        db.close()
\ No newline at end of file
+        return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+from typing import Dict, Optional, Set
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+STATIC_DIR = os.getenv("STATIC_DIR", "/app/frontend/static")
+STATIC_URL = "/static"
+DIST_DIR = "dist"
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".ico", ".json", ".txt", ".html", ".map"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FINGERPRINTED = re.compile(rf"^{DIST_DIR}/.+\.[0-9a-f]{{10}}(\.[^./]+)?$")
+CSS_URL = re.compile(r"""url\(\s*(?:'([^']*)'|"([^"]*)"|([^'")\s]+))\s*\)""")
+
+manifest: Dict[str, str] = {}
+
+
+def _write_atomic(path: str, data: bytes):
+    # Several workers may build at once; each file appears complete or not at all
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def rewrite_css_urls(css: str, relative: str, built: Dict[str, str]) -> str:
+    """Point url() references in the stylesheet at `relative` to their fingerprinted files"""
+    def replace(match):
+        url = next(group for group in match.groups() if group is not None)
+        path, suffix = re.match(r"([^?#]*)(.*)", url).groups()  # keep ?query / #fragment (font hacks)
+        if path.startswith(f"{STATIC_URL}/"):
+            target = path[len(STATIC_URL) + 1:]
+        elif path.startswith(("/", "data:")) or "://" in path:
+            return match.group(0)
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(relative), path))
+        if target not in built:
+            return match.group(0)
+        return f"url('{STATIC_URL}/{built[target]}{suffix}')"
+    return CSS_URL.sub(replace, css)
+
+
+def _fingerprint(static_dir: str, relative: str, content: bytes) -> str:
+    stem, ext = os.path.splitext(relative)
+    hashed = f"{DIST_DIR}/{stem}.{hashlib.sha256(content).hexdigest()[:10]}{ext}"
+    target = os.path.join(static_dir, hashed)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _write_atomic(target, content)
+        if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+            _write_atomic(target + ".gz", gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write_atomic(target + ".br", brotli.compress(content, quality=11))
+    return hashed
+
+
+def build_assets(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    """Fingerprint and precompress static_dir into static_dir/dist; returns the manifest"""
+    global manifest
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    os.makedirs(dist_dir, exist_ok=True)
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            sources.append((os.path.relpath(source, static_dir).replace(os.sep, "/"), source))
+
+    built = {}
+    # Stylesheets last, so the files they reference already have their hashed names
+    for relative, source in sorted(sources, key=lambda item: item[0].lower().endswith(".css")):
+        with open(source, "rb") as f:
+            content = f.read()
+        if relative.lower().endswith(".css"):
+            content = rewrite_css_urls(content.decode("utf-8"), relative, built).encode("utf-8")
+        built[relative] = _fingerprint(static_dir, relative, content)
+    _write_atomic(os.path.join(dist_dir, "manifest.json"), json.dumps(built, indent=2, sort_keys=True).encode())
+    manifest = built
+    logging.info(f"Built {len(built)} static assets")
+    return built
+
+
+def load_manifest(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    global manifest
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    return manifest
+
+
+def asset_url(path: str) -> str:
+    """URL of a static file, fingerprinted when it has been built"""
+    path = path.lstrip("/")
+    return f"{STATIC_URL}/{manifest.get(path, path)}"
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Set[str]:
+    """Content codings the client accepts, ignoring those refused with q=0"""
+    encodings = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = params.strip().lower()
+        if name and not re.fullmatch(r"q=0(\.0*)?", q):
+            encodings.add(name)
+    return encodings
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles with immutable caching and precompressed variants for fingerprinted files"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        fingerprinted = bool(FINGERPRINTED.match(path))
+        response = None
+        if fingerprinted and scope["method"] in ("GET", "HEAD"):
+            response = await self.precompressed_response(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if fingerprinted else "no-cache"
+            if fingerprinted:
+                response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    async def precompressed_response(self, path: str, scope) -> Optional[Response]:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is None:
+                continue
+            response = FileResponse(
+                full_path,
+                stat_result=stat_result,
+                media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                headers={"Content-Encoding": encoding}
+            )
+            if self.is_not_modified(response.headers, request_headers):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for original, hashed in build_assets().items():
+        print(f"{original} -> {hashed}")
@@ -4,8 +4,12 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
-from backend.database import SessionLocal, User, get_user_by_email, get_user_by_id
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import User, get_db, get_user_by_email, get_user_by_id
+from backend.cache import TTLCache
 from pydantic import BaseModel
 
 # Security configuration
@@ -13,9 +17,37 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor; hashes at any other cost are flagged for rehash on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+# Password hashing runs on a small dedicated pool (bcrypt releases the GIL), and at most
+# PASSWORD_HASH_MAX_PENDING operations may be running or queued so a login storm
+# gets 503s instead of starving the event loop and default thread pool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "2.0"))
+
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
 security = HTTPBearer(auto_error=False)
 
+# Resolved principals per user_id -> {token: principal}, so steady-state requests skip the
+# user lookup; invalidate_principal only clears this process's copy
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+principal_cache = TTLCache(maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")), ttl=PRINCIPAL_CACHE_TTL)
+
+# Let read-only endpoints build the principal from the signed token alone; profile
+# changes and deactivation then take effect only when the token expires
+AUTH_TRUST_SIGNED_CLAIMS = os.getenv("AUTH_TRUST_SIGNED_CLAIMS", "false").lower() == "true"
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -31,10 +63,12 @@ class UserCreate(BaseModel):
     email: str
     password: str
     full_name: str
+    guest_state: Optional[str] = None  # Unsaved guest turns to keep, see backend/guest_store.py
 
 class UserLogin(BaseModel):
     email: str
     password: str
+    guest_state: Optional[str] = None
 
 class UserUpdate(BaseModel):
     full_name: Optional[str] = None
@@ -46,6 +80,27 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def run_password_job(func, *args):
+    """Run a bcrypt operation on the password pool, or fail fast with 503 when it is saturated"""
+    try:
+        await asyncio.wait_for(password_slots.acquire(), timeout=PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests. Please try again shortly.",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        password_slots.release()
+
+async def hash_password(password: str) -> str:
+    return await run_password_job(pwd_context.hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_job(pwd_context.verify, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -56,56 +111,108 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(email: str, password: str):
-    db = SessionLocal()
-    try:
-        user = get_user_by_email(db, email)
-        if not user:
-            return False
-        if not verify_password(password, user.hashed_password):
-            return False
-        return user
-    finally:
-        db.close()
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email(db, email)
+    if not user:
+        return False
+    verified, new_hash = await run_password_job(pwd_context.verify_and_update, password, user.hashed_password)
+    if not verified:
+        return False
+    if new_hash:
+        # Stored hash used a different cost factor; upgrade it transparently
+        user.hashed_password = new_hash
+        await db.commit()
+    return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def invalidate_principal(user_id: int):
+    """Drop cached principals for a user after their profile or status changes"""
+    principal_cache.pop(user_id)
+
+def decode_token(credentials: HTTPAuthorizationCredentials) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    if not credentials:
-        return None  # Guest user
-    
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        user_type: str = payload.get("user_type")
-        user_id: int = payload.get("user_id")
-        
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email, user_type=user_type, user_id=user_id)
     except JWTError:
         raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
+
+def read_token_claims(token: str) -> Optional[dict]:
+    """Verified claims of a bearer token without any database lookup; None if invalid"""
+    try:
+        return decode_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    except HTTPException:
+        return None
+
+def get_guest_session_id(credentials: Optional[HTTPAuthorizationCredentials]) -> Optional[str]:
+    """Guest session carried by an optional bearer token; invalid or non-guest tokens give None"""
+    if not credentials:
+        return None
+    try:
+        payload = decode_token(credentials)
+    except HTTPException:
+        return None
+    if payload.get("user_type") != "guest":
+        return None
+    return payload["sub"].replace("guest_", "")
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security),
+                           db: AsyncSession = Depends(get_db)):
+    if not credentials:
+        return None  # Guest user
     
-    if user_type == "guest":
+    payload = decode_token(credentials)
+    email: str = payload.get("sub")
+    if payload.get("user_type") == "guest":
         return {"user_type": "guest", "email": email, "user_id": None}
     
-    db = SessionLocal()
-    try:
-        user = get_user_by_email(db, email=token_data.email)
-        if user is None:
-            raise credentials_exception
-        return {
-            "user_type": user.user_type,
-            "email": user.email,
-            "user_id": user.id,
-            "full_name": user.full_name
-        }
-    finally:
-        db.close()
+    cached = principal_cache.get(payload.get("user_id")) or {}
+    principal = cached.get(credentials.credentials)
+    if principal is not None:
+        return dict(principal)
+    
+    user = await get_user_by_email(db, email=email)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account is deactivated")
+    
+    principal = {
+        "user_type": user.user_type,
+        "email": user.email,
+        "user_id": user.id,
+        "full_name": user.full_name
+    }
+    if payload.get("user_id") == user.id:
+        principal_cache.set(user.id, {**cached, credentials.credentials: principal})
+    return dict(principal)
+
+async def get_current_user_from_claims(credentials: HTTPAuthorizationCredentials = Depends(security),
+                                       db: AsyncSession = Depends(get_db)):
+    """Principal for read-only endpoints; trusts the token claims when AUTH_TRUST_SIGNED_CLAIMS is on"""
+    if not AUTH_TRUST_SIGNED_CLAIMS:
+        return await get_current_user(credentials, db)
+    if not credentials:
+        return None
+    
+    payload = decode_token(credentials)
+    principal = {
+        "user_type": payload.get("user_type"),
+        "email": payload.get("sub"),
+        "user_id": payload.get("user_id")
+    }
+    if payload.get("full_name") is not None:
+        principal["full_name"] = payload["full_name"]
+    return principal
 
 async def get_current_admin_user(current_user: dict = Depends(get_current_user)):
     if not current_user or current_user.get("user_type") != "admin":
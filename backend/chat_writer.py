@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from backend.database import AsyncSessionLocal, ChatMessage
+
+# Write-behind settings for chat message persistence
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "50"))
+CHAT_WRITE_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "2.0"))
+# Journal of turns not yet committed; put it on a persistent volume for it to outlive the pod
+CHAT_WRITE_SPILL_FILE = os.getenv("CHAT_WRITE_SPILL_FILE", "logs/pending_chat_messages.jsonl")
+# Turns held in memory; beyond this they wait in the journal until the queue drains
+CHAT_WRITE_MAX_PENDING = int(os.getenv("CHAT_WRITE_MAX_PENDING", "5000"))
+
+# Optional per-message metadata; every record carries all of them so batches share one column set
+METADATA_FIELDS = ("language", "complexity", "provider", "cached", "estimated_tokens",
+                   "input_tokens", "output_tokens", "latency_ms")
+
+
+class ChatMessageWriter:
+    """Queue completed chat turns and bulk insert them off the request path.
+
+    Every turn is appended to a JSONL journal as it is enqueued, and the
+    journal is cut back once its batch commits, so turns survive a failed
+    flush, a shutdown or a crashed process and are reloaded on the next
+    start (at-least-once: a crash between commit and cut-back replays that
+    batch). At most max_pending turns are kept in memory; the rest are read
+    back from the journal as the queue drains.
+
+    Turns enqueued with an owner ("user", user_id) or ("guest", session_id)
+    whose chat session was deleted meanwhile are handed to resolve_orphan,
+    which returns the session to write them to instead.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, batch_size: int = CHAT_WRITE_BATCH_SIZE,
+                 flush_interval: float = CHAT_WRITE_FLUSH_INTERVAL, spill_file: str = CHAT_WRITE_SPILL_FILE,
+                 max_pending: int = CHAT_WRITE_MAX_PENDING, resolve_orphan=None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+        self.max_pending = max_pending
+        self.resolve_orphan = resolve_orphan
+        self.pending: Deque[Dict] = deque()
+        self.overflow = 0  # journaled turns not loaded into pending yet
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "failed_flushes": 0, "dropped": 0,
+                      "overflowed": 0, "reassigned": 0}
+        self._journal = None
+        # Created in start() so they bind to the running event loop
+        self._wake = None
+        self._flush_lock = None
+        self._task = None
+
+    def enqueue(self, session_id: int, message: str, response: str, message_type: str = "conversation",
+                created_at: Optional[datetime] = None, owner: Optional[Tuple] = None, **fields):
+        record = {
+            "session_id": session_id,
+            "message": message,
+            "response": response,
+            "message_type": message_type,
+            "created_at": created_at or datetime.utcnow(),
+            **{field: fields.get(field) for field in METADATA_FIELDS},
+            "owner": owner
+        }
+        self._open_journal()
+        self._journal.write(_encode(record))
+        self._journal.flush()
+        if self.overflow or len(self.pending) >= self.max_pending:
+            # Keep journal order: once anything overflows, later turns wait behind it
+            self.overflow += 1
+            self.stats["overflowed"] += 1
+        else:
+            self.pending.append(record)
+        self.stats["enqueued"] += 1
+        if self._wake and len(self.pending) + self.overflow >= self.batch_size:
+            self._wake.set()
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._open_journal()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        unsaved = len(self.pending) + self.overflow
+        if unsaved:
+            logging.warning(f"{unsaved} unsaved chat messages left in {self.spill_file}")
+        self._close_journal()
+        self.pending.clear()
+        self.overflow = 0
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write everything queued so far in batches; returns the number of rows written"""
+        written = 0
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        self._open_journal()
+        async with self._flush_lock:
+            done = 0
+            while self.pending:
+                batch = [self.pending[i] for i in range(min(self.batch_size, len(self.pending)))]
+                try:
+                    written += await self._write_batch(batch)
+                except Exception as e:
+                    # Leave the batch queued and retry on the next trigger
+                    self.stats["failed_flushes"] += 1
+                    logging.error(f"Chat message flush failed, {len(self.pending) + self.overflow} pending: {e}")
+                    break
+                for _ in batch:
+                    self.pending.popleft()
+                done += len(batch)
+                if not self.pending and self.overflow:
+                    self._trim_journal(done)
+                    done = 0
+            if done:
+                self._trim_journal(done)
+        return written
+
+    async def _write_batch(self, batch: List[Dict]) -> int:
+        async with self.session_factory() as db:
+            try:
+                await db.execute(insert(ChatMessage), [_row(record) for record in batch])
+                await db.commit()
+                self.stats["batches"] += 1
+                self.stats["written"] += len(batch)
+                return len(batch)
+            except IntegrityError:
+                await db.rollback()
+
+        # A row in the batch is unwritable (e.g. its session was deleted meanwhile);
+        # write the rest one by one, moving orphaned turns to their owner's current session
+        written = 0
+        for record in batch:
+            async with self.session_factory() as db:
+                try:
+                    await db.execute(insert(ChatMessage), [_row(record)])
+                    await db.commit()
+                    written += 1
+                    continue
+                except IntegrityError as e:
+                    await db.rollback()
+                    error = e
+                session_id = None
+                if record.get("owner") and self.resolve_orphan:
+                    session_id = await self.resolve_orphan(db, tuple(record["owner"]))
+                if session_id and session_id != record["session_id"]:
+                    try:
+                        await db.execute(insert(ChatMessage), [{**_row(record), "session_id": session_id}])
+                        await db.commit()
+                        written += 1
+                        self.stats["reassigned"] += 1
+                        continue
+                    except IntegrityError as e:
+                        await db.rollback()
+                        error = e
+                self.stats["dropped"] += 1
+                logging.error(f"Dropping chat message for session {record['session_id']}: {error}")
+        self.stats["batches"] += 1
+        self.stats["written"] += written
+        return written
+
+    def _open_journal(self):
+        """Open the journal for appending, first queueing whatever a previous run left in it"""
+        if self._journal is not None:
+            return
+        os.makedirs(os.path.dirname(self.spill_file) or ".", exist_ok=True)
+        if os.path.exists(self.spill_file):
+            with open(self.spill_file, encoding="utf-8") as f:
+                # A line cut short by a crash was never acknowledged; drop it
+                records = [line for line in f if line.endswith("\n") and line.strip()]
+            self._load(records)
+            self._rewrite_journal(records)
+            if records:
+                logging.info(f"Reloaded {len(records)} unsaved chat messages from {self.spill_file}")
+        else:
+            self._journal = open(self.spill_file, "a", encoding="utf-8")
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _load(self, lines: List[str]):
+        room = max(self.max_pending - len(self.pending), 0)
+        for line in lines[:room]:
+            record = {**dict.fromkeys(METADATA_FIELDS), "owner": None, **json.loads(line)}
+            record["created_at"] = datetime.fromisoformat(record["created_at"])
+            self.pending.append(record)
+        self.overflow += max(len(lines) - room, 0)
+
+    def _trim_journal(self, done: int):
+        """Cut the first `done` committed turns from the journal and refill the queue from it"""
+        if not self.pending and not self.overflow:
+            self._journal.truncate(0)
+            return
+        with open(self.spill_file, encoding="utf-8") as f:
+            remaining = [line for line in f if line.strip()][done:]
+        self._rewrite_journal(remaining)
+        if not self.pending:
+            self.overflow = 0
+            self._load(remaining)
+
+    def _rewrite_journal(self, lines: List[str]):
+        tmp_path = f"{self.spill_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        self._close_journal()
+        os.replace(tmp_path, self.spill_file)
+        self._journal = open(self.spill_file, "a", encoding="utf-8")
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "pending": len(self.pending), "journaled_only": self.overflow}
+
+
+def _row(record: Dict) -> Dict:
+    return {key: value for key, value in record.items() if key != "owner"}
+
+
+def _encode(record: Dict) -> str:
+    return json.dumps({**record, "created_at": record["created_at"].isoformat()}, ensure_ascii=False) + "\n"
+
+
+chat_writer = ChatMessageWriter()
@@ -20,6 +20,10 @@ def get_api_key():
 
 client = OpenAI(api_key=get_api_key())
 def ask_openai(prompt: str) -> str:
+	return ask_openai_with_usage(prompt)[0]
+
+def ask_openai_with_usage(prompt: str):
+	"""Answer plus token counts, so the fallback is charged against the caller's budget"""
 
 
 	system_message = (
@@ -40,4 +44,8 @@ def ask_openai(prompt: str) -> str:
 	    ]
 	)
 
-	return response.choices[0].message.content.strip()
+	usage = {
+		"input_tokens": response.usage.prompt_tokens if response.usage else 0,
+		"output_tokens": response.usage.completion_tokens if response.usage else 0
+	}
+	return response.choices[0].message.content.strip(), usage
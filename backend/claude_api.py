@@ -1,8 +1,9 @@
-from anthropic import Anthropic, APIError, RateLimitError
+from anthropic import AsyncAnthropic, APIError, RateLimitError
 from openai import OpenAI, OpenAIError
 from dotenv import load_dotenv
-import os, logging, hashlib, json
-from backend.database import SessionLocal, Info
+from sqlalchemy import select
+import os, logging, hashlib, json, asyncio
+from backend.database import AsyncSessionLocal, Info
 import numpy as np
 from functools import lru_cache
 from typing import List, Tuple, Optional
@@ -12,7 +13,7 @@ load_dotenv()
 
 logging.basicConfig(filename="logs/chat_logs.txt", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+anthropic_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Language-aware base prompts
@@ -27,6 +28,7 @@ BASE_PROMPT_SIMPLE_KU = """یاریدەدەر بۆ زانکۆی سلێمانی.
 # Simple in-memory cache for responses (use Redis in production)
 response_cache = {}
 embedding_cache = {}
+response_cache_stats = {"hits": 0, "misses": 0}
 
 def detect_language(text: str) -> str:
     """Detect if text is primarily Kurdish or English"""
@@ -87,6 +89,23 @@ def embed_text_cached(text: str) -> Tuple[float, ...]:
         logging.error(f"Embedding error: {e}")
         return tuple()
 
+def embed_texts_batch(texts: List[str], batch_size: int = 100) -> int:
+    """Embed texts missing from the cache with one API call per batch; returns how many were embedded"""
+    pending = list({get_cache_key(text): text for text in texts if get_cache_key(text) not in embedding_cache}.values())
+    embedded = 0
+    for i in range(0, len(pending), batch_size):
+        chunk = pending[i:i + batch_size]
+        try:
+            resp = openai_client.embeddings.create(model="text-embedding-3-small", input=chunk)
+        except OpenAIError as e:
+            # Anything left unembedded is picked up lazily at query time
+            logging.error(f"Batch embedding error: {e}")
+            continue
+        for text, item in zip(chunk, resp.data):
+            embedding_cache[get_cache_key(text)] = item.embedding
+        embedded += len(chunk)
+    return embedded
+
 def cosine_similarity(a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
     """Optimized cosine similarity"""
     if not a or not b:
@@ -111,57 +130,61 @@ def preprocess_query(query: str, language: str) -> str:
         words = [w for w in query.split() if w not in kurdish_particles]
         return ' '.join(words) if words else query
 
-def fetch_relevant_info(user_message: str, language: str, complexity: str = "medium") -> List[str]:
+async def fetch_relevant_info(user_message: str, language: str, complexity: str = "medium") -> List[str]:
     """Fetch relevant info with language and complexity awareness"""
-    db = SessionLocal()
-    try:
-        # Adjust parameters based on complexity and language
-        if complexity == "simple":
-            max_records, char_limit = 1, 60 if language == "ku" else 100
-        elif complexity == "detailed":
-            max_records, char_limit = 4, 700 if language == "ku" else 500
-        else:  # medium
-            max_records, char_limit = 2, 500 if language == "ku" else 500
-        
-        processed_query = preprocess_query(user_message, language)
-        query_embedding = embed_text_cached(processed_query)
-        
-        if not query_embedding:
-            return []
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Info))
+        all_entries = result.scalars().all()
+    
+    # Embedding lookups and scoring are blocking, keep them off the event loop
+    return await asyncio.to_thread(score_relevant_info, all_entries, user_message, language, complexity)
 
-        all_entries = db.query(Info).all()
-        scored = []
+def score_relevant_info(all_entries: List[Info], user_message: str, language: str, complexity: str) -> List[str]:
+    """Rank Info records against the query by embedding similarity"""
+    # Adjust parameters based on complexity and language
+    if complexity == "simple":
+        max_records, char_limit = 1, 60 if language == "ku" else 100
+    elif complexity == "detailed":
+        max_records, char_limit = 4, 700 if language == "ku" else 500
+    else:  # medium
+        max_records, char_limit = 2, 500 if language == "ku" else 500
+    
+    processed_query = preprocess_query(user_message, language)
+    query_embedding = embed_text_cached(processed_query)
+    
+    if not query_embedding:
+        return []
+
+    scored = []
 
-        for rec in all_entries:
-            text = f"{rec.key}: {rec.value}"
-            text_embedding = embed_text_cached(text)
+    for rec in all_entries:
+        text = f"{rec.key}: {rec.value}"
+        text_embedding = embed_text_cached(text)
+        
+        if text_embedding:
+            similarity = cosine_similarity(text_embedding, query_embedding)
+            # Adjust threshold for different languages
+            threshold = 0.15 if language == "ku" else 0.2
             
-            if text_embedding:
-                similarity = cosine_similarity(text_embedding, query_embedding)
-                # Adjust threshold for different languages
-                threshold = 0.15 if language == "ku" else 0.2
-                
-                if complexity == "detailed":
-                    threshold *= 0.8  # Lower threshold for detailed queries
-                
-                if similarity > threshold:
-                    # Language-aware truncation
-                    if len(rec.value) > char_limit:
-                        if language == "ku":
-                            # For Kurdish, truncate at word boundaries
-                            words = rec.value[:char_limit].split()
-                            truncated_value = ' '.join(words[:-1]) + "..."
-                        else:
-                            truncated_value = rec.value[:char_limit] + "..."
+            if complexity == "detailed":
+                threshold *= 0.8  # Lower threshold for detailed queries
+            
+            if similarity > threshold:
+                # Language-aware truncation
+                if len(rec.value) > char_limit:
+                    if language == "ku":
+                        # For Kurdish, truncate at word boundaries
+                        words = rec.value[:char_limit].split()
+                        truncated_value = ' '.join(words[:-1]) + "..."
                     else:
-                        truncated_value = rec.value
-                    
-                    scored.append((similarity, f"• {rec.key}: {truncated_value}"))
+                        truncated_value = rec.value[:char_limit] + "..."
+                else:
+                    truncated_value = rec.value
+                
+                scored.append((similarity, f"• {rec.key}: {truncated_value}"))
 
-        scored.sort(reverse=True, key=lambda x: x[0])
-        return [entry for _, entry in scored[:max_records]]
-    finally:
-        db.close()
+    scored.sort(reverse=True, key=lambda x: x[0])
+    return [entry for _, entry in scored[:max_records]]
 
 def classify_query_complexity(query: str, language: str) -> str:
     """Classify query complexity with language awareness"""
@@ -239,18 +262,28 @@ def create_adaptive_system_prompt(context_lines: List[str], language: str, compl
     
     return f"{base_prompt}{instruction}\n{context}"
 
-def ask_claude(prompt: str) -> str:
+async def ask_claude(prompt: str) -> str:
     """Language-aware Claude API call with optimized token management"""
+    answer, _ = await ask_claude_with_usage(prompt)
+    return answer
+
+async def ask_claude_with_usage(prompt: str) -> Tuple[str, dict]:
+    """Same as ask_claude, but also returns the token usage reported by the API"""
     try:
+        # Detect language and classify complexity
+        language = detect_language(prompt)
+        complexity = classify_query_complexity(prompt, language)
+        
         # Check cache first
         cache_key = get_cache_key(prompt)
         if cache_key in response_cache:
+            response_cache_stats["hits"] += 1
             logging.info(f"Cache hit for query: {prompt[:50]}...")
-            return response_cache[cache_key]
-
-        # Detect language and classify complexity
-        language = detect_language(prompt)
-        complexity = classify_query_complexity(prompt, language)
+            return response_cache[cache_key], {
+                "input_tokens": 0, "output_tokens": 0, "cached": True,
+                "language": language, "complexity": complexity, "estimated_tokens": 0
+            }
+        response_cache_stats["misses"] += 1
         
         # Get language-appropriate limits
         token_config = get_adaptive_token_limits(language, complexity)
@@ -260,7 +293,7 @@ def ask_claude(prompt: str) -> str:
             context_lines = []
             system_prompt = BASE_PROMPT_SIMPLE_KU if language == "ku" else BASE_PROMPT_SIMPLE_EN
         else:
-            context_lines = fetch_relevant_info(prompt, language, complexity)
+            context_lines = await fetch_relevant_info(prompt, language, complexity)
             system_prompt = create_adaptive_system_prompt(context_lines, language, complexity)
 
         # Estimate total prompt tokens with safety margin
@@ -279,7 +312,7 @@ def ask_claude(prompt: str) -> str:
             logging.warning(f"Large prompt detected ({estimated_prompt_tokens} tokens), reducing output to {max_output_tokens}")
 
         # API call with language-aware parameters
-        response = anthropic_client.messages.create(
+        response = await anthropic_client.messages.create(
             model="claude-3-5-haiku-20241022",
             max_tokens=max_output_tokens,
             temperature=token_config["temperature"],
@@ -297,7 +330,10 @@ def ask_claude(prompt: str) -> str:
         output_tokens = response.usage.output_tokens if hasattr(response, 'usage') else 0
         logging.info(f"Language: {language}, Complexity: {complexity}, Estimated: {estimated_prompt_tokens}, Actual - Input: {input_tokens}, Output: {output_tokens}")
         
-        return answer
+        return answer, {
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "cached": False,
+            "language": language, "complexity": complexity, "estimated_tokens": int(estimated_prompt_tokens)
+        }
         
     except (RateLimitError, APIError) as e:
         logging.error(f"Claude API error: {e}")
@@ -318,4 +354,15 @@ def cleanup_cache():
         keys_to_remove = list(response_cache.keys())[:-500]
         for key in keys_to_remove:
             del response_cache[key]
-        logging.info("Cache cleanup completed")
\ No newline at end of file
+        logging.info("Cache cleanup completed")
+
+def get_cache_stats() -> dict:
+    """Response and embedding cache sizes and hit rate"""
+    lookups = response_cache_stats["hits"] + response_cache_stats["misses"]
+    return {
+        "response_cache_size": len(response_cache),
+        "embedding_cache_size": len(embedding_cache),
+        "response_cache_hits": response_cache_stats["hits"],
+        "response_cache_misses": response_cache_stats["misses"],
+        "response_cache_hit_rate": round(response_cache_stats["hits"] / lookups, 4) if lookups else 0.0
+    }
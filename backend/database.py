@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text
-from sqlalchemy import DateTime, Boolean, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, String, Text
+from sqlalchemy import DateTime, Boolean, ForeignKey, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, selectinload, joinedload
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import select, tuple_
 import os
 from datetime import datetime
 from dotenv import load_dotenv
@@ -10,16 +12,88 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, echo=False)
+# Connection pool sizing (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def get_engine_options(url: str) -> dict:
+    """Pool settings for the engine; SQLite manages its own connections"""
+    options = {"echo": False, "pool_pre_ping": True}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE
+        )
+    return options
+
+def get_async_database_url(url: str) -> str:
+    """Map the configured URL onto its async driver (asyncpg for Postgres, aiosqlite for SQLite)"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+# Sync engine for startup schema setup and maintenance scripts
+engine = create_engine(DATABASE_URL, **get_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for request handlers, so queries don't block the event loop
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **get_engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# Pool checkout metrics, exposed through /admin/stats
+pool_metrics = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_metrics["connects"] += 1
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_metrics["checkouts"] += 1
+
+@event.listens_for(async_engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_metrics["checkins"] += 1
+
+@event.listens_for(async_engine.sync_engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_metrics["invalidations"] += 1
+
+def get_pool_stats() -> dict:
+    """Current pool occupancy plus lifetime checkout counters"""
+    pool = async_engine.pool
+    stats = dict(pool_metrics)
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    stats["status"] = pool.status()
+    return stats
+
+async def get_db():
+    """Request-scoped session dependency: one session per request, always closed"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 class Info(Base):
     __tablename__ = "info"
     id = Column(Integer, primary_key=True, index=True)
     category = Column(String(255), index=True)
     key = Column(String(255), index=True)
     value = Column(Text)
+    
+    # Upsert lookups during bulk import
+    __table_args__ = (
+        Index("ix_info_category_key", "category", "key"),
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -41,20 +115,30 @@ class ChatSession(Base):
     session_id = Column(String(255), index=True)  # For guest users
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Latest-session-per-user lookup and keyset paging of history
+    __table_args__ = (
+        Index("ix_chat_sessions_user_id_created_at", "user_id", "created_at"),
+        Index("ix_chat_sessions_created_at_id", "created_at", "id"),
+    )
+    
     # Relationship
     user = relationship("User", back_populates="chat_sessions")
-    messages = relationship("ChatMessage", back_populates="session")
+    messages = relationship("ChatMessage", back_populates="session", order_by="ChatMessage.created_at")
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all only builds missing tables; existing databases get schema changes from migrations
+    from backend.migrations import run_migrations
+    run_migrations(engine)
 
 # User helper functions
-def get_user_by_email(db, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(db, email: str):
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
-def get_user_by_id(db, user_id: int):
-    return db.query(User).filter(User.id == user_id).first()
+async def get_user_by_id(db, user_id: int):
+    return await db.get(User, user_id)
 
-def create_user(db, email: str, hashed_password: str, full_name: str, user_type: str = "user"):
+async def create_user(db, email: str, hashed_password: str, full_name: str, user_type: str = "user"):
     db_user = User(
         email=email,
         hashed_password=hashed_password,
@@ -62,19 +146,19 @@ def create_user(db, email: str, hashed_password: str, full_name: str, user_type:
         user_type=user_type
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def create_admin_user_if_not_exists(db):
+async def create_admin_user_if_not_exists(db):
     """Create default admin user if it doesn't exist"""
     admin_email = "admin@uos.edu.krd"
-    existing_admin = get_user_by_email(db, admin_email)
+    existing_admin = await get_user_by_email(db, admin_email)
     
     if not existing_admin:
-        from backend.auth import get_password_hash
-        hashed_password = get_password_hash("UOS_Admin_2024!")
-        admin_user = create_user(
+        from backend.auth import hash_password
+        hashed_password = await hash_password("UOS_Admin_2024!")
+        admin_user = await create_user(
             db,
             email=admin_email,
             hashed_password=hashed_password,
@@ -84,18 +168,18 @@ def create_admin_user_if_not_exists(db):
         return admin_user
     elif existing_admin.user_type != "admin":
         existing_admin.user_type = "admin"
-        db.commit()
+        await db.commit()
         return existing_admin
     return existing_admin
 
-def create_chat_session(db, user_id: int = None, session_id: str = None):
-    db_session = ChatSession(user_id=user_id, session_id=session_id)
+async def create_chat_session(db, user_id: int = None, session_id: str = None, created_at: datetime = None):
+    db_session = ChatSession(user_id=user_id, session_id=session_id, created_at=created_at or datetime.utcnow())
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    await db.commit()
+    await db.refresh(db_session)
     return db_session
 
-def create_chat_message(db, session_id: int, message: str, response: str, message_type: str):
+async def create_chat_message(db, session_id: int, message: str, response: str, message_type: str):
     db_message = ChatMessage(
         session_id=session_id,
         message=message,
@@ -103,10 +187,29 @@ def create_chat_message(db, session_id: int, message: str, response: str, messag
         message_type=message_type
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await db.commit()
+    await db.refresh(db_message)
     return db_message
 
+async def get_chat_sessions_page(db, user_id: int = None, offset: int = 0, limit: int = 50, after: tuple = None):
+    """Page of chat sessions, newest first, with users and messages loaded in a fixed number of queries.
+
+    Pass after=(created_at, id) of the previous page's last row for keyset paging;
+    offset is only kept for old page-number clients.
+    """
+    query = select(ChatSession).options(
+        joinedload(ChatSession.user),
+        selectinload(ChatSession.messages)
+    ).order_by(ChatSession.created_at.desc(), ChatSession.id.desc())
+    if user_id is not None:
+        query = query.where(ChatSession.user_id == user_id)
+    if after is not None:
+        query = query.where(tuple_(ChatSession.created_at, ChatSession.id) < tuple_(*after))
+    elif offset:
+        query = query.offset(offset)
+    result = await db.execute(query.limit(limit))
+    return result.scalars().unique().all()
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
     id = Column(Integer, primary_key=True, index=True)
@@ -114,7 +217,84 @@ class ChatMessage(Base):
     message = Column(Text)
     response = Column(Text)
     message_type = Column(String(50))  # user, assistant
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    # Per-answer metadata for latency, cost and cache analysis
+    language = Column(String(8), nullable=True)  # en, ku
+    complexity = Column(String(16), nullable=True)  # simple, medium, detailed
+    provider = Column(String(32), nullable=True)  # claude, openai
+    cached = Column(Boolean, nullable=True)
+    estimated_tokens = Column(Integer, nullable=True)
+    input_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    latency_ms = Column(Integer, nullable=True)
+    
+    # Message history per session, oldest first
+    __table_args__ = (
+        Index("ix_chat_messages_session_id_created_at", "session_id", "created_at"),
+    )
     
     # Relationship
     session = relationship("ChatSession", back_populates="messages")
+
+class StatsSnapshot(Base):
+    """Periodically refreshed counters behind /admin/stats"""
+    __tablename__ = "stats_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    total_users = Column(Integer, default=0)
+    total_chat_sessions = Column(Integer, default=0)
+    guest_chat_sessions = Column(Integer, default=0)
+    total_messages = Column(Integer, default=0)
+    messages_last_24h = Column(Integer, default=0)
+    active_users_last_24h = Column(Integer, default=0)
+    cache_stats = Column(Text)  # JSON
+
+class ChatArchive(Base):
+    """Sessions moved out of the hot tables by the retention job, one row per session"""
+    __tablename__ = "chat_archive"
+    # Partitioned by month on PostgreSQL, so the partition key is part of the primary key
+    session_id = Column(Integer, primary_key=True)  # original chat_sessions.id
+    session_created_at = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, index=True, nullable=True)
+    guest_session_id = Column(String(255), nullable=True)
+    message_count = Column(Integer, default=0)
+    payload = Column(LargeBinary)  # zlib-compressed JSON list of messages
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_chat_archive_session_created_at", "session_created_at"),
+        {"postgresql_partition_by": "RANGE (session_created_at)"},
+    )
+
+class EmailOutbox(Base):
+    """Outgoing mail, delivered in the background by backend.email_outbox"""
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    sender = Column(String(255))  # envelope sender
+    recipient = Column(String(255))
+    subject = Column(String(500))
+    body = Column(Text)  # complete MIME message
+    status = Column(String(16), default="pending")  # pending, sent, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    # The worker polls for due pending mail
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+class Feedback(Base):
+    """Contact form submissions; the team hears about them in periodic digests"""
+    __tablename__ = "feedback"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255))
+    email = Column(String(255))
+    category = Column(String(32), index=True)  # feedback, suggestion, bug, feature, other
+    subject = Column(String(500))
+    message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    digested_at = Column(DateTime, nullable=True, index=True)  # set once included in a team digest
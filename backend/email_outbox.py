@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import Message
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import AsyncSessionLocal, EmailOutbox
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))
+# Close the connection after this long without mail rather than let the server time it out
+SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+SENDER_EMAIL = os.getenv("SENDER_EMAIL", "hawaall.assistant@gmail.com")
+SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+
+EMAIL_SEND_INTERVAL = float(os.getenv("EMAIL_SEND_INTERVAL", "1"))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "30"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_RETRY_BASE = int(os.getenv("EMAIL_RETRY_BASE", "60"))
+EMAIL_RETRY_MAX = int(os.getenv("EMAIL_RETRY_MAX", "3600"))
+# A claimed row becomes due again after this long, in case its worker died mid-send
+EMAIL_CLAIM_TIMEOUT = int(os.getenv("EMAIL_CLAIM_TIMEOUT", "300"))
+
+email_stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0}
+_worker_task = None
+_wakeup: Optional[asyncio.Event] = None
+
+
+class SMTPConnection:
+    """One SMTP session reused across sends"""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, starttls: bool = SMTP_STARTTLS,
+                 username: str = SENDER_EMAIL, password: Optional[str] = SENDER_PASSWORD,
+                 idle_timeout: float = SMTP_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.stats = {"connects": 0}
+
+    def _open(self) -> smtplib.SMTP:
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            try:
+                if self.starttls:
+                    server.starttls()
+                if self.password:
+                    server.login(self.username, self.password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+            self.stats["connects"] += 1
+        return self._server
+
+    def send(self, sender: str, recipient: str, message: str):
+        self.close_if_idle()
+        try:
+            self._open().sendmail(sender, [recipient], message.encode("utf-8"))
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server dropped the session since the last send; reconnect once
+            self.close()
+            self._open().sendmail(sender, [recipient], message.encode("utf-8"))
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            raise  # Rejected message; the session itself is still usable
+        except Exception:
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
+
+
+smtp_connection = SMTPConnection()
+
+
+async def enqueue_emails(db: AsyncSession, messages: Iterable[Tuple[str, str, Message]]):
+    """Store (envelope sender, recipient, message) tuples for delivery and wake the worker"""
+    rows = [
+        EmailOutbox(sender=sender, recipient=recipient, subject=str(message["Subject"] or ""),
+                    body=message.as_string())
+        for sender, recipient, message in messages
+    ]
+    db.add_all(rows)
+    await db.commit()
+    email_stats["queued"] += len(rows)
+    if _wakeup is not None:
+        _wakeup.set()
+    return rows
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(EMAIL_RETRY_BASE * 2 ** (attempts - 1), EMAIL_RETRY_MAX))
+
+
+async def claim_due_emails(db: AsyncSession, limit: int = EMAIL_BATCH_SIZE) -> List[EmailOutbox]:
+    """Due pending rows, each pushed into the future so no other worker picks it up meanwhile"""
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(EmailOutbox)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+    )
+    claimed = []
+    for row in result.scalars().all():
+        claim = await db.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == row.id, EmailOutbox.next_attempt_at == row.next_attempt_at)
+            .values(next_attempt_at=now + timedelta(seconds=EMAIL_CLAIM_TIMEOUT))
+            .execution_options(synchronize_session=False)
+        )
+        if claim.rowcount:
+            claimed.append(row)
+    await db.commit()
+    return claimed
+
+
+async def deliver_due_emails(connection: SMTPConnection = None, session_factory=None) -> int:
+    """Send one batch of due mail; returns how many rows were attempted"""
+    connection = connection or smtp_connection
+    async with (session_factory or AsyncSessionLocal)() as db:
+        claimed = await claim_due_emails(db)
+        for index, row in enumerate(claimed):
+            if index:
+                await asyncio.sleep(EMAIL_SEND_INTERVAL)
+            row.attempts = (row.attempts or 0) + 1
+            try:
+                await asyncio.to_thread(connection.send, row.sender, row.recipient, row.body)
+            except Exception as e:
+                row.last_error = f"{type(e).__name__}: {e}"
+                if row.attempts >= EMAIL_MAX_ATTEMPTS:
+                    row.status = "failed"
+                    email_stats["failed"] += 1
+                    logging.error(f"Giving up on email {row.id} to {row.recipient}: {row.last_error}")
+                else:
+                    row.next_attempt_at = datetime.utcnow() + retry_delay(row.attempts)
+                    email_stats["retried"] += 1
+                    logging.warning(f"Email {row.id} to {row.recipient} failed, retrying later: {row.last_error}")
+            else:
+                row.status = "sent"
+                row.sent_at = datetime.utcnow()
+                row.last_error = None
+                email_stats["sent"] += 1
+            await db.commit()
+    return len(claimed)
+
+
+async def _delivery_loop():
+    while True:
+        try:
+            while await deliver_due_emails() == EMAIL_BATCH_SIZE:
+                pass
+        except Exception as e:
+            logging.error(f"Email delivery failed: {e}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=EMAIL_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(smtp_connection.close_if_idle)
+        _wakeup.clear()
+
+
+def start_email_worker():
+    global _worker_task, _wakeup
+    _wakeup = asyncio.Event()
+    _worker_task = asyncio.create_task(_delivery_loop())
+
+
+async def stop_email_worker():
+    global _worker_task, _wakeup
+    if _worker_task:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+        _wakeup = None
+    await asyncio.to_thread(smtp_connection.close)
+
+
+def get_email_stats() -> dict:
+    return {**email_stats, "smtp_connects": smtp_connection.stats["connects"]}
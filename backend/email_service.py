@@ -1,66 +1,26 @@
-import smtplib #Its a Library for sending emails through email servers
 import os
-import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-import logging
+from typing import List, Optional
 
-def send_feedback_email(name: str, email: str, category: str, subject: str, message: str):
+FEEDBACK_RECIPIENT = os.getenv("FEEDBACK_RECIPIENT", "hawaall.assistant@gmail.com")
 
-    """
-    Send feedback email to hawaall.assistant@gmail.com AND send auto-reply to user
+def format_feedback_entry(name: str, user_email: str, category: str, subject: str, message: str,
+                          submitted_at: Optional[datetime] = None):
+    """One feedback submission as it appears in team notifications"""
+    return f"""Name: {name}
+Email: {user_email}
+Category: {category.title()}
+Subject: {subject}
 
-    """
-    try:
-        #Email configuration
-        sender_email = os.getenv("SENDER_EMAIL", "hawaall.assistant@gmail.com")
-        sender_password = os.getenv("SENDER_PASSWORD")
-        recipient_email = "hawaall.assistant@gmail.com"
-        
-        if not sender_password:
-            error_msg = "Email password not configured - SENDER_PASSWORD environment variable is missing"
-            logging.error(error_msg)
-            raise Exception(error_msg) # stops the function and reports the error
-        
-        #Connect to Gmail SMTP server once
-        logging.info("Connecting to Gmail SMTP server...")
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password) #signs into the email account
-        
-        # 1.Send feedback to team
-        team_msg = create_team_notification(sender_email, recipient_email, name, email, category, subject, message)
-        server.sendmail(sender_email, recipient_email, team_msg.as_string()) #sends the emai
-        logging.info(f"Team notification sent for feedback from {email}")
-        
-        #Small delay to avoid rate limiting
-        time.sleep(1)
-        
-        #2. Send auto-reply to user
-        user_msg = create_user_auto_reply(sender_email, email, name, category, subject)
-        server.sendmail(sender_email, email, user_msg.as_string())
-        logging.info(f"Auto-reply sent to {email}")
-        
-        #Close connection
-        server.quit()
-        
-        logging.info(f"Both emails sent successfully for feedback from {email}")
-        return True
-        
-    except Exception as e:
-        error_details = str(e)
-        logging.error(f"Failed to send feedback emails: {error_details}")
-        
-        # Log specific error types
-        if "Authentication failed" in error_details:
-            logging.error("Gmail authentication failed - check SENDER_PASSWORD is correct app password")
-        elif "SENDER_PASSWORD" in error_details:
-            logging.error("Environment variable SENDER_PASSWORD is not set")
-        
-        raise e
-
-def create_team_notification(sender_email: str, recipient_email: str, name: str, user_email: str, category: str, subject: str, message: str):
+Message:
+{message}
+
+Submitted on: {(submitted_at or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')}"""
+
+def create_team_notification(sender_email: str, recipient_email: str, name: str, user_email: str, category: str, subject: str, message: str,
+                             submitted_at: Optional[datetime] = None):
     """Create the notification email for the team"""
     msg = MIMEMultipart()
     msg['From'] = sender_email
@@ -70,16 +30,33 @@ def create_team_notification(sender_email: str, recipient_email: str, name: str,
     body = f"""
 New feedback received from Haawall contact form:
 
-Name: {name}
-Email: {user_email}
-Category: {category.title()}
-Subject: {subject}
+{format_feedback_entry(name, user_email, category, subject, message, submitted_at)}
 
-Message:
-{message}
+---
+Source: Haawall Contact Form
+Auto-reply sent: Yes
+    """
+    
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+def create_team_digest(sender_email: str, recipient_email: str, entries: List[dict]):
+    """Create one notification email covering several submissions; entries hold format_feedback_entry's arguments"""
+    if len(entries) == 1:
+        return create_team_notification(sender_email, recipient_email, **entries[0])
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = recipient_email
+    categories = ", ".join(sorted({entry["category"].title() for entry in entries}))
+    msg['Subject'] = f"Haawall Feedback - {len(entries)} new submissions ({categories})"
+    
+    separator = "\n\n" + "=" * 40 + "\n\n"
+    body = f"""
+{len(entries)} new feedback submissions from Haawall contact form:
+
+{separator.join(format_feedback_entry(**entry) for entry in entries)}
 
 ---
-Submitted on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 Source: Haawall Contact Form
 Auto-reply sent: Yes
     """
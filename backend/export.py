@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import select
+
+from backend.database import AsyncSessionLocal, User, ChatSession, ChatMessage
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_COLUMNS = [
+    ChatMessage.id.label("message_id"),
+    ChatMessage.session_id,
+    ChatSession.user_id,
+    User.email.label("user_email"),
+    ChatSession.session_id.label("guest_session_id"),
+    ChatSession.created_at.label("session_created_at"),
+    ChatMessage.message_type,
+    ChatMessage.message,
+    ChatMessage.response,
+    ChatMessage.created_at,
+    ChatMessage.language,
+    ChatMessage.complexity,
+    ChatMessage.provider,
+    ChatMessage.cached,
+    ChatMessage.estimated_tokens,
+    ChatMessage.input_tokens,
+    ChatMessage.output_tokens,
+    ChatMessage.latency_ms,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+# Text cells starting with these are evaluated as formulas by spreadsheet apps
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def build_export_query(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       user_id: Optional[int] = None):
+    query = (
+        select(*EXPORT_COLUMNS)
+        .join(ChatSession, ChatMessage.session_id == ChatSession.id)
+        .outerjoin(User, ChatSession.user_id == User.id)
+        .order_by(ChatMessage.created_at, ChatMessage.id)
+    )
+    if start is not None:
+        query = query.where(ChatMessage.created_at >= start)
+    if end is not None:
+        query = query.where(ChatMessage.created_at < end)
+    if user_id is not None:
+        query = query.where(ChatSession.user_id == user_id)
+    return query
+
+
+async def iter_export_batches(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                              user_id: Optional[int] = None) -> AsyncIterator[List[Dict]]:
+    """Yield matching messages in batches from a server-side cursor.
+
+    Opens its own session because the response body is produced after the
+    endpoint returns.
+    """
+    query = build_export_query(start, end, user_id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return _serialize(value)
+
+
+async def stream_ndjson(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[str]:
+    async for batch in batches:
+        yield "".join(
+            json.dumps({key: _serialize(value) for key, value in row.items()}, ensure_ascii=False) + "\n"
+            for row in batch
+        )
+
+
+async def stream_csv(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    async for batch in batches:
+        writer.writerows({key: _csv_cell(value) for key, value in row.items()} for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue()
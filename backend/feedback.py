@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import AsyncSessionLocal, Feedback
+from backend.email_outbox import SENDER_EMAIL, enqueue_emails
+from backend.email_service import FEEDBACK_RECIPIENT, create_team_digest, create_user_auto_reply
+
+FEEDBACK_DIGEST_INTERVAL = int(os.getenv("FEEDBACK_DIGEST_INTERVAL", "900"))
+FEEDBACK_DIGEST_MAX_ITEMS = int(os.getenv("FEEDBACK_DIGEST_MAX_ITEMS", "50"))
+
+_digest_task = None
+
+
+async def save_feedback(db: AsyncSession, name: str, email: str, category: str, subject: str, message: str) -> Feedback:
+    """Store a submission and queue the auto-reply in the same transaction"""
+    feedback = Feedback(name=name, email=email, category=category, subject=subject, message=message)
+    db.add(feedback)
+    await enqueue_emails(db, [(SENDER_EMAIL, email, create_user_auto_reply(SENDER_EMAIL, email, name, category, subject))])
+    logging.info(f"Feedback stored from {email}")
+    return feedback
+
+
+async def send_feedback_digest(session_factory=None) -> int:
+    """Queue one team email per FEEDBACK_DIGEST_MAX_ITEMS unreported submissions; returns how many were included"""
+    async with (session_factory or AsyncSessionLocal)() as db:
+        result = await db.execute(
+            select(Feedback).where(Feedback.digested_at.is_(None)).order_by(Feedback.id).limit(FEEDBACK_DIGEST_MAX_ITEMS)
+        )
+        now = datetime.utcnow()
+        items = []
+        for item in result.scalars().all():
+            # Another replica's digest may have taken the row since the select
+            claim = await db.execute(
+                update(Feedback)
+                .where(Feedback.id == item.id, Feedback.digested_at.is_(None))
+                .values(digested_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if claim.rowcount:
+                items.append(item)
+        if not items:
+            await db.rollback()
+            return 0
+        digest = create_team_digest(SENDER_EMAIL, FEEDBACK_RECIPIENT, [
+            {"name": item.name, "user_email": item.email, "category": item.category,
+             "subject": item.subject, "message": item.message, "submitted_at": item.created_at}
+            for item in items
+        ])
+        # The claims commit with the queued email, so a failed run leaves its rows for the next one
+        await enqueue_emails(db, [(SENDER_EMAIL, FEEDBACK_RECIPIENT, digest)])
+    logging.info(f"Feedback digest queued with {len(items)} submissions")
+    return len(items)
+
+
+async def list_feedback(db: AsyncSession, offset: int = 0, limit: int = 20,
+                        category: Optional[str] = None) -> List[Feedback]:
+    query = select(Feedback).order_by(Feedback.created_at.desc(), Feedback.id.desc())
+    if category:
+        query = query.where(Feedback.category == category)
+    result = await db.execute(query.offset(offset).limit(limit))
+    return result.scalars().all()
+
+
+async def _digest_loop():
+    while True:
+        await asyncio.sleep(FEEDBACK_DIGEST_INTERVAL)
+        try:
+            while await send_feedback_digest() == FEEDBACK_DIGEST_MAX_ITEMS:
+                pass
+        except Exception as e:
+            logging.error(f"Feedback digest failed: {e}")
+
+
+def start_feedback_digest():
+    global _digest_task
+    _digest_task = asyncio.create_task(_digest_loop())
+
+
+async def stop_feedback_digest():
+    global _digest_task
+    if _digest_task:
+        _digest_task.cancel()
+        try:
+            await _digest_task
+        except asyncio.CancelledError:
+            pass
+        _digest_task = None
@@ -0,0 +1,74 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth import ALGORITHM, SECRET_KEY
+from backend.chat_writer import chat_writer
+from backend.database import ChatSession, create_chat_session
+
+# Guest conversations get no chat_sessions row until they reach GUEST_PERSIST_AFTER turns
+# or the guest signs up; most guests leave after a message or two and never cost a row.
+# Until then the turns travel with the client as a signed guest_state, so any replica can
+# pick the conversation up.
+GUEST_PERSIST_AFTER = int(os.getenv("GUEST_PERSIST_AFTER", "3"))
+GUEST_STATE_TTL = int(os.getenv("GUEST_STATE_TTL", "3600"))
+# Longer conversations are persisted early rather than round-tripped
+GUEST_STATE_MAX_BYTES = int(os.getenv("GUEST_STATE_MAX_BYTES", "32768"))
+
+guest_stats = {"buffered_turns": 0, "persisted_conversations": 0, "rejected_states": 0}
+
+
+def load_guest_state(guest_state: Optional[str], guest_session_id: str) -> List[Dict]:
+    """Turns held by a guest_state issued to this guest session; anything else gives none"""
+    if not guest_state:
+        return []
+    try:
+        payload = jwt.decode(guest_state, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        guest_stats["rejected_states"] += 1
+        return []
+    if payload.get("sub") != f"guest_state_{guest_session_id}":
+        guest_stats["rejected_states"] += 1
+        return []
+    return [{**turn, "created_at": datetime.fromisoformat(turn["created_at"])} for turn in payload.get("turns", [])]
+
+
+def dump_guest_state(guest_session_id: str, turns: List[Dict]) -> str:
+    payload = {
+        "sub": f"guest_state_{guest_session_id}",
+        "turns": [{**turn, "created_at": turn["created_at"].isoformat()} for turn in turns],
+        "exp": datetime.utcnow() + timedelta(seconds=GUEST_STATE_TTL)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+async def persist_guest_conversation(db: AsyncSession, guest_session_id: str, turns: List[Dict],
+                                     user_id: Optional[int] = None) -> Optional[ChatSession]:
+    """Create the chat session for a buffered guest conversation and queue its turns"""
+    if not turns:
+        return None
+    chat_session = await create_chat_session(
+        db, user_id=user_id, session_id=guest_session_id, created_at=turns[0]["created_at"]
+    )
+    owner = ("user", user_id) if user_id else ("guest", guest_session_id)
+    for turn in turns:
+        chat_writer.enqueue(session_id=chat_session.id, owner=owner, **turn)
+    guest_stats["persisted_conversations"] += 1
+    return chat_session
+
+
+def get_guest_stats() -> dict:
+    return {**guest_stats, "persist_after": GUEST_PERSIST_AFTER}
+
+
+def make_turn(message: str, response: str, **fields) -> Dict:
+    return {
+        "message": message,
+        "response": response,
+        "message_type": "conversation",
+        "created_at": datetime.utcnow(),
+        **fields
+    }
@@ -0,0 +1,140 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+
+from backend.database import AsyncSessionLocal, Info
+from backend.claude_api import clear_cache, embed_texts_batch
+
+INFO_IMPORT_CHUNK_SIZE = int(os.getenv("INFO_IMPORT_CHUNK_SIZE", "500"))
+MAX_REPORTED_ERRORS = 50
+FIELDS = ("category", "key", "value")
+
+
+def validate_row(row, line: int) -> Tuple[Optional[Dict], Optional[str]]:
+    if not isinstance(row, dict):
+        return None, f"line {line}: expected an object with category, key and value"
+    values = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None, f"line {line}: missing {field}"
+        values[field] = value.strip()
+    for field in ("category", "key"):
+        if len(values[field]) > 255:
+            return None, f"line {line}: {field} longer than 255 characters"
+    return values, None
+
+
+def parse_info_file(content: bytes, filename: str) -> Tuple[List[Dict], List[str]]:
+    """Parse and validate rows; later duplicates of a (category, key) replace earlier ones"""
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return [], ["File is not valid UTF-8"]
+    errors = []
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        missing = [field for field in FIELDS if field not in (reader.fieldnames or [])]
+        if missing:
+            return [], [f"CSV header is missing: {', '.join(missing)}"]
+        raw_rows = [(line, row) for line, row in enumerate(reader, start=2)]
+    elif filename.lower().endswith((".jsonl", ".ndjson")):
+        raw_rows = []
+        for line, raw in enumerate(text.splitlines(), start=1):
+            if not raw.strip():
+                continue
+            try:
+                raw_rows.append((line, json.loads(raw)))
+            except json.JSONDecodeError as e:
+                errors.append(f"line {line}: invalid JSON ({e.msg})")
+    else:
+        return [], ["Unsupported file type, expected .csv or .jsonl"]
+
+    rows = {}
+    for line, raw in raw_rows:
+        row, error = validate_row(raw, line)
+        if error:
+            errors.append(error)
+        else:
+            rows[(row["category"], row["key"])] = row
+    return list(rows.values()), errors
+
+
+def log_progress(done: int, total: int):
+    logging.info(f"Info import: {done}/{total} rows")
+
+
+async def import_info_rows(rows: List[Dict], chunk_size: int = INFO_IMPORT_CHUNK_SIZE,
+                           progress: Callable[[int, int], None] = log_progress) -> Dict:
+    """Upsert rows by (category, key) one chunk per transaction"""
+    summary = {"inserted": 0, "updated": 0, "unchanged": 0, "embedded": 0}
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        changed_texts = []
+        async with AsyncSessionLocal() as db:
+            keys = [(row["category"], row["key"]) for row in chunk]
+            result = await db.execute(select(Info).where(tuple_(Info.category, Info.key).in_(keys)))
+            existing: Dict[Tuple[str, str], List[Info]] = {}
+            for record in result.scalars():
+                existing.setdefault((record.category, record.key), []).append(record)
+
+            for row in chunk:
+                records = existing.get((row["category"], row["key"]))
+                if not records:
+                    db.add(Info(**row))
+                    summary["inserted"] += 1
+                elif any(record.value != row["value"] for record in records):
+                    for record in records:
+                        record.value = row["value"]
+                    summary["updated"] += 1
+                else:
+                    summary["unchanged"] += 1
+                    continue
+                # Same text the retriever embeds for each record
+                changed_texts.append(f"{row['key']}: {row['value']}")
+            await db.commit()
+
+        summary["embedded"] += await asyncio.to_thread(embed_texts_batch, changed_texts)
+        progress(start + len(chunk), len(rows))
+    return summary
+
+
+async def import_info_file(content: bytes, filename: str,
+                           progress: Callable[[int, int], None] = log_progress) -> Dict:
+    started = time.monotonic()
+    rows, errors = parse_info_file(content, filename)
+    summary = await import_info_rows(rows, progress=progress)
+    if summary["inserted"] or summary["updated"]:
+        # One invalidation for the whole import instead of one per row
+        clear_cache()
+    summary.update(
+        valid_rows=len(rows),
+        invalid_rows=len(errors),
+        errors=errors[:MAX_REPORTED_ERRORS],
+        duration_seconds=round(time.monotonic() - started, 2)
+    )
+    logging.info(f"Info import of {filename} finished: {summary['inserted']} inserted, "
+                 f"{summary['updated']} updated, {summary['unchanged']} unchanged, {len(errors)} invalid")
+    return summary
+
+
+if __name__ == "__main__":
+    from backend.database import init_db
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m backend.info_import <file.csv|file.jsonl>")
+    init_db()
+    with open(sys.argv[1], "rb") as f:
+        data = f.read()
+    summary = asyncio.run(import_info_file(
+        data, sys.argv[1], progress=lambda done, total: print(f"{done}/{total} rows", file=sys.stderr)
+    ))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
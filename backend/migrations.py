@@ -0,0 +1,144 @@
+import logging
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from backend.database import ChatMessage, ChatSession
+from backend.search import create_search_index
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def create_index_if_missing(conn: Connection, name: str, table: str, columns: List[str]):
+    existing = {ix["name"] for ix in inspect(conn).get_indexes(table)}
+    if name not in existing:
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl_type: str):
+    existing = {col["name"] for col in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _chat_history_indexes(conn: Connection):
+    create_index_if_missing(conn, "ix_chat_sessions_user_id_created_at", "chat_sessions", ["user_id", "created_at"])
+    create_index_if_missing(conn, "ix_chat_sessions_created_at_id", "chat_sessions", ["created_at", "id"])
+    create_index_if_missing(conn, "ix_chat_messages_session_id_created_at", "chat_messages", ["session_id", "created_at"])
+
+
+def _chat_messages_created_at_index(conn: Connection):
+    create_index_if_missing(conn, "ix_chat_messages_created_at", "chat_messages", ["created_at"])
+
+
+def _info_category_key_index(conn: Connection):
+    create_index_if_missing(conn, "ix_info_category_key", "info", ["category", "key"])
+
+
+def _chat_message_metadata_columns(conn: Connection):
+    for column, ddl_type in [
+        ("language", "VARCHAR(8)"),
+        ("complexity", "VARCHAR(16)"),
+        ("provider", "VARCHAR(32)"),
+        ("cached", "BOOLEAN"),
+        ("estimated_tokens", "INTEGER"),
+        ("input_tokens", "INTEGER"),
+        ("output_tokens", "INTEGER"),
+        ("latency_ms", "INTEGER"),
+    ]:
+        add_column_if_missing(conn, "chat_messages", column, ddl_type)
+
+
+# (version, name, upgrade) - append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "composite indexes for chat history lookups", _chat_history_indexes),
+    (2, "chat_messages.created_at index for time-window stats", _chat_messages_created_at_index),
+    (3, "full-text search index on chat messages", create_search_index),
+    (4, "info (category, key) index for bulk import upserts", _info_category_key_index),
+    (5, "per-message language, provider, token and latency metadata", _chat_message_metadata_columns),
+]
+
+
+def get_applied_versions(engine: Engine) -> List[int]:
+    migration_metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return [row.version for row in conn.execute(select(schema_migrations.c.version))]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Apply pending migrations in order and return the versions that ran"""
+    applied = set(get_applied_versions(engine))
+    ran = []
+    for version, name, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        logging.info(f"Applied migration {version}: {name}")
+        ran.append(version)
+    return ran
+
+
+# Hot queries and the index each one is expected to use
+HOT_QUERIES = {
+    "latest_session_for_user": (
+        select(ChatSession).where(ChatSession.user_id == 1).order_by(ChatSession.created_at.desc()).limit(1),
+        "ix_chat_sessions_user_id_created_at",
+    ),
+    "session_history_page": (
+        select(ChatSession).order_by(ChatSession.created_at.desc(), ChatSession.id.desc()).limit(50),
+        "ix_chat_sessions_created_at_id",
+    ),
+    "messages_for_session": (
+        select(ChatMessage).where(ChatMessage.session_id == 1).order_by(ChatMessage.created_at.asc()),
+        "ix_chat_messages_session_id_created_at",
+    ),
+}
+
+
+def explain(conn: Connection, query) -> str:
+    sql = str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        return "\n".join(str(row[-1]) for row in rows)
+    if conn.dialect.name == "postgresql":
+        # Small tables would otherwise always get a sequential scan
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+    rows = conn.execute(text(f"EXPLAIN {sql}")).fetchall()
+    return "\n".join(str(row[0]) for row in rows)
+
+
+def check_hot_query_plans(engine: Engine) -> Dict[str, dict]:
+    """EXPLAIN each hot query and report whether it uses its composite index"""
+    report = {}
+    with engine.connect() as conn:
+        for name, (query, index_name) in HOT_QUERIES.items():
+            with conn.begin():
+                plan = explain(conn, query)
+            report[name] = {"index": index_name, "uses_index": index_name in plan, "plan": plan}
+    return report
+
+
+if __name__ == "__main__":
+    from backend.database import engine, init_db
+
+    init_db()
+    print(f"Applied versions: {get_applied_versions(engine)}")
+    if "--check" in sys.argv:
+        report = check_hot_query_plans(engine)
+        for name, result in report.items():
+            print(f"{'OK ' if result['uses_index'] else 'MISSING'} {name} -> {result['index']}")
+            print("    " + result["plan"].replace("\n", "\n    "))
+        sys.exit(0 if all(r["uses_index"] for r in report.values()) else 1)
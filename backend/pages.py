@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import os
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.templating import Jinja2Templates
+from starlette.responses import Response
+
+from backend.assets import accepted_encodings, brotli
+
+# Turn off while editing templates to see changes without a restart
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "true").lower() == "true"
+PAGE_CACHE_CONTROL = "no-cache"  # always revalidate; unchanged pages cost a 304
+
+PAGE_TEMPLATES = ["index.html", "login.html", "register.html", "dashboard.html",
+                  "profile.html", "about.html", "contact.html"]
+
+
+class RenderedPage(NamedTuple):
+    variants: Dict[str, bytes]  # content coding ("identity", "gzip", "br") -> body
+    etags: Dict[str, str]
+
+
+def render_page(templates: Jinja2Templates, name: str) -> RenderedPage:
+    body = templates.get_template(name).render().encode("utf-8")
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    etags = {
+        encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+        for encoding in variants
+    }
+    return RenderedPage(variants, etags)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class PageCache:
+    """Rendered templates served as bytes with ETag and Accept-Encoding negotiation"""
+
+    def __init__(self, templates: Jinja2Templates, enabled: bool = PAGE_CACHE_ENABLED):
+        self.templates = templates
+        self.enabled = enabled
+        self._pages: Dict[str, RenderedPage] = {}
+        self.stats = {"renders": 0, "hits": 0, "not_modified": 0}
+
+    def get(self, name: str) -> RenderedPage:
+        page = self._pages.get(name) if self.enabled else None
+        if page is None:
+            page = render_page(self.templates, name)
+            self.stats["renders"] += 1
+            if self.enabled:
+                self._pages[name] = page
+        else:
+            self.stats["hits"] += 1
+        return page
+
+    def prerender(self, names: Iterable[str] = PAGE_TEMPLATES):
+        for name in names:
+            self._pages.pop(name, None)
+            self.get(name)
+
+    def clear(self):
+        self._pages.clear()
+
+    def response(self, name: str, request: Request) -> Response:
+        page = self.get(name)
+        accepted = accepted_encodings(request.headers.get("accept-encoding"))
+        encoding = next((e for e in ("br", "gzip") if e in accepted and e in page.variants), "identity")
+        headers = {"ETag": page.etags[encoding], "Cache-Control": PAGE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), page.etags[encoding]):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(page.variants[encoding], media_type="text/html", headers=headers)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "pages": len(self._pages), "enabled": self.enabled}
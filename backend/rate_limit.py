@@ -0,0 +1,259 @@
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+
+from backend.auth import read_token_claims
+
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Only these peers may set X-Forwarded-For; defaults cover a local or private-network reverse proxy
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.getenv("TRUSTED_PROXIES", "127.0.0.1/32,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16").split(",")
+    if network.strip()
+]
+
+
+class RateLimit(NamedTuple):
+    limit: int
+    window: int  # seconds
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: int  # seconds until the current window rolls over
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset_after),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.reset_after)
+        return headers
+
+
+class SlidingWindowLimiter:
+    """Sliding-window counts per key, weighting the previous fixed window by its overlap; counted per process"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [window index, current count, previous count, window seconds]
+        self._entries: "OrderedDict[str, List[int]]" = OrderedDict()
+        self.stats = {"allowed": 0, "rejected": 0, "evicted": 0, "expired": 0}
+
+    def hit(self, key: str, rule: RateLimit) -> RateLimitResult:
+        """Count a request against key and report whether it is within the rule"""
+        return self.hit_all([(key, rule)])[0]
+
+    def hit_all(self, limits: List[Tuple[str, RateLimit]]) -> List[RateLimitResult]:
+        """Check a request against every (key, rule) and count it in all of them only if all allow it.
+
+        One result per limit; a rejected request is not counted anywhere.
+        """
+        if not limits:
+            return []
+        now = self.clock()
+        checked = []
+        for key, rule in limits:
+            entry = self._entry(key, rule, now)
+            elapsed = (now % rule.window) / rule.window
+            weighted = entry[2] * (1 - elapsed) + entry[1]
+            reset_after = max(1, math.ceil(rule.window - now % rule.window))
+            checked.append((entry, rule, weighted, reset_after))
+
+        allowed = all(weighted + 1 <= rule.limit for _, rule, weighted, _ in checked)
+        results = []
+        for entry, rule, weighted, reset_after in checked:
+            if allowed:
+                entry[1] += 1
+                results.append(RateLimitResult(True, rule.limit, max(0, int(rule.limit - weighted - 1)), reset_after))
+            elif weighted + 1 > rule.limit:
+                results.append(RateLimitResult(False, rule.limit, 0, reset_after))
+            else:
+                results.append(RateLimitResult(True, rule.limit, max(0, int(rule.limit - weighted)), reset_after))
+        self.stats["allowed" if allowed else "rejected"] += 1
+
+        self._sweep(now, budget=2)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+        return results
+
+    def _entry(self, key: str, rule: RateLimit, now: float) -> List[int]:
+        window_index = int(now // rule.window)
+        entry = self._entries.get(key)
+        if entry is None or window_index - entry[0] >= 2:
+            entry = [window_index, 0, 0, rule.window]
+            self._entries[key] = entry
+        elif window_index != entry[0]:
+            # Rolled into the next window: the current count becomes the previous one
+            entry[0], entry[1], entry[2] = window_index, 0, entry[1]
+        self._entries.move_to_end(key)
+        return entry
+
+    def _sweep(self, now: float, budget: Optional[int] = None) -> int:
+        """Drop idle keys from the least recently used end"""
+        removed = 0
+        while self._entries and (budget is None or removed < budget):
+            key, entry = next(iter(self._entries.items()))
+            if int(now // entry[3]) - entry[0] < 2:
+                break
+            del self._entries[key]
+            removed += 1
+        self.stats["expired"] += removed
+        return removed
+
+    def sweep(self) -> int:
+        return self._sweep(self.clock())
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "keys": len(self._entries), "max_keys": self.max_keys}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def is_trusted_proxy(host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except (TypeError, ValueError):
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def get_client_ip(request: Request) -> str:
+    """Client address, following X-Forwarded-For only through trusted proxies"""
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("X-Forwarded-For")
+    if not forwarded or not is_trusted_proxy(peer):
+        return peer
+    # Walk back from the nearest hop; the first untrusted address is the client
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+
+rate_limiter = SlidingWindowLimiter()
+
+
+def env_rule(name: str, limit: int, window: int) -> RateLimit:
+    return RateLimit(int(os.getenv(f"{name}_RATE_LIMIT", str(limit))), int(os.getenv(f"{name}_RATE_WINDOW", str(window))))
+
+
+class RoutePolicy(NamedTuple):
+    name: str
+    detail: str
+    limits: Tuple[Tuple[str, RateLimit], ...]  # (scope, rule); scope is "ip", "user" or "guest"
+
+
+RATE_LIMIT_POLICIES: Dict[Tuple[str, str], RoutePolicy] = {
+    ("POST", "/chat"): RoutePolicy("chat", "Rate limit exceeded. Please try again later.", (
+        ("user", env_rule("CHAT", 50, 3600)),
+        ("guest", env_rule("CHAT", 50, 3600)),
+        # Guest tokens are free to mint, so an address gets a wider cap of its own
+        ("ip", env_rule("CHAT_IP", 200, 3600)),
+    )),
+    ("POST", "/feedback"): RoutePolicy("feedback", "Too many feedback submissions. Please try again later.", (
+        ("ip", env_rule("FEEDBACK", 5, 3600)),
+    )),
+    ("POST", "/auth/login"): RoutePolicy("login", "Too many login attempts. Please try again later.", (
+        ("ip", env_rule("LOGIN", 10, 300)),
+    )),
+    ("POST", "/auth/register"): RoutePolicy("register", "Too many registrations. Please try again later.", (
+        ("ip", env_rule("REGISTER", 5, 3600)),
+    )),
+    ("POST", "/auth/guest"): RoutePolicy("guest_token", "Rate limit exceeded. Please try again later.", (
+        ("ip", env_rule("GUEST_TOKEN", 30, 3600)),
+    )),
+}
+
+# Per route: requests let through and requests rejected, by the scope that rejected them
+route_stats: Dict[str, Dict[str, int]] = {}
+
+
+def request_identity(request: Request, scope: str, claims: Optional[dict]) -> Optional[str]:
+    """Key for a limit scope, or None when the scope does not apply to this request"""
+    if scope == "ip":
+        return get_client_ip(request)
+    if not claims:
+        return None
+    if scope == "guest":
+        return claims["sub"] if claims.get("user_type") == "guest" else None
+    if scope == "user":
+        return str(claims["user_id"]) if claims.get("user_type") != "guest" and claims.get("user_id") else None
+    raise ValueError(f"Unknown rate limit scope: {scope}")
+
+
+def bearer_claims(request: Request) -> Optional[dict]:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return read_token_claims(token)
+
+
+class RateLimitMiddleware:
+    """Rejects over-limit requests for routes in the policy table before they reach the app"""
+
+    def __init__(self, app, policies: Dict[Tuple[str, str], RoutePolicy] = None,
+                 limiter: SlidingWindowLimiter = None):
+        self.app = app
+        self.policies = RATE_LIMIT_POLICIES if policies is None else policies
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        policy = self.policies.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        claims = bearer_claims(request) if any(s != "ip" for s, _ in policy.limits) else None
+        counters = route_stats.setdefault(policy.name, {"allowed": 0})
+        applicable = []
+        for limit_scope, rule in policy.limits:
+            identity = request_identity(request, limit_scope, claims)
+            if identity is not None:
+                applicable.append((limit_scope, f"{policy.name}:{limit_scope}:{identity}", rule))
+        results = self.limiter.hit_all([(key, rule) for _, key, rule in applicable])
+        for (limit_scope, _, _), result in zip(applicable, results):
+            if not result.allowed:
+                key = f"rejected_{limit_scope}"
+                counters[key] = counters.get(key, 0) + 1
+                response = JSONResponse({"detail": policy.detail}, status_code=429, headers=result.headers())
+                await response(scope, receive, send)
+                return
+        counters["allowed"] += 1
+
+        tightest = min(results, key=lambda result: result.remaining, default=None)
+        if tightest is None:
+            await self.app(scope, receive, send)
+            return
+        headers = tightest.headers()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def get_rate_limit_stats() -> dict:
+    return {**rate_limiter.get_stats(), "routes": route_stats}
@@ -0,0 +1,124 @@
+import os
+import zlib
+from typing import Any, Optional
+
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from backend.assets import accepted_encodings, brotli
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Low brotli qualities compress about as fast as gzip and still produce smaller output
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript",
+                      "image/svg+xml")
+
+compression_stats = {"compressed": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli:
+            return self._brotli.process(data)
+        return self._gzip.compress(data)
+
+    def flush(self) -> bytes:
+        # Flushed per chunk so streamed rows reach the client without waiting for the end
+        if self._brotli:
+            return self._brotli.flush()
+        return self._gzip.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli:
+            return self._brotli.finish()
+        return self._gzip.flush()
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding")) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message  # held until the first body chunk shows the size
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(scope=start_message)
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers or "content-range" in headers
+                    or start_message["status"] < 200 or start_message["status"] in (204, 206, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    compression_stats["skipped"] += 1
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"  # not byte-identical to the uncompressed entity
+                compression_stats["compressed"] += 1
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    data = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(data))
+                    compression_stats["bytes_in"] += len(body)
+                    compression_stats["bytes_out"] += len(data)
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send(start_message)
+
+            data = compressor.compress(body) + (compressor.flush() if more_body else compressor.finish())
+            compression_stats["bytes_in"] += len(body)
+            compression_stats["bytes_out"] += len(data)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, delete, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from backend.active_sessions import invalidate_active_session
+from backend.database import AsyncSessionLocal, ChatSession, ChatMessage, ChatArchive
+
+# Active sessions rotate after a day, so anything above 2 days never touches a live session
+CHAT_RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "180"))
+GUEST_RETENTION_DAYS = int(os.getenv("GUEST_RETENTION_DAYS", "30"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "86400"))  # 0 disables the background job
+
+_retention_task = None
+
+
+def compress_messages(messages: List[ChatMessage]) -> bytes:
+    rows = [{column.name: getattr(m, column.name) for column in ChatMessage.__table__.columns} for m in messages]
+    return zlib.compress(json.dumps(rows, default=str, ensure_ascii=False).encode("utf-8"))
+
+
+def decompress_messages(payload: bytes) -> List[Dict]:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+async def ensure_archive_partitions(db: AsyncSession, months: set):
+    """Create the monthly chat_archive partitions a batch is about to write into"""
+    if db.bind.dialect.name != "postgresql":
+        return
+    for year, month in sorted(months):
+        start = datetime(year, month, 1)
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS chat_archive_{year}_{month:02d} PARTITION OF chat_archive "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+
+
+async def _next_batch(db: AsyncSession, *conditions) -> List:
+    result = await db.execute(
+        select(ChatSession.id, ChatSession.user_id, ChatSession.session_id).where(*conditions)
+        .order_by(ChatSession.created_at, ChatSession.id)
+        .limit(RETENTION_BATCH_SIZE)
+    )
+    return list(result.all())
+
+
+async def _delete_sessions(db: AsyncSession, sessions: List):
+    session_ids = [s.id for s in sessions]
+    await db.execute(delete(ChatMessage).where(ChatMessage.session_id.in_(session_ids)))
+    await db.execute(delete(ChatSession).where(ChatSession.id.in_(session_ids)))
+    # A cached active session id would otherwise send new messages to a deleted row
+    for s in sessions:
+        invalidate_active_session(s)
+
+
+async def purge_guest_sessions(cutoff: Optional[datetime] = None) -> int:
+    """Delete expired guest sessions and their messages; returns the number of sessions removed"""
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=GUEST_RETENTION_DAYS)
+    purged = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            batch = await _next_batch(db, ChatSession.user_id.is_(None), ChatSession.created_at < cutoff)
+            if not batch:
+                return purged
+            await _delete_sessions(db, batch)
+            await db.commit()
+        purged += len(batch)
+        # Let request handlers run between batches
+        await asyncio.sleep(0)
+
+
+async def archive_old_sessions(cutoff: Optional[datetime] = None) -> Dict[str, int]:
+    """Move sessions older than the cutoff into chat_archive"""
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=CHAT_RETENTION_DAYS)
+    archived = {"sessions": 0, "messages": 0}
+    while True:
+        async with AsyncSessionLocal() as db:
+            batch = await _next_batch(db, ChatSession.created_at < cutoff)
+            if not batch:
+                return archived
+            result = await db.execute(
+                select(ChatSession).where(ChatSession.id.in_([s.id for s in batch]))
+                .options(selectinload(ChatSession.messages))
+            )
+            sessions = result.scalars().all()
+            await ensure_archive_partitions(db, {(s.created_at.year, s.created_at.month) for s in sessions})
+            await db.execute(insert(ChatArchive), [
+                {
+                    "session_id": s.id,
+                    "session_created_at": s.created_at,
+                    "user_id": s.user_id,
+                    "guest_session_id": s.session_id,
+                    "message_count": len(s.messages),
+                    "payload": compress_messages(s.messages),
+                    "archived_at": datetime.utcnow()
+                }
+                for s in sessions
+            ])
+            await _delete_sessions(db, batch)
+            await db.commit()
+        archived["sessions"] += len(sessions)
+        archived["messages"] += sum(len(s.messages) for s in sessions)
+        await asyncio.sleep(0)
+
+
+async def run_retention() -> Dict[str, int]:
+    # Purge guests first so expired guest data is never archived
+    purged = await purge_guest_sessions()
+    archived = await archive_old_sessions()
+    summary = {
+        "purged_guest_sessions": purged,
+        "archived_sessions": archived["sessions"],
+        "archived_messages": archived["messages"]
+    }
+    logging.info(f"Retention run complete: {summary}")
+    return summary
+
+
+async def get_archived_session(session_id: int) -> Optional[Dict]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(ChatArchive).where(ChatArchive.session_id == session_id))
+        archive = result.scalars().first()
+    if archive is None:
+        return None
+    return {
+        "session_id": archive.session_id,
+        "user_id": archive.user_id,
+        "guest_session_id": archive.guest_session_id,
+        "created_at": archive.session_created_at,
+        "archived_at": archive.archived_at,
+        "messages": decompress_messages(archive.payload)
+    }
+
+
+async def _retention_loop():
+    while True:
+        try:
+            await run_retention()
+        except Exception as e:
+            logging.error(f"Retention run failed: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+
+def start_retention_job():
+    global _retention_task
+    if RETENTION_INTERVAL > 0:
+        _retention_task = asyncio.create_task(_retention_loop())
+
+
+async def stop_retention_job():
+    global _retention_task
+    if _retention_task:
+        _retention_task.cancel()
+        try:
+            await _retention_task
+        except asyncio.CancelledError:
+            pass
+        _retention_task = None
+
+
+if __name__ == "__main__":
+    from backend.database import init_db
+
+    init_db()
+    print(asyncio.run(run_retention()))
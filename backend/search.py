@@ -0,0 +1,91 @@
+from typing import Dict, List
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+# Must match the indexed expression exactly for PostgreSQL to use the index
+PG_DOCUMENT = "to_tsvector('simple', coalesce(m.message, '') || ' ' || coalesce(m.response, ''))"
+
+
+def create_search_index(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_chat_messages_fts ON chat_messages USING GIN "
+            "(to_tsvector('simple', coalesce(message, '') || ' ' || coalesce(response, '')))"
+        ))
+    elif conn.dialect.name == "sqlite":
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5("
+            "message, response, content='chat_messages', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ai AFTER INSERT ON chat_messages BEGIN "
+            "INSERT INTO chat_messages_fts(rowid, message, response) VALUES (new.id, new.message, new.response); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ad AFTER DELETE ON chat_messages BEGIN "
+            "INSERT INTO chat_messages_fts(chat_messages_fts, rowid, message, response) "
+            "VALUES ('delete', old.id, old.message, old.response); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS chat_messages_fts_au AFTER UPDATE ON chat_messages BEGIN "
+            "INSERT INTO chat_messages_fts(chat_messages_fts, rowid, message, response) "
+            "VALUES ('delete', old.id, old.message, old.response); "
+            "INSERT INTO chat_messages_fts(rowid, message, response) VALUES (new.id, new.message, new.response); END"
+        ))
+        # Index rows written before the table existed
+        conn.execute(text("INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('rebuild')"))
+
+
+def to_fts5_query(query: str) -> str:
+    """Quote every term so user input is never parsed as FTS5 syntax; terms are ANDed"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+async def search_messages(db: AsyncSession, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+    """Best matches first; fetches limit rows starting at offset"""
+    params = {"query": query, "limit": limit, "offset": offset}
+    if db.bind.dialect.name == "postgresql":
+        # Rank and page first so ts_headline only runs on the returned rows
+        sql = f"""
+            WITH hits AS (
+                SELECT m.id, ts_rank({PG_DOCUMENT}, q) AS score, q
+                FROM chat_messages m, websearch_to_tsquery('simple', :query) q
+                WHERE {PG_DOCUMENT} @@ q
+                ORDER BY score DESC, m.id DESC
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT m.id, m.session_id, m.created_at, s.user_id, s.session_id AS guest_session_id,
+                   u.full_name, u.email, hits.score,
+                   ts_headline('simple', coalesce(m.message, ''), hits.q, :headline) AS message_snippet,
+                   ts_headline('simple', coalesce(m.response, ''), hits.q, :headline) AS response_snippet
+            FROM hits
+            JOIN chat_messages m ON m.id = hits.id
+            JOIN chat_sessions s ON s.id = m.session_id
+            LEFT JOIN users u ON u.id = s.user_id
+            ORDER BY hits.score DESC, m.id DESC
+        """
+        params["headline"] = f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=24, MinWords=8"
+    else:
+        params["query"] = to_fts5_query(query)
+        # bm25() is lower-is-better, negate it so both backends rank descending
+        sql = f"""
+            SELECT m.id, m.session_id, m.created_at, s.user_id, s.session_id AS guest_session_id,
+                   u.full_name, u.email, -bm25(chat_messages_fts) AS score,
+                   snippet(chat_messages_fts, 0, '{SNIPPET_START}', '{SNIPPET_END}', '...', 16) AS message_snippet,
+                   snippet(chat_messages_fts, 1, '{SNIPPET_START}', '{SNIPPET_END}', '...', 16) AS response_snippet
+            FROM chat_messages_fts
+            JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+            JOIN chat_sessions s ON s.id = m.session_id
+            LEFT JOIN users u ON u.id = s.user_id
+            WHERE chat_messages_fts MATCH :query
+            ORDER BY score DESC, m.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+    result = await db.execute(text(sql).columns(created_at=DateTime), params)
+    return [dict(row) for row in result.mappings().all()]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, func, delete, distinct
+
+from backend.database import AsyncSessionLocal, User, ChatSession, ChatMessage, StatsSnapshot
+from backend.claude_api import get_cache_stats
+
+# Dashboard counters are recomputed in the background and read from memory
+STATS_REFRESH_INTERVAL = int(os.getenv("STATS_REFRESH_INTERVAL", "300"))
+STATS_RETENTION_DAYS = int(os.getenv("STATS_RETENTION_DAYS", "30"))
+
+latest_snapshot: Optional[dict] = None
+_refresh_task = None
+
+
+def snapshot_to_dict(snapshot: StatsSnapshot) -> dict:
+    return {
+        "total_users": snapshot.total_users,
+        "total_chat_sessions": snapshot.total_chat_sessions,
+        "guest_chat_sessions": snapshot.guest_chat_sessions,
+        "total_messages": snapshot.total_messages,
+        "messages_last_24h": snapshot.messages_last_24h,
+        "active_users_last_24h": snapshot.active_users_last_24h,
+        "cache_stats": json.loads(snapshot.cache_stats) if snapshot.cache_stats else {},
+        "refreshed_at": snapshot.created_at
+    }
+
+
+async def refresh_stats_snapshot() -> dict:
+    """Recompute the counters, store them as a new snapshot row and keep it in memory"""
+    global latest_snapshot
+    since = datetime.utcnow() - timedelta(days=1)
+    async with AsyncSessionLocal() as db:
+        snapshot = StatsSnapshot(
+            created_at=datetime.utcnow(),
+            total_users=await db.scalar(select(func.count()).select_from(User)),
+            total_chat_sessions=await db.scalar(select(func.count()).select_from(ChatSession)),
+            guest_chat_sessions=await db.scalar(
+                select(func.count()).select_from(ChatSession).where(ChatSession.user_id.is_(None))
+            ),
+            total_messages=await db.scalar(select(func.count()).select_from(ChatMessage)),
+            messages_last_24h=await db.scalar(
+                select(func.count()).select_from(ChatMessage).where(ChatMessage.created_at >= since)
+            ),
+            active_users_last_24h=await db.scalar(
+                select(func.count(distinct(ChatSession.user_id)))
+                .select_from(ChatMessage)
+                .join(ChatSession, ChatMessage.session_id == ChatSession.id)
+                .where(ChatMessage.created_at >= since, ChatSession.user_id.isnot(None))
+            ),
+            cache_stats=json.dumps(get_cache_stats())
+        )
+        db.add(snapshot)
+        await db.execute(
+            delete(StatsSnapshot).where(
+                StatsSnapshot.created_at < datetime.utcnow() - timedelta(days=STATS_RETENTION_DAYS)
+            )
+        )
+        await db.commit()
+    latest_snapshot = snapshot_to_dict(snapshot)
+    return latest_snapshot
+
+
+async def load_latest_snapshot() -> Optional[dict]:
+    """Seed the in-memory snapshot from the table after a restart"""
+    global latest_snapshot
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(StatsSnapshot).order_by(StatsSnapshot.created_at.desc()).limit(1))
+        snapshot = result.scalars().first()
+    if snapshot:
+        latest_snapshot = snapshot_to_dict(snapshot)
+    return latest_snapshot
+
+
+async def get_stats_snapshot() -> dict:
+    """O(1) read for the dashboard; only computes if no snapshot exists yet"""
+    if latest_snapshot is None and await load_latest_snapshot() is None:
+        return await refresh_stats_snapshot()
+    return latest_snapshot
+
+
+async def _refresh_loop():
+    while True:
+        try:
+            await refresh_stats_snapshot()
+        except Exception as e:
+            logging.error(f"Stats snapshot refresh failed: {e}")
+        await asyncio.sleep(STATS_REFRESH_INTERVAL)
+
+
+def start_stats_refresher():
+    global _refresh_task
+    _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_stats_refresher():
+    global _refresh_task
+    if _refresh_task:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
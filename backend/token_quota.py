@@ -0,0 +1,138 @@
+import heapq
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+# Rolling token budgets for Claude usage, tracked per process
+TOKEN_WINDOW_SECONDS = int(os.getenv("TOKEN_WINDOW_SECONDS", "3600"))
+USER_TOKEN_BUDGET = int(os.getenv("USER_TOKEN_BUDGET", "60000"))
+GUEST_TOKEN_BUDGET = int(os.getenv("GUEST_TOKEN_BUDGET", "15000"))
+# Shared by every guest and anonymous caller behind one address (campus NAT included),
+# so minting new guest sessions doesn't mint new budget
+IP_TOKEN_BUDGET = int(os.getenv("IP_TOKEN_BUDGET", "60000"))
+MAX_TRACKED_KEYS = int(os.getenv("TOKEN_QUOTA_MAX_KEYS", "10000"))
+
+# Usage is summed into one-minute buckets so each key holds at most
+# TOKEN_WINDOW_SECONDS / BUCKET_SECONDS entries regardless of traffic
+BUCKET_SECONDS = 60
+
+token_usage_storage: "OrderedDict[str, Dict]" = OrderedDict()
+
+def get_quota_key(current_user: Optional[dict], client_ip: str) -> str:
+    """Key token usage by user id, guest session, or client IP for anonymous callers"""
+    if current_user and current_user.get("user_type") in ["user", "admin"]:
+        return f"user:{current_user['user_id']}"
+    if current_user and current_user.get("user_type") == "guest":
+        return f"guest:{current_user.get('email', '').replace('guest_', '')}"
+    return f"ip:{client_ip}"
+
+def get_quota_keys(current_user: Optional[dict], client_ip: str) -> List[str]:
+    """Every budget a request is charged to; guests also draw on their address's budget"""
+    quota_key = get_quota_key(current_user, client_ip)
+    if quota_key.startswith("guest:"):
+        return [quota_key, f"ip:{client_ip}"]
+    return [quota_key]
+
+def get_token_budget(quota_key: str) -> int:
+    """Registered users get the larger budget, each guest session the smaller one, each address its shared one"""
+    if quota_key.startswith("user:"):
+        return USER_TOKEN_BUDGET
+    if quota_key.startswith("ip:"):
+        return IP_TOKEN_BUDGET
+    return GUEST_TOKEN_BUDGET
+
+def _expire_buckets(entry: Dict, now: float):
+    """Drop buckets that have fallen out of the rolling window"""
+    buckets = entry["buckets"]
+    cutoff = now - TOKEN_WINDOW_SECONDS
+    while buckets and buckets[0][0] + BUCKET_SECONDS <= cutoff:
+        _, tokens = buckets.popleft()
+        entry["total"] -= tokens
+
+def get_token_usage(quota_key: str) -> int:
+    """Tokens consumed by this key within the rolling window"""
+    entry = token_usage_storage.get(quota_key)
+    if not entry:
+        return 0
+    _expire_buckets(entry, time.time())
+    return entry["total"]
+
+def check_token_budget(quota_key: str) -> bool:
+    """Check if the key still has tokens left in its rolling budget"""
+    return get_token_usage(quota_key) < get_token_budget(quota_key)
+
+def check_token_budgets(quota_keys: List[str]) -> bool:
+    """A request goes ahead only if every budget it is charged to has tokens left"""
+    return all(check_token_budget(quota_key) for quota_key in quota_keys)
+
+def record_token_usage(quota_key: str, tokens: int):
+    """Add consumed tokens to the key's current bucket"""
+    if tokens <= 0:
+        return
+    now = time.time()
+    bucket_start = now - (now % BUCKET_SECONDS)
+
+    entry = token_usage_storage.get(quota_key)
+    if entry is None:
+        entry = {"buckets": deque(), "total": 0}
+        token_usage_storage[quota_key] = entry
+    token_usage_storage.move_to_end(quota_key)
+
+    _expire_buckets(entry, now)
+    if entry["buckets"] and entry["buckets"][-1][0] == bucket_start:
+        entry["buckets"][-1][1] += tokens
+    else:
+        entry["buckets"].append([bucket_start, tokens])
+    entry["total"] += tokens
+
+    if len(token_usage_storage) > MAX_TRACKED_KEYS:
+        _evict_keys(protect=quota_key)
+
+def _evict_keys(protect: str):
+    """Bound memory without resetting heavy users: expired keys go first, then the lightest consumers"""
+    cleanup_token_usage()
+    excess = len(token_usage_storage) - MAX_TRACKED_KEYS
+    if excess <= 0:
+        return
+    # Free a tenth of the table at once so the scan isn't repeated for every new key
+    lightest = heapq.nsmallest(
+        excess + MAX_TRACKED_KEYS // 10,
+        (key for key in token_usage_storage if key != protect),
+        key=lambda key: token_usage_storage[key]["total"]
+    )
+    for key in lightest:
+        del token_usage_storage[key]
+
+def cleanup_token_usage():
+    """Remove keys with no usage left in the window"""
+    now = time.time()
+    for quota_key in list(token_usage_storage.keys()):
+        entry = token_usage_storage[quota_key]
+        _expire_buckets(entry, now)
+        if not entry["buckets"]:
+            del token_usage_storage[quota_key]
+
+def get_token_usage_summary(limit: int = 50) -> Dict:
+    """Current consumption per key, heaviest consumers first"""
+    cleanup_token_usage()
+    consumers: List[Dict] = []
+    for quota_key, entry in token_usage_storage.items():
+        budget = get_token_budget(quota_key)
+        consumers.append({
+            "key": quota_key,
+            "tokens_used": entry["total"],
+            "budget": budget,
+            "remaining": max(0, budget - entry["total"])
+        })
+    consumers.sort(key=lambda c: c["tokens_used"], reverse=True)
+
+    return {
+        "window_seconds": TOKEN_WINDOW_SECONDS,
+        "user_budget": USER_TOKEN_BUDGET,
+        "guest_budget": GUEST_TOKEN_BUDGET,
+        "ip_budget": IP_TOKEN_BUDGET,
+        "tracked_keys": len(token_usage_storage),
+        "total_tokens": sum(c["tokens_used"] for c in consumers),
+        "consumers": consumers[:limit]
+    }
@@ -0,0 +1,105 @@
+"""Serialization time and payload size of the large API responses, before and after.
+
+Before: FastAPI's default path, jsonable_encoder + JSONResponse (json.dumps), uncompressed.
+After:  FastJSONResponse returned directly (orjson, no jsonable_encoder), then
+        CompressionMiddleware (gzip, or brotli when installed).
+
+Run from the repository root:
+
+    python -m scripts.bench_json_responses [--sessions 50] [--messages 20] [--users 2000] [--repeat 20]
+"""
+import argparse
+import gzip
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.responses import BROTLI_QUALITY, GZIP_LEVEL, FastJSONResponse, brotli
+
+QUESTION = "What are the admission requirements for the College of Engineering?"
+ANSWER = ("The College of Engineering admits students based on their grade 12 average. "
+          "Required documents include the national ID, the high school certificate and four photos. ") * 4
+
+
+def chat_history_payload(sessions: int, messages: int) -> dict:
+    start = datetime(2025, 1, 1)
+    return {
+        "sessions": [
+            {
+                "session_id": s,
+                "user_info": f"Student {s} (student{s}@uos.edu.krd)",
+                "created_at": (start + timedelta(minutes=s)).isoformat(),
+                "messages": [
+                    {
+                        "id": s * messages + m,
+                        "message": QUESTION,
+                        "response": ANSWER,
+                        "created_at": (start + timedelta(minutes=s, seconds=m)).isoformat(),
+                        "language": "en",
+                        "provider": "claude",
+                        "cached": m % 3 == 0,
+                        "input_tokens": 812,
+                        "output_tokens": 164,
+                        "latency_ms": 1430
+                    }
+                    for m in range(messages)
+                ]
+            }
+            for s in range(sessions)
+        ],
+        "limit": sessions, "has_more": True, "next_cursor": "eyJjIjoiMjAyNS0wMS0wMVQwMDowMDowMCIsImkiOjF9", "page": 1
+    }
+
+
+def users_payload(users: int) -> list:
+    return [
+        {"id": i, "email": f"student{i}@uos.edu.krd", "full_name": f"Student {i}", "user_type": "user",
+         "is_active": True, "created_at": datetime(2025, 1, 1, 8, 0, i % 60).isoformat()}
+        for i in range(users)
+    ]
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def report(name: str, payload, repeat: int):
+    before = JSONResponse(jsonable_encoder(payload)).body
+    after = FastJSONResponse(payload).body
+    before_ms = best_of(repeat, lambda: JSONResponse(jsonable_encoder(payload)))
+    after_ms = best_of(repeat, lambda: FastJSONResponse(payload))
+    gzip_ms = best_of(repeat, lambda: gzip.compress(after, compresslevel=GZIP_LEVEL))
+    gzipped = gzip.compress(after, compresslevel=GZIP_LEVEL)
+
+    print(f"\n{name}")
+    print(f"  serialize  stock {before_ms:8.2f} ms   orjson {after_ms:8.2f} ms   ({before_ms / after_ms:.1f}x)")
+    print(f"  size       raw {len(before):>10,} B   gzip {len(gzipped):>9,} B  "
+          f"({len(gzipped) / len(before):.1%}, {gzip_ms:.2f} ms)")
+    if brotli is not None:
+        br_ms = best_of(repeat, lambda: brotli.compress(after, quality=BROTLI_QUALITY))
+        br = brotli.compress(after, quality=BROTLI_QUALITY)
+        print(f"             br  {len(br):>9,} B  ({len(br) / len(before):.1%}, {br_ms:.2f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    report(f"chat history ({args.sessions} sessions x {args.messages} messages)",
+           chat_history_payload(args.sessions, args.messages), args.repeat)
+    report(f"users ({args.users})", users_payload(args.users), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+
+# backend.database builds its engines at import time, so point it at a
+# throwaway SQLite file before any test module imports it
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+
+# The API clients are constructed at import time and refuse to start without a key
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test-key")
+
+from datetime import datetime, timedelta  # noqa: E402
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker  # noqa: E402
+
+from backend.database import Base, User, ChatSession, ChatMessage  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    """Fresh SQLite database per test with every table created"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def async_session(engine):
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def seed(async_session):
+    """Adds one user and sessions alternating guest/registered, with messages; returns the user id"""
+    async def seed(sessions=20, messages_per_session=3):
+        async with async_session() as db:
+            user = User(email="student@uos.edu.krd", full_name="Student", hashed_password="x")
+            db.add(user)
+            await db.flush()
+            start = datetime(2025, 1, 1)
+            for i in range(sessions):
+                session = ChatSession(
+                    user_id=user.id if i % 2 else None,
+                    session_id=None if i % 2 else f"guest-{i}",
+                    created_at=start + timedelta(minutes=i)
+                )
+                db.add(session)
+                await db.flush()
+                for j in range(messages_per_session):
+                    db.add(ChatMessage(
+                        session_id=session.id, message=f"q{j}", response=f"a{j}",
+                        message_type="conversation", created_at=session.created_at + timedelta(seconds=j)
+                    ))
+            await db.commit()
+            return user.id
+    return seed
+
+
+@pytest.fixture
+def count_queries(engine):
+    """Call to start recording SQL statements; returns the list they are appended to"""
+    def count_queries():
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        return statements
+    return count_queries
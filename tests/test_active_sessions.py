@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, select
+
+from backend import active_sessions, retention
+from backend.active_sessions import reassign_orphaned_turn, resolve_chat_session_id, save_chat_turn
+from backend.cache import TTLCache
+from backend.chat_writer import ChatMessageWriter
+from backend.database import ChatMessage, ChatSession, User
+from backend.guest_store import make_turn
+
+pytestmark = pytest.mark.anyio
+
+
+def fresh_cache(monkeypatch):
+    cache = TTLCache(maxsize=100, ttl=60)
+    monkeypatch.setattr(active_sessions, "active_session_cache", cache)
+    return cache
+
+
+async def add_user(async_session):
+    async with async_session() as db:
+        user = User(email="student@uos.edu.krd", full_name="Student", hashed_password="x")
+        db.add(user)
+        await db.commit()
+        return {"user_id": user.id, "user_type": "user"}
+
+
+async def test_resolved_session_is_cached(engine, async_session, count_queries, monkeypatch):
+    cache = fresh_cache(monkeypatch)
+
+    current_user = await add_user(async_session)
+    async with async_session() as db:
+        first = await resolve_chat_session_id(db, current_user)
+    assert cache.get(("user", current_user["user_id"]))[0] == first
+
+    statements = count_queries()
+    async with async_session() as db:
+        assert await resolve_chat_session_id(db, current_user) == first
+    assert statements == []
+
+
+async def test_expired_session_rolls_over(async_session, monkeypatch):
+    cache = fresh_cache(monkeypatch)
+
+    current_user = await add_user(async_session)
+    async with async_session() as db:
+        old = ChatSession(user_id=current_user["user_id"], created_at=datetime.utcnow() - timedelta(days=3))
+        db.add(old)
+        await db.commit()
+    # Neither the cached nor the stored session is reused once it is over a day old
+    cache.set(("user", current_user["user_id"]), (old.id, old.created_at))
+    async with async_session() as db:
+        new_id = await resolve_chat_session_id(db, current_user)
+        assert new_id != old.id
+        assert len((await db.execute(select(ChatSession.id))).all()) == 2
+    assert cache.get(("user", current_user["user_id"]))[0] == new_id
+
+
+async def test_retention_forgets_deleted_sessions(async_session, monkeypatch):
+    cache = fresh_cache(monkeypatch)
+
+    monkeypatch.setattr(retention, "AsyncSessionLocal", async_session)
+    current_user = await add_user(async_session)
+    guest = {"email": "guest_old-guest", "user_type": "guest"}
+    created_at = datetime.utcnow() - timedelta(hours=1)
+    async with async_session() as db:
+        db.add_all([ChatSession(user_id=current_user["user_id"], created_at=created_at),
+                    ChatSession(session_id="old-guest", created_at=created_at)])
+        await db.commit()
+        assert await resolve_chat_session_id(db, current_user)
+        assert await resolve_chat_session_id(db, guest)
+    assert len(cache) == 2
+
+    cutoff = datetime.utcnow()
+    assert await retention.purge_guest_sessions(cutoff=cutoff) == 1
+    assert cache.get(("guest", "old-guest")) is None
+    assert await retention.archive_old_sessions(cutoff=cutoff) == {"sessions": 1, "messages": 0}
+    assert cache.get(("user", current_user["user_id"])) is None
+
+    async with async_session() as db:
+        assert await resolve_chat_session_id(db, guest) is None
+        # A fresh session, not the cached id of the archived one
+        assert await db.get(ChatSession, await resolve_chat_session_id(db, current_user)) is not None
+
+
+async def test_turn_for_a_session_deleted_on_another_replica_is_kept(engine, async_session, tmp_path, monkeypatch):
+    # Enforce foreign keys like Postgres does
+    await engine.dispose()
+    event.listen(engine.sync_engine, "connect", lambda connection, _: connection.execute("PRAGMA foreign_keys=ON"))
+    writer = ChatMessageWriter(session_factory=async_session, spill_file=str(tmp_path / "pending.jsonl"),
+                               resolve_orphan=reassign_orphaned_turn)
+    monkeypatch.setattr(active_sessions, "chat_writer", writer)
+    replica_a, replica_b = TTLCache(maxsize=100, ttl=60), TTLCache(maxsize=100, ttl=60)
+
+    current_user = await add_user(async_session)
+    monkeypatch.setattr(active_sessions, "active_session_cache", replica_b)
+    async with async_session() as db:
+        deleted_id = await resolve_chat_session_id(db, current_user)
+        # Keeps SQLite from handing the deleted id to the next session
+        db.add(ChatSession(session_id="other-guest"))
+        await db.commit()
+
+    monkeypatch.setattr(active_sessions, "active_session_cache", replica_a)
+    async with async_session() as db:
+        chat_session = await db.get(ChatSession, deleted_id)
+        await db.delete(chat_session)
+        await db.commit()
+        active_sessions.invalidate_active_session(chat_session)
+
+    monkeypatch.setattr(active_sessions, "active_session_cache", replica_b)
+    async with async_session() as db:
+        assert await resolve_chat_session_id(db, current_user) == deleted_id
+        await save_chat_turn(db, current_user, deleted_id, make_turn("Hello", "Hi"))
+    assert await writer.flush() == 1
+
+    async with async_session() as db:
+        message = (await db.execute(select(ChatMessage))).scalars().one()
+        chat_session = await db.get(ChatSession, message.session_id)
+    assert chat_session.user_id == current_user["user_id"]
+    assert replica_b.get(("user", current_user["user_id"]))[0] == chat_session.id
+    assert writer.stats["reassigned"] == 1 and writer.stats["dropped"] == 0
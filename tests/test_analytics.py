@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from backend import analytics
+from backend.database import ChatSession, ChatMessage
+
+pytestmark = pytest.mark.anyio
+
+
+def add_message(db, session_id, created_at, **fields):
+    db.add(ChatMessage(session_id=session_id, message="q", response="a", message_type="conversation",
+                       created_at=created_at, **fields))
+
+
+async def test_analytics_buckets_mixes_and_incremental_refresh(engine, async_session, monkeypatch):
+    monkeypatch.setattr(analytics, "closed_buckets", {})
+    now = datetime.utcnow()
+    hour = analytics.floor_to_interval(now, "hour")
+
+    async with async_session() as db:
+        db.add_all([
+            ChatSession(id=1, user_id=7, created_at=hour - timedelta(hours=3)),
+            ChatSession(id=2, session_id="guest-1", created_at=hour - timedelta(hours=3)),
+        ])
+        add_message(db, 1, hour - timedelta(hours=3), language="en", complexity="simple",
+                    provider="claude", cached=True, latency_ms=10)
+        add_message(db, 2, hour - timedelta(hours=3, minutes=-5), language="ku", complexity="detailed",
+                    provider="claude", cached=False, input_tokens=100, output_tokens=50, latency_ms=30)
+        add_message(db, 2, hour - timedelta(hours=1), language="ku", complexity="medium", provider="openai")
+        await db.commit()
+
+    async with async_session() as db:
+        result = await analytics.get_chat_analytics(db, "hour", start=hour - timedelta(hours=4), end=now)
+    assert [point["messages"] for point in result["series"]] == [0, 2, 0, 1, 0]
+    three_hours_ago = result["series"][1]
+    assert three_hours_ago["guest_messages"] == 1 and three_hours_ago["registered_messages"] == 1
+    assert three_hours_ago["avg_latency_ms"] == 20.0
+    assert three_hours_ago["new_sessions"] == 2 and three_hours_ago["new_guest_sessions"] == 1
+    assert result["totals"]["guest_share"] == round(2 / 3, 4)
+    assert result["language_mix"] == {"ku": 2, "en": 1}
+    assert result["complexity_mix"] == {"simple": 1, "detailed": 1, "medium": 1}
+    assert result["totals"]["input_tokens"] == 100
+
+    # A later refresh only queries from the end of the closed buckets
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, params, *args: statements.append(params))
+    async with async_session() as db:
+        add_message(db, 1, now, language="en")
+        await db.commit()
+        statements.clear()
+        refreshed = await analytics.get_chat_analytics(db, "hour", start=hour - timedelta(hours=4), end=now,
+                                                       refresh=True)
+    assert refreshed["series"][-1]["messages"] == 1
+    assert refreshed["series"][1]["messages"] == 2
+    assert len(statements) == 2
+    # Both queries start at the open bucket; closed ones come from the cache
+    bounds = [value for params in statements for value in params if isinstance(value, str) and value[:1].isdigit()]
+    assert min(bounds) == hour.strftime("%Y-%m-%d %H:%M:%S.%f")
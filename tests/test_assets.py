@@ -0,0 +1,96 @@
+import gzip
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import assets
+from backend.assets import AssetStaticFiles, accepted_encodings, asset_url, build_assets
+
+
+def make_static(tmp_path):
+    static = tmp_path / "static"
+    (static / "images").mkdir(parents=True)
+    (static / "style.css").write_text("body { color: #333; }\n" * 200)
+    (static / "images" / "logo.png").write_bytes(b"\x89PNG fake")
+    return static
+
+
+def test_build_fingerprints_and_precompresses(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, "manifest", {})
+    static = make_static(tmp_path)
+    built = build_assets(str(static))
+
+    css = built["style.css"]
+    assert css.startswith("dist/style.") and css.endswith(".css")
+    assert gzip.decompress((static / (css + ".gz")).read_bytes()) == (static / "style.css").read_bytes()
+    # Images are already compressed
+    assert not os.path.exists(static / (built["images/logo.png"] + ".gz"))
+    assert asset_url("style.css") == f"/static/{css}"
+    assert asset_url("missing.js") == "/static/missing.js"
+
+    # Rebuilding is stable; a content change gives a new URL
+    assert build_assets(str(static)) == built
+    (static / "style.css").write_text("body { color: red; }")
+    assert build_assets(str(static))["style.css"] != css
+
+
+def test_stylesheet_urls_point_at_fingerprinted_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, "manifest", {})
+    static = make_static(tmp_path)
+    (static / "css").mkdir()
+    (static / "css" / "home.css").write_text(
+        ".logo { background: url('/static/images/logo.png'); }\n"
+        ".hero { background: url(../images/logo.png?v=1); }\n"
+        ".grain { background: url('data:image/svg+xml,<svg fill=\"url(%23g)\"/>'); }\n"
+        ".gone { background: url(\"/static/images/missing.png\"); }\n"
+    )
+    built = build_assets(str(static))
+    logo = f"/static/{built['images/logo.png']}"
+    css = (static / built["css/home.css"]).read_text()
+    assert css.splitlines() == [
+        f".logo {{ background: url('{logo}'); }}",
+        f".hero {{ background: url('{logo}?v=1'); }}",
+        ".grain { background: url('data:image/svg+xml,<svg fill=\"url(%23g)\"/>'); }",
+        '.gone { background: url("/static/images/missing.png"); }',
+    ]
+    assert gzip.decompress((static / (built["css/home.css"] + ".gz")).read_bytes()).decode() == css
+
+    # A new image gives the stylesheet that uses it a new URL too
+    (static / "images" / "logo.png").write_bytes(b"\x89PNG other")
+    assert build_assets(str(static))["css/home.css"] != built["css/home.css"]
+
+
+def test_static_files_serve_immutable_precompressed_variants(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, "manifest", {})
+    static = make_static(tmp_path)
+    css = build_assets(str(static))["style.css"]
+    app = FastAPI()
+    app.mount("/static", AssetStaticFiles(directory=str(static)), name="static")
+    client = TestClient(app)
+
+    response = client.get(f"/static/{css}", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.headers["cache-control"] == assets.IMMUTABLE_CACHE_CONTROL
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == (static / "style.css").read_text()
+
+    revalidated = client.get(f"/static/{css}", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]
+    })
+    assert revalidated.status_code == 304
+
+    identity = client.get(f"/static/{css}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["etag"] != response.headers["etag"]
+
+    plain = client.get("/static/style.css")
+    assert plain.headers["cache-control"] == "no-cache"
+
+
+def test_accepted_encodings_honours_q_zero():
+    assert accepted_encodings("gzip, deflate, br;q=0") == {"gzip", "deflate"}
+    assert accepted_encodings("br;q=0.5, gzip;q=0.0") == {"br"}
+    assert accepted_encodings(None) == set()
@@ -0,0 +1,67 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from backend import auth
+from backend.database import User
+
+pytestmark = pytest.mark.anyio
+
+
+def bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+async def test_principal_is_cached_until_invalidated(engine, async_session, count_queries, monkeypatch):
+    monkeypatch.setattr(auth, "principal_cache", auth.TTLCache(maxsize=100, ttl=60))
+
+    async with async_session() as db:
+        user = User(email="student@uos.edu.krd", full_name="Student", hashed_password="x", user_type="user")
+        db.add(user)
+        await db.commit()
+    token = auth.create_access_token({"sub": user.email, "user_type": "user", "user_id": user.id})
+    other_token = auth.create_access_token({"sub": user.email, "user_type": "user", "user_id": user.id,
+                                            "device": "phone"})
+
+    statements = count_queries()
+    async with async_session() as db:
+        first = await auth.get_current_user(bearer(token), db)
+        second = await auth.get_current_user(bearer(token), db)
+        await auth.get_current_user(bearer(other_token), db)
+    assert first == second == {"user_type": "user", "email": user.email, "user_id": user.id, "full_name": "Student"}
+    assert len(statements) == 2
+    assert len(auth.principal_cache) == 1
+
+    async with async_session() as db:
+        (await db.get(User, user.id)).is_active = False
+        await db.commit()
+    # Still served from cache until the change is announced
+    async with async_session() as db:
+        assert await auth.get_current_user(bearer(token), db) == first
+    auth.invalidate_principal(user.id)
+    for stale in (token, other_token):
+        async with async_session() as db:
+            with pytest.raises(HTTPException) as exc:
+                await auth.get_current_user(bearer(stale), db)
+        assert exc.value.status_code == 403
+
+
+async def test_claims_dependency_skips_lookup_only_when_trusted(engine, async_session, count_queries, monkeypatch):
+    token = auth.create_access_token({"sub": "a@uos.edu.krd", "user_type": "user", "user_id": 42, "full_name": "A"})
+
+    monkeypatch.setattr(auth, "AUTH_TRUST_SIGNED_CLAIMS", True)
+    statements = count_queries()
+    async with async_session() as db:
+        assert await auth.get_current_user_from_claims(bearer(token), db) == {
+            "user_type": "user", "email": "a@uos.edu.krd", "user_id": 42, "full_name": "A"
+        }
+        with pytest.raises(HTTPException):
+            await auth.get_current_user_from_claims(bearer(token + "x"), db)
+    assert statements == []
+
+    # Without the option the user must exist in the database
+    monkeypatch.setattr(auth, "AUTH_TRUST_SIGNED_CLAIMS", False)
+    async with async_session() as db:
+        with pytest.raises(HTTPException) as exc:
+            await auth.get_current_user_from_claims(bearer(token), db)
+    assert exc.value.status_code == 401
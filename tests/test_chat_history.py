@@ -0,0 +1,48 @@
+import pytest
+
+from backend.database import get_chat_sessions_page
+from backend.pagination import encode_cursor, decode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_chat_history_page_uses_constant_queries(async_session, seed, count_queries):
+    await seed()
+    statements = count_queries()
+    async with async_session() as db:
+        sessions = await get_chat_sessions_page(db, offset=0, limit=50)
+        # Touch everything the admin endpoint serializes
+        for session in sessions:
+            _ = session.user.email if session.user else session.session_id
+            _ = [msg.message for msg in session.messages]
+
+    assert len(sessions) == 20
+    assert all(len(s.messages) == 3 for s in sessions)
+    assert len(statements) <= 2
+
+
+async def test_user_chat_history_filters_and_orders(async_session, seed):
+    user_id = await seed()
+    async with async_session() as db:
+        sessions = await get_chat_sessions_page(db, user_id=user_id, offset=0, limit=5)
+
+    assert len(sessions) == 5
+    assert [s.created_at for s in sessions] == sorted((s.created_at for s in sessions), reverse=True)
+    assert all(s.user_id is not None for s in sessions)
+    assert [m.message for m in sessions[0].messages] == ["q0", "q1", "q2"]
+
+
+async def test_keyset_pages_cover_every_session_once(async_session, seed):
+    await seed(sessions=23)
+    seen, after = [], None
+    async with async_session() as db:
+        while True:
+            page = await get_chat_sessions_page(db, limit=5, after=after)
+            if not page:
+                break
+            seen.extend(s.id for s in page)
+            after = decode_cursor(encode_cursor(page[-1].created_at, page[-1].id))
+        everything = await get_chat_sessions_page(db, limit=100)
+
+    assert seen == [s.id for s in everything]
+    assert len(seen) == 23
@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import select
+
+from backend.chat_writer import ChatMessageWriter
+from backend.database import ChatSession, ChatMessage
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_flush_writes_messages_with_and_without_metadata(async_session, tmp_path):
+    async with async_session() as db:
+        db.add(ChatSession(session_id="guest-1"))
+        await db.commit()
+
+    writer = ChatMessageWriter(session_factory=async_session, batch_size=10,
+                               spill_file=str(tmp_path / "spill.jsonl"))
+    writer.enqueue(session_id=1, message="hi", response="hello", provider="claude", cached=True,
+                   language="en", complexity="simple", input_tokens=0, output_tokens=0, latency_ms=3)
+    writer.enqueue(session_id=1, message="fallback", response="answer", provider="openai")
+    writer.enqueue(session_id=1, message="legacy", response="answer")
+    assert await writer.flush() == 3
+
+    async with async_session() as db:
+        messages = (await db.execute(select(ChatMessage).order_by(ChatMessage.id))).scalars().all()
+    assert [(m.provider, m.cached, m.latency_ms) for m in messages] == [
+        ("claude", True, 3), ("openai", None, None), (None, None, None)
+    ]
+
+
+def failing_until(async_session, healthy):
+    def session_factory():
+        if not healthy:
+            raise ConnectionError("database unavailable")
+        return async_session()
+    return session_factory
+
+
+async def saved_messages(async_session):
+    async with async_session() as db:
+        return (await db.execute(select(ChatMessage.message).order_by(ChatMessage.id))).scalars().all()
+
+
+async def test_failed_flush_keeps_turns_queued_and_retries(async_session, tmp_path):
+    journal = tmp_path / "spill.jsonl"
+
+    async with async_session() as db:
+        db.add(ChatSession(session_id="guest-1"))
+        await db.commit()
+    healthy = []
+    writer = ChatMessageWriter(session_factory=failing_until(async_session, healthy), batch_size=2,
+                               spill_file=str(journal))
+    for i in range(3):
+        writer.enqueue(session_id=1, message=f"q{i}", response="a")
+    assert await writer.flush() == 0
+    assert writer.get_stats()["failed_flushes"] == 1
+    assert len(writer.pending) == 3
+    assert len(journal.read_text().splitlines()) == 3
+
+    healthy.append(True)
+    assert await writer.flush() == 3
+    assert await saved_messages(async_session) == ["q0", "q1", "q2"]
+    assert journal.read_text() == ""
+
+
+async def test_unsaved_turns_survive_stop_and_are_reloaded_on_start(async_session, tmp_path):
+    journal = tmp_path / "spill.jsonl"
+
+    async with async_session() as db:
+        db.add(ChatSession(session_id="guest-1"))
+        await db.commit()
+    writer = ChatMessageWriter(session_factory=failing_until(async_session, []), flush_interval=60,
+                               spill_file=str(journal))
+    await writer.start()
+    writer.enqueue(session_id=1, message="before restart", response="a", provider="claude")
+    await writer.stop()
+    assert len(journal.read_text().splitlines()) == 1
+
+    restarted = ChatMessageWriter(session_factory=async_session, flush_interval=60, spill_file=str(journal))
+    await restarted.start()
+    assert len(restarted.pending) == 1
+    await restarted.stop()
+    assert await saved_messages(async_session) == ["before restart"]
+    assert journal.read_text() == ""
+
+
+async def test_queue_is_capped_and_overflow_is_read_back_from_the_journal(async_session, tmp_path):
+    journal = tmp_path / "spill.jsonl"
+
+    async with async_session() as db:
+        db.add(ChatSession(session_id="guest-1"))
+        await db.commit()
+    healthy = []
+    writer = ChatMessageWriter(session_factory=failing_until(async_session, healthy), batch_size=2,
+                               max_pending=3, spill_file=str(journal))
+    for i in range(7):
+        writer.enqueue(session_id=1, message=f"q{i}", response="a")
+    assert len(writer.pending) == 3
+    assert writer.get_stats()["journaled_only"] == 4
+    assert await writer.flush() == 0
+
+    healthy.append(True)
+    assert await writer.flush() == 7
+    assert await saved_messages(async_session) == [f"q{i}" for i in range(7)]
+    assert writer.get_stats()["journaled_only"] == 0
+    assert journal.read_text() == ""
@@ -0,0 +1,118 @@
+import socketserver
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from backend import email_outbox
+from backend.database import EmailOutbox
+from backend.email_outbox import SENDER_EMAIL, SMTPConnection, deliver_due_emails, enqueue_emails
+from backend.email_service import FEEDBACK_RECIPIENT, create_team_notification, create_user_auto_reply
+
+pytestmark = pytest.mark.anyio
+
+
+async def queue_feedback_emails(db, name, email, category, subject, message):
+    await enqueue_emails(db, [
+        (SENDER_EMAIL, FEEDBACK_RECIPIENT,
+         create_team_notification(SENDER_EMAIL, FEEDBACK_RECIPIENT, name, email, category, subject, message)),
+        (SENDER_EMAIL, email, create_user_auto_reply(SENDER_EMAIL, email, name, category, subject)),
+    ])
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accepts every message and records it"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 stand-in ready")
+        envelope = {}
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            command = line[:4].upper()
+            if not line or command == "QUIT":
+                self.reply("221 bye")
+                return
+            if command == "EHLO":
+                self.reply("250 stand-in")
+            elif command == "MAIL":
+                envelope = {"from": line.split(":", 1)[1].strip("<> ")}
+                self.reply("250 ok")
+            elif command == "RCPT":
+                envelope["to"] = line.split(":", 1)[1].strip("<> ")
+                self.reply("250 ok")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while (chunk := self.rfile.readline()) != b".\r\n":
+                    data.append(chunk)
+                self.server.messages.append({**envelope, "data": b"".join(data)})
+                self.reply("250 queued")
+            else:
+                self.reply("250 ok")
+
+
+def start_stand_in():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StandInSMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def test_feedback_mail_is_queued_then_delivered_over_one_connection(async_session, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_SEND_INTERVAL", 0)
+    server = start_stand_in()
+    connection = SMTPConnection(host="127.0.0.1", port=server.server_address[1], starttls=False, password=None)
+    try:
+        async with async_session() as db:
+            await queue_feedback_emails(db, "Aso", "aso@uos.edu.krd", "bug", "Login", "Cannot log in")
+            await queue_feedback_emails(db, "Sara", "sara@uos.edu.krd", "idea", "Dark mode", "Please")
+        assert server.messages == []
+
+        assert await deliver_due_emails(connection, session_factory=async_session) == 4
+        assert await deliver_due_emails(connection, session_factory=async_session) == 0
+        async with async_session() as db:
+            rows = (await db.execute(select(EmailOutbox).order_by(EmailOutbox.id))).scalars().all()
+        assert [(row.status, row.attempts) for row in rows] == [("sent", 1)] * 4
+    finally:
+        connection.close()
+        server.shutdown()
+    assert server.connections == 1
+    assert [m["to"] for m in server.messages] == [
+        "hawaall.assistant@gmail.com", "aso@uos.edu.krd", "hawaall.assistant@gmail.com", "sara@uos.edu.krd"
+    ]
+    assert b"Cannot log in" in server.messages[0]["data"]
+
+
+async def test_failed_delivery_backs_off_then_gives_up(async_session, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(email_outbox, "EMAIL_SEND_INTERVAL", 0)
+    server = start_stand_in()
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    connection = SMTPConnection(host="127.0.0.1", port=port, starttls=False, password=None)
+
+    async with async_session() as db:
+        await queue_feedback_emails(db, "Aso", "aso@uos.edu.krd", "bug", "Login", "Cannot log in")
+    assert await deliver_due_emails(connection, session_factory=async_session) == 2
+    # Nothing is due until the backoff has passed
+    assert await deliver_due_emails(connection, session_factory=async_session) == 0
+    async with async_session() as db:
+        rows = (await db.execute(select(EmailOutbox))).scalars().all()
+        assert all(row.status == "pending" and row.attempts == 1 for row in rows)
+        assert all(row.next_attempt_at > datetime.utcnow() and row.last_error for row in rows)
+        for row in rows:
+            row.next_attempt_at = datetime.utcnow()
+        await db.commit()
+
+    assert await deliver_due_emails(connection, session_factory=async_session) == 2
+    async with async_session() as db:
+        rows = (await db.execute(select(EmailOutbox))).scalars().all()
+    assert [(row.status, row.attempts) for row in rows] == [("failed", 2)] * 2
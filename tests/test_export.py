@@ -0,0 +1,59 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from backend import export
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+async def test_export_streams_in_batches_with_filters(async_session, seed, monkeypatch):
+    monkeypatch.setattr(export, "AsyncSessionLocal", async_session)
+    user_id = await seed()
+
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 7)
+    batches = await collect(export.iter_export_batches())
+    # 20 sessions x 3 messages, fetched 7 rows at a time
+    assert [len(batch) for batch in batches] == [7] * 8 + [4]
+
+    lines = "".join(await collect(export.stream_ndjson(export.iter_export_batches(user_id=user_id)))).splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert len(rows) == 30
+    assert {row["user_email"] for row in rows} == {"student@uos.edu.krd"}
+    assert rows == sorted(rows, key=lambda row: (row["created_at"], row["message_id"]))
+
+    text = "".join(await collect(export.stream_csv(export.iter_export_batches(
+        start=datetime(2025, 1, 1, 0, 5), end=datetime(2025, 1, 1, 0, 7)
+    ))))
+    records = list(csv.DictReader(io.StringIO(text)))
+    assert len(records) == 6
+    assert list(records[0]) == export.EXPORT_FIELDS
+    assert records[0]["guest_session_id"] == ""
+
+    empty = "".join(await collect(export.stream_csv(export.iter_export_batches(user_id=999))))
+    assert empty.strip() == ",".join(export.EXPORT_FIELDS)
+
+
+def test_csv_neutralizes_formulas_in_text_cells():
+    async def batches():
+        yield [{**dict.fromkeys(export.EXPORT_FIELDS), "message": "=HYPERLINK(\"http://x\")",
+                "response": "-2+3", "user_email": "-a@uos.edu.krd", "input_tokens": -1}]
+        yield [{**dict.fromkeys(export.EXPORT_FIELDS), "message": "Hello", "response": "@SUM(A1)"}]
+
+    async def scenario():
+        return "".join(await collect(export.stream_csv(batches())))
+
+    records = list(csv.DictReader(io.StringIO(asyncio.run(scenario()))))
+    assert [(r["message"], r["response"]) for r in records] == [
+        ("'=HYPERLINK(\"http://x\")", "'-2+3"), ("Hello", "'@SUM(A1)")
+    ]
+    assert (records[0]["user_email"], records[0]["input_tokens"]) == ("'-a@uos.edu.krd", "-1")
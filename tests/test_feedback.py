@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from backend import feedback as feedback_module
+from backend.database import EmailOutbox, Feedback
+from backend.email_service import FEEDBACK_RECIPIENT
+from backend.feedback import list_feedback, save_feedback, send_feedback_digest
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_submissions_are_stored_and_reported_in_one_digest(async_session, monkeypatch):
+    monkeypatch.setattr(feedback_module, "FEEDBACK_DIGEST_MAX_ITEMS", 2)
+
+    async with async_session() as db:
+        await save_feedback(db, "Aso", "aso@uos.edu.krd", "bug", "Login", "Cannot log in")
+        await save_feedback(db, "Sara", "sara@uos.edu.krd", "suggestion", "Dark mode", "Please add it")
+        await save_feedback(db, "Rebin", "rebin@uos.edu.krd", "other", "Thanks", "Great work")
+        outbox = (await db.execute(select(EmailOutbox.recipient))).scalars().all()
+    # Only the auto-replies go out straight away
+    assert outbox == ["aso@uos.edu.krd", "sara@uos.edu.krd", "rebin@uos.edu.krd"]
+
+    assert await send_feedback_digest(async_session) == 2
+    assert await send_feedback_digest(async_session) == 1
+    assert await send_feedback_digest(async_session) == 0
+
+    async with async_session() as db:
+        digests = (await db.execute(
+            select(EmailOutbox).where(EmailOutbox.recipient == FEEDBACK_RECIPIENT).order_by(EmailOutbox.id)
+        )).scalars().all()
+        assert await db.scalar(select(Feedback.id).where(Feedback.digested_at.is_(None))) is None
+        listed = await list_feedback(db, limit=10, category="bug")
+    assert [d.subject for d in digests] == [
+        "Haawall Feedback - 2 new submissions (Bug, Suggestion)", "Haawall Feedback - Other: Thanks"
+    ]
+    assert "Cannot log in" in digests[0].body and "Please add it" in digests[0].body
+    assert [item.email for item in listed] == ["aso@uos.edu.krd"]
+
+
+async def test_concurrent_digests_report_each_submission_once(async_session):
+    async with async_session() as db:
+        await save_feedback(db, "Aso", "aso@uos.edu.krd", "bug", "Login", "Cannot log in")
+        await save_feedback(db, "Sara", "sara@uos.edu.krd", "suggestion", "Dark mode", "Please add it")
+
+    # Two replicas waking up at the same time
+    counts = await asyncio.gather(send_feedback_digest(async_session), send_feedback_digest(async_session))
+
+    assert sorted(counts) == [0, 2]
+    async with async_session() as db:
+        digests = (await db.execute(
+            select(EmailOutbox).where(EmailOutbox.recipient == FEEDBACK_RECIPIENT)
+        )).scalars().all()
+    assert len(digests) == 1
@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import select
+
+from backend import active_sessions, guest_store as guest_store_module
+from backend.auth import create_guest_token
+from backend.cache import TTLCache
+from backend.chat_writer import ChatMessageWriter
+from backend.database import ChatSession, ChatMessage, User
+from backend.guest_store import dump_guest_state, load_guest_state, make_turn, persist_guest_conversation
+
+
+pytestmark = pytest.mark.anyio
+
+
+def test_state_only_opens_for_its_own_guest(monkeypatch):
+    first = make_turn("q1", "a1", provider="claude")
+    state = dump_guest_state("guest-1", [first])
+    assert load_guest_state(state, "guest-1") == [first]
+    assert load_guest_state(state, "guest-2") == []
+    assert load_guest_state(state[:-2] + "xx", "guest-1") == []
+    assert load_guest_state(create_guest_token("guest-1"), "guest-1") == []
+
+    monkeypatch.setattr(guest_store_module, "GUEST_STATE_TTL", -1)
+    assert load_guest_state(dump_guest_state("guest-1", [first]), "guest-1") == []
+
+
+async def test_persist_writes_buffered_turns_under_one_session(async_session, tmp_path, monkeypatch):
+    writer = ChatMessageWriter(session_factory=async_session, spill_file=str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(guest_store_module, "chat_writer", writer)
+
+    first = make_turn("q1", "a1", provider="claude")
+    first["created_at"] = datetime.utcnow() - timedelta(minutes=5)
+    turns = [first, make_turn("q2", "a2", provider="openai")]
+
+    async with async_session() as db:
+        assert await db.scalar(select(ChatSession.id)) is None
+        chat_session = await persist_guest_conversation(db, "guest-1", turns, user_id=None)
+        assert await persist_guest_conversation(db, "guest-1", []) is None
+    assert chat_session.session_id == "guest-1"
+    assert chat_session.created_at == first["created_at"]
+
+    await writer.flush()
+    async with async_session() as db:
+        messages = (await db.execute(select(ChatMessage).order_by(ChatMessage.id))).scalars().all()
+    assert [(m.session_id, m.message, m.provider) for m in messages] == [
+        (chat_session.id, "q1", "claude"), (chat_session.id, "q2", "openai")
+    ]
+    assert messages[0].created_at == first["created_at"]
+
+
+class Replica:
+    """The per-process state of one app instance"""
+
+    def __init__(self):
+        self.cache = TTLCache(maxsize=100, ttl=60)
+
+    def activate(self, monkeypatch):
+        monkeypatch.setattr(active_sessions, "active_session_cache", self.cache)
+
+
+async def chat(async_session, current_user, message, guest_state=None):
+    async with async_session() as db:
+        chat_session_id = await active_sessions.resolve_chat_session_id(db, current_user, guest_state)
+        return await active_sessions.save_chat_turn(
+            db, current_user, chat_session_id, make_turn(message, "answer"), guest_state
+        )
+
+
+def use_writer(monkeypatch, async_session, tmp_path):
+    writer = ChatMessageWriter(session_factory=async_session, spill_file=str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(guest_store_module, "chat_writer", writer)
+    monkeypatch.setattr(active_sessions, "chat_writer", writer)
+    return writer
+
+
+async def messages_by_session(async_session):
+    async with async_session() as db:
+        rows = (await db.execute(select(ChatMessage.session_id, ChatMessage.message).order_by(ChatMessage.id))).all()
+    return [tuple(row) for row in rows]
+
+
+async def test_guest_turns_spread_across_replicas_share_one_session(async_session, count_queries,
+                                                                    tmp_path, monkeypatch):
+    monkeypatch.setattr(active_sessions, "GUEST_PERSIST_AFTER", 3)
+    guest = {"email": "guest_guest-1", "user_type": "guest", "user_id": None}
+    replicas = [Replica(), Replica()]
+
+    writer = use_writer(monkeypatch, async_session, tmp_path)
+    # No sticky sessions: turns alternate between the two instances
+    replicas[0].activate(monkeypatch)
+    guest_state = await chat(async_session, guest, "q0")
+    statements = count_queries()
+    for i in range(1, 5):
+        replicas[i % 2].activate(monkeypatch)
+        guest_state = await chat(async_session, guest, f"q{i}", guest_state)
+        if i == 1:
+            # The state alone tells a replica the conversation has no row yet
+            assert guest_state and statements == []
+    assert guest_state is None
+    await writer.flush()
+
+    async with async_session() as db:
+        assert len((await db.execute(select(ChatSession.id))).all()) == 1
+    assert await messages_by_session(async_session) == [(1, f"q{i}") for i in range(5)]
+
+
+async def test_oversized_state_is_persisted_early(async_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(active_sessions, "GUEST_PERSIST_AFTER", 3)
+    monkeypatch.setattr(active_sessions, "GUEST_STATE_MAX_BYTES", 100)
+    Replica().activate(monkeypatch)
+    writer = use_writer(monkeypatch, async_session, tmp_path)
+
+    guest = {"email": "guest_guest-1", "user_type": "guest", "user_id": None}
+    assert await chat(async_session, guest, "q0") is None
+    await writer.flush()
+    assert await messages_by_session(async_session) == [(1, "q0")]
+
+
+async def test_sign_up_claims_turns_held_in_the_state(async_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(active_sessions, "GUEST_PERSIST_AFTER", 3)
+    token = create_guest_token("guest-1")
+    guest = {"email": "guest_guest-1", "user_type": "guest", "user_id": None}
+    Replica().activate(monkeypatch)
+
+    writer = use_writer(monkeypatch, async_session, tmp_path)
+    async with async_session() as db:
+        user = User(email="student@uos.edu.krd", full_name="Student", hashed_password="x")
+        db.add(user)
+        await db.commit()
+    guest_state = await chat(async_session, guest, "before sign-up")
+    # Signing up on a replica that never saw the guest
+    Replica().activate(monkeypatch)
+    async with async_session() as db:
+        await active_sessions.claim_guest_conversation(
+            db, HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), user.id, guest_state
+        )
+    await writer.flush()
+
+    async with async_session() as db:
+        owners = (await db.execute(select(ChatSession.id, ChatSession.user_id))).all()
+    assert [tuple(row) for row in owners] == [(1, user.id)]
+    assert await messages_by_session(async_session) == [(1, "before sign-up")]
+
+
+async def test_claimed_session_no_longer_takes_guest_turns(async_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(active_sessions, "GUEST_PERSIST_AFTER", 1)
+    token = create_guest_token("guest-1")
+    guest = {"email": "guest_guest-1", "user_type": "guest", "user_id": None}
+    Replica().activate(monkeypatch)
+
+    writer = use_writer(monkeypatch, async_session, tmp_path)
+    async with async_session() as db:
+        user = User(email="student@uos.edu.krd", full_name="Student", hashed_password="x")
+        db.add(user)
+        await db.commit()
+    await chat(async_session, guest, "before sign-up")
+    async with async_session() as db:
+        await active_sessions.claim_guest_conversation(
+            db, HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), user.id
+        )
+    # The old guest token is still around in another tab
+    await chat(async_session, guest, "stale tab")
+    await writer.flush()
+
+    async with async_session() as db:
+        owners = (await db.execute(select(ChatSession.id, ChatSession.user_id).order_by(ChatSession.id))).all()
+    assert [tuple(row) for row in owners] == [(1, user.id), (2, None)]
+    assert await messages_by_session(async_session) == [(1, "before sign-up"), (2, "stale tab")]
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import select
+
+from backend import info_import
+from backend.database import Info
+
+
+pytestmark = pytest.mark.anyio
+
+
+def test_parse_validates_rows_and_keeps_last_duplicate():
+    content = (
+        "category,key,value\n"
+        "admissions,deadline,June 1\n"
+        "admissions,,missing key\n"
+        "admissions,deadline,June 15\n"
+    ).encode()
+    rows, errors = info_import.parse_info_file(content, "catalog.csv")
+    assert rows == [{"category": "admissions", "key": "deadline", "value": "June 15"}]
+    assert errors == ["line 3: missing key"]
+
+    rows, errors = info_import.parse_info_file(b'{"category": "a", "key": "b", "value": "c"}\nnot json\n[1]\n', "x.jsonl")
+    assert len(rows) == 1
+    assert [error.split(":")[0] for error in errors] == ["line 2", "line 3"]
+
+
+async def test_import_upserts_in_chunks_and_clears_cache_once(async_session, monkeypatch):
+    embedded, cleared, progress = [], [], []
+    monkeypatch.setattr(info_import, "embed_texts_batch", lambda texts: embedded.append(texts) or len(texts))
+    monkeypatch.setattr(info_import, "clear_cache", lambda: cleared.append(True))
+
+    monkeypatch.setattr(info_import, "AsyncSessionLocal", async_session)
+    async with async_session() as db:
+        db.add_all([
+            Info(category="fees", key="tuition", value="old"),
+            Info(category="fees", key="housing", value="same"),
+        ])
+        await db.commit()
+
+    rows = [{"category": "fees", "key": "tuition", "value": "new"},
+            {"category": "fees", "key": "housing", "value": "same"}]
+    rows += [{"category": "programs", "key": f"program {i}", "value": f"details {i}"} for i in range(5)]
+    summary = await info_import.import_info_rows(rows, chunk_size=3, progress=lambda *args: progress.append(args))
+    assert summary == {"inserted": 5, "updated": 1, "unchanged": 1, "embedded": 6}
+    assert progress == [(3, 7), (6, 7), (7, 7)]
+    assert embedded[0] == ["tuition: new", "program 0: details 0"]
+
+    async with async_session() as db:
+        records = (await db.execute(select(Info))).scalars().all()
+    assert len(records) == 7
+    assert {r.key: r.value for r in records}["tuition"] == "new"
+
+    content = b"category,key,value\nfees,tuition,newer\n"
+    summary = await info_import.import_info_file(content, "catalog.csv", progress=lambda *args: None)
+    assert summary["updated"] == 1 and summary["invalid_rows"] == 0
+    assert cleared == [True]
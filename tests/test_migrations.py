@@ -0,0 +1,37 @@
+from sqlalchemy import create_engine, inspect, text
+
+from backend.database import Base
+from backend.migrations import MIGRATIONS, run_migrations, get_applied_versions, check_hot_query_plans
+
+
+def legacy_engine(tmp_path):
+    """Database created before the composite indexes existed"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in ("ix_chat_sessions_user_id_created_at", "ix_chat_sessions_created_at_id",
+                     "ix_chat_messages_session_id_created_at"):
+            conn.execute(text(f"DROP INDEX {name}"))
+    return engine
+
+
+def test_migrations_add_indexes_to_existing_database(tmp_path):
+    engine = legacy_engine(tmp_path)
+
+    assert run_migrations(engine) == [version for version, _, _ in MIGRATIONS]
+    assert run_migrations(engine) == []
+    assert get_applied_versions(engine) == [version for version, _, _ in MIGRATIONS]
+
+    session_indexes = {ix["name"] for ix in inspect(engine).get_indexes("chat_sessions")}
+    message_indexes = {ix["name"] for ix in inspect(engine).get_indexes("chat_messages")}
+    assert "ix_chat_sessions_user_id_created_at" in session_indexes
+    assert "ix_chat_messages_session_id_created_at" in message_indexes
+
+
+def test_hot_queries_use_composite_indexes(tmp_path):
+    engine = legacy_engine(tmp_path)
+    assert not all(r["uses_index"] for r in check_hot_query_plans(engine).values())
+
+    run_migrations(engine)
+    report = check_hot_query_plans(engine)
+    assert all(r["uses_index"] for r in report.values()), report
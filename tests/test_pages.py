@@ -0,0 +1,57 @@
+import gzip
+
+from fastapi import FastAPI, Request
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+
+from backend.pages import PageCache
+
+
+def make_client(tmp_path):
+    (tmp_path / "about.html").write_text("<h1>{{ title() }}</h1>" + "<p>About Haawall</p>" * 100)
+    templates = Jinja2Templates(directory=str(tmp_path))
+    renders = []
+    templates.env.globals["title"] = lambda: renders.append(1) or "About"
+    cache = PageCache(templates, enabled=True)
+    app = FastAPI()
+
+    @app.get("/about")
+    async def about(request: Request):
+        return cache.response("about.html", request)
+
+    return TestClient(app), cache, renders
+
+
+def test_page_rendered_once_and_revalidated_with_etag(tmp_path):
+    client, cache, renders = make_client(tmp_path)
+    cache.prerender(["about.html"])
+
+    first = client.get("/about", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert first.headers["content-type"].startswith("text/html")
+    assert first.text.startswith("<h1>About</h1>")
+    assert "content-encoding" not in first.headers
+
+    again = client.get("/about", headers={"Accept-Encoding": "identity", "If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert len(renders) == 1
+
+    (tmp_path / "about.html").write_text("changed")
+    cache.clear()
+    assert client.get("/about", headers={"If-None-Match": first.headers["etag"]}).status_code == 200
+
+
+def test_compressed_variant_has_its_own_etag(tmp_path):
+    client, cache, renders = make_client(tmp_path)
+    identity = cache.get("about.html").variants["identity"]
+
+    response = client.get("/about", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == identity  # decoded by the client
+    assert gzip.decompress(cache.get("about.html").variants["gzip"]) == identity
+    assert response.headers["etag"].endswith('-gzip"')
+
+    plain_etag = cache.get("about.html").etags["identity"]
+    assert client.get("/about", headers={"Accept-Encoding": "gzip", "If-None-Match": plain_etag}).status_code == 200
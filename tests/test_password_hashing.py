@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from backend import auth
+from backend.database import User
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_login_rehashes_when_cost_factor_changes(async_session):
+    old_context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4)
+
+    async with async_session() as db:
+        db.add(User(email="student@uos.edu.krd", full_name="Student",
+                    hashed_password=old_context.hash("secret123")))
+        await db.commit()
+
+    async with async_session() as db:
+        assert await auth.authenticate_user(db, "student@uos.edu.krd", "wrong") is False
+        user = await auth.authenticate_user(db, "student@uos.edu.krd", "secret123")
+    assert user
+    assert auth.pwd_context.identify(user.hashed_password) == "bcrypt"
+    assert f"${auth.BCRYPT_ROUNDS:02d}$" in user.hashed_password
+    assert auth.pwd_context.verify("secret123", user.hashed_password)
+
+
+def test_saturated_password_pool_returns_503(monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(auth, "password_slots", asyncio.Semaphore(1))
+        monkeypatch.setattr(auth, "PASSWORD_HASH_QUEUE_TIMEOUT", 0.05)
+        release = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        blocked = asyncio.create_task(auth.run_password_job(
+            lambda: asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+        ))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            await auth.hash_password("secret123")
+        assert exc.value.status_code == 503
+        release.set()
+        await blocked
+        assert auth.pwd_context.verify("secret123", await auth.hash_password("secret123"))
+
+    asyncio.run(scenario())
@@ -0,0 +1,113 @@
+from starlette.requests import Request
+
+from backend.rate_limit import RateLimit, SlidingWindowLimiter, get_client_ip
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_request(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_sliding_window_weights_previous_window():
+    clock = FakeClock(1000.0)
+    limiter = SlidingWindowLimiter(clock=clock)
+    rule = RateLimit(limit=4, window=100)
+
+    results = [limiter.hit("chat:1.2.3.4", rule) for _ in range(5)]
+    assert [r.allowed for r in results] == [True, True, True, True, False]
+    assert [r.remaining for r in results[:4]] == [3, 2, 1, 0]
+    assert results[-1].headers()["Retry-After"] == "100"
+
+    # Halfway through the next window half of the previous count still applies
+    clock.now = 1150.0
+    assert [limiter.hit("chat:1.2.3.4", rule).allowed for _ in range(3)] == [True, True, False]
+    # Other keys and routes are counted separately
+    assert limiter.hit("feedback:1.2.3.4", rule).allowed
+
+
+def test_request_rejected_by_one_scope_is_counted_in_none():
+    limiter = SlidingWindowLimiter(clock=FakeClock(1000.0))
+    user_rule, ip_rule = RateLimit(limit=3, window=100), RateLimit(limit=2, window=100)
+
+    assert all(r.allowed for r in limiter.hit_all([("chat:user:1", user_rule), ("chat:ip:a", ip_rule)]))
+    assert all(r.allowed for r in limiter.hit_all([("chat:user:2", user_rule), ("chat:ip:a", ip_rule)]))
+    # The address is out of requests; user 1 keeps the two it has left
+    rejected = limiter.hit_all([("chat:user:1", user_rule), ("chat:ip:a", ip_rule)])
+    assert [r.allowed for r in rejected] == [True, False]
+    assert rejected[0].remaining == 2
+    assert [r.allowed for r in limiter.hit_all([("chat:user:1", user_rule), ("chat:ip:b", ip_rule)])] == [True, True]
+    assert limiter.hit("chat:user:1", user_rule).allowed
+    assert not limiter.hit("chat:user:1", user_rule).allowed
+    assert limiter.get_stats()["rejected"] == 2
+
+
+def test_memory_stays_bounded_and_idle_keys_expire():
+    clock = FakeClock(0.0)
+    limiter = SlidingWindowLimiter(max_keys=100, clock=clock)
+    rule = RateLimit(limit=5, window=10)
+
+    for i in range(1000):
+        limiter.hit(f"chat:spoofed-{i}", rule)
+    assert len(limiter) == 100
+    assert limiter.get_stats()["evicted"] == 900
+
+    clock.now = 25.0
+    assert limiter.sweep() == 100
+    assert len(limiter) == 0
+
+
+def test_forwarded_for_only_trusted_from_proxies():
+    assert get_client_ip(make_request("203.0.113.9", "1.1.1.1")) == "203.0.113.9"
+    assert get_client_ip(make_request("10.0.0.2", "6.6.6.6, 198.51.100.7")) == "198.51.100.7"
+    assert get_client_ip(make_request("10.0.0.2", "198.51.100.7, 10.0.0.5")) == "198.51.100.7"
+    assert get_client_ip(make_request("127.0.0.1")) == "127.0.0.1"
+
+
+def test_middleware_applies_route_policies_before_the_app(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from backend import auth, rate_limit
+
+    calls = []
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def chat():
+        calls.append("chat")
+        return {"ok": True}
+
+    policies = {("POST", "/chat"): rate_limit.RoutePolicy("chat", "Slow down", (
+        ("user", RateLimit(limit=2, window=3600)),
+        ("ip", RateLimit(limit=2, window=3600)),
+    ))}
+    app.add_middleware(rate_limit.RateLimitMiddleware, policies=policies, limiter=SlidingWindowLimiter())
+    monkeypatch.setattr(rate_limit, "route_stats", {})
+    client = TestClient(app)
+
+    def headers(user_id):
+        token = auth.create_access_token({"sub": f"{user_id}@uos.edu.krd", "user_type": "user", "user_id": user_id})
+        return {"Authorization": f"Bearer {token}"}
+
+    first = client.post("/chat", headers=headers(1))
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    assert client.post("/chat", headers=headers(1)).status_code == 200
+    rejected = client.post("/chat", headers=headers(1))
+    assert rejected.status_code == 429
+    assert rejected.json() == {"detail": "Slow down"}
+    assert "Retry-After" in rejected.headers
+
+    # Another user from the same address only has the address cap left
+    assert client.post("/chat", headers=headers(2)).status_code == 429
+    assert client.get("/chat").status_code == 405
+    assert calls == ["chat", "chat"]
+    assert rate_limit.route_stats["chat"] == {"allowed": 2, "rejected_user": 1, "rejected_ip": 1}
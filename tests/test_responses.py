@@ -0,0 +1,83 @@
+import gzip
+import json
+import zlib
+from datetime import datetime
+
+from fastapi import FastAPI
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from backend.responses import CompressionMiddleware, FastJSONResponse
+
+
+def make_client():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    rows = [{"id": i, "message": "what are the library opening hours?", "created_at": datetime(2025, 1, 1, 9, i)}
+            for i in range(50)]
+
+    @app.get("/big")
+    async def big():
+        return FastJSONResponse({"rows": rows})
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/encoded")
+    async def encoded():
+        return Response(gzip.compress(b"x" * 2000), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for row in rows:
+                yield json.dumps({"id": row["id"]}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return TestClient(app), rows
+
+
+def test_large_json_is_compressed_and_small_is_not():
+    client, rows = make_client()
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(json.dumps(response.json()))
+    assert response.json()["rows"][1]["created_at"] == "2025-01-01T09:01:00"
+
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/big", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_already_encoded_and_streamed_responses():
+    client, rows = make_client()
+    encoded = client.get("/encoded", headers={"Accept-Encoding": "gzip"})
+    assert encoded.text == "x" * 2000  # decoded once, so not double-compressed
+
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    lines = zlib.decompress(raw, 16 + zlib.MAX_WBITS).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [row["id"] for row in rows]
+
+
+def test_range_responses_are_not_compressed(tmp_path):
+    log = tmp_path / "export.ndjson"
+    log.write_text('{"id": 1, "message": "library hours"}\n' * 200)
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/export")
+    async def export():
+        return FileResponse(log, media_type="application/x-ndjson")
+
+    client = TestClient(app)
+    partial = client.get("/export", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-999"})
+    assert partial.status_code == 206
+    assert "content-encoding" not in partial.headers
+    assert partial.headers["content-range"] == f"bytes 0-999/{log.stat().st_size}"
+    assert partial.content == log.read_bytes()[:1000]
+
+    assert client.get("/export", headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select, func
+
+from backend import retention
+from backend.database import ChatSession, ChatMessage, ChatArchive
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_retention_purges_guests_and_archives_old_sessions(async_session, seed, monkeypatch):
+    monkeypatch.setattr(retention, "AsyncSessionLocal", async_session)
+    monkeypatch.setattr(retention, "RETENTION_BATCH_SIZE", 3)
+    # 20 sessions on 2025-01-01, odd ones registered, 3 messages each
+    await seed()
+    async with async_session() as db:
+        db.add(ChatSession(session_id="guest-recent", created_at=datetime.utcnow()))
+        await db.commit()
+
+    cutoff = datetime(2025, 1, 1, 0, 10)
+    purged = await retention.purge_guest_sessions(cutoff=cutoff)
+    archived = await retention.archive_old_sessions(cutoff=cutoff)
+
+    # Sessions 0..9 fall before the cutoff: 5 guests purged, 5 registered archived
+    assert purged == 5
+    assert archived == {"sessions": 5, "messages": 15}
+
+    async with async_session() as db:
+        assert await db.scalar(select(func.count()).select_from(ChatSession)) == 11
+        assert await db.scalar(select(func.count()).select_from(ChatMessage)) == 30
+        assert await db.scalar(select(func.count()).select_from(ChatArchive)) == 5
+
+    restored = await retention.get_archived_session(2)
+    assert [m["message"] for m in restored["messages"]] == ["q0", "q1", "q2"]
+    assert restored["created_at"] == datetime(2025, 1, 1, 0, 1)
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+
+from backend.database import ChatSession, ChatMessage
+from backend.search import create_search_index, search_messages
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_search_ranks_and_highlights_english_and_kurdish(engine, async_session):
+    async with async_session() as db:
+        session = ChatSession(session_id="guest-1", created_at=datetime(2025, 1, 1))
+        db.add(session)
+        await db.flush()
+        # Written before the index exists, picked up by the rebuild
+        db.add(ChatMessage(session_id=session.id, message="Is there a scholarship?",
+                           response="Yes, the scholarship office is in building A. Scholarship forms are online.",
+                           message_type="conversation", created_at=datetime(2025, 1, 1)))
+        await db.commit()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(create_search_index)
+
+    async with async_session() as db:
+        # Written after, indexed by the insert trigger
+        db.add(ChatMessage(session_id=1, message="scholarship deadline", response="March",
+                           message_type="conversation", created_at=datetime(2025, 1, 2)))
+        db.add(ChatMessage(session_id=1, message="زانکۆی سلێمانی لە کوێیە؟", response="لە شاری سلێمانی",
+                           message_type="conversation", created_at=datetime(2025, 1, 3)))
+        await db.commit()
+
+        hits = await search_messages(db, "scholarship")
+        assert sorted(hit["id"] for hit in hits) == [1, 2]
+        assert hits[0]["score"] >= hits[1]["score"]
+        first = next(hit for hit in hits if hit["id"] == 1)
+        assert "<mark>scholarship</mark>" in first["response_snippet"]
+        assert first["created_at"] == datetime(2025, 1, 1)
+
+        assert [hit["id"] for hit in await search_messages(db, "سلێمانی")] == [3]
+        # FTS syntax in user input is treated as plain terms
+        assert await search_messages(db, 'scholarship" OR "x') == []
+        assert [hit["id"] for hit in await search_messages(db, "scholarship", limit=1, offset=1)] == [hits[1]["id"]]
+
+        await db.delete(await db.get(ChatMessage, 2))
+        await db.commit()
+        assert [hit["id"] for hit in await search_messages(db, "deadline")] == []
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import stats
+from backend.database import ChatMessage, StatsSnapshot
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_refresh_stores_snapshot_and_serves_from_memory(async_session, seed, monkeypatch):
+    monkeypatch.setattr(stats, "AsyncSessionLocal", async_session)
+    monkeypatch.setattr(stats, "latest_snapshot", None)
+    await seed(sessions=4, messages_per_session=2)
+    async with async_session() as db:
+        # One recent message in a registered user's session
+        db.add(ChatMessage(session_id=2, message="now", response="ok",
+                           message_type="conversation", created_at=datetime.utcnow()))
+        db.add(StatsSnapshot(created_at=datetime.utcnow() - timedelta(days=stats.STATS_RETENTION_DAYS + 1)))
+        await db.commit()
+
+    # After a restart the newest stored row is served until the next refresh
+    assert (await stats.get_stats_snapshot())["refreshed_at"] < datetime.utcnow() - timedelta(days=1)
+
+    snapshot = await stats.refresh_stats_snapshot()
+    assert snapshot["total_users"] == 1
+    assert snapshot["total_chat_sessions"] == 4
+    assert snapshot["guest_chat_sessions"] == 2
+    assert snapshot["total_messages"] == 9
+    assert snapshot["messages_last_24h"] == 1
+    assert snapshot["active_users_last_24h"] == 1
+
+    statements = []
+    monkeypatch.setattr(stats, "AsyncSessionLocal", lambda: statements.append(1))
+    assert await stats.get_stats_snapshot() is snapshot
+    assert statements == []
+
+    async with async_session() as db:
+        rows = (await db.execute(StatsSnapshot.__table__.select())).fetchall()
+    # The stale snapshot was pruned
+    assert len(rows) == 1
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+import pytest
+
+from backend import token_quota
+from backend.token_quota import (
+    check_token_budget, check_token_budgets, get_quota_key, get_quota_keys, get_token_usage,
+    get_token_usage_summary, record_token_usage
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(token_quota.time, "time", lambda: now[0])
+    monkeypatch.setattr(token_quota, "token_usage_storage", OrderedDict())
+    monkeypatch.setattr(token_quota, "TOKEN_WINDOW_SECONDS", 3600)
+    monkeypatch.setattr(token_quota, "USER_TOKEN_BUDGET", 1000)
+    monkeypatch.setattr(token_quota, "GUEST_TOKEN_BUDGET", 100)
+    return now
+
+
+def test_budget_rejects_until_usage_rolls_out_of_the_window(clock):
+    key = get_quota_key({"user_type": "user", "user_id": 7}, "1.2.3.4")
+    assert key == "user:7"
+    record_token_usage(key, 600)
+    clock[0] += 1800
+    record_token_usage(key, 400)
+    assert get_token_usage(key) == 1000
+    assert not check_token_budget(key)
+
+    # The first bucket expires an hour later, the second one stays
+    clock[0] += 1900
+    assert get_token_usage(key) == 400
+    assert check_token_budget(key)
+
+
+def test_guests_get_the_smaller_budget_and_summary_orders_by_usage(clock):
+    guest = get_quota_key({"user_type": "guest", "email": "guest_abc"}, "1.2.3.4")
+    assert guest == "guest:abc"
+    record_token_usage(guest, 100)
+    record_token_usage("user:1", 300)
+    assert not check_token_budget(guest)
+
+    summary = get_token_usage_summary()
+    assert summary["tracked_keys"] == 2
+    assert summary["total_tokens"] == 400
+    assert [c["key"] for c in summary["consumers"]] == ["user:1", guest]
+    assert summary["consumers"][1] == {"key": guest, "tokens_used": 100, "budget": 100, "remaining": 0}
+
+
+def test_eviction_keeps_heavy_consumers(clock, monkeypatch):
+    monkeypatch.setattr(token_quota, "MAX_TRACKED_KEYS", 20)
+    record_token_usage("user:expired", 5000)
+    clock[0] += 4000
+    record_token_usage("user:heavy", 900)
+    for i in range(100):
+        record_token_usage(f"guest:minted-{i}", 1)
+    assert len(token_quota.token_usage_storage) <= 20
+    assert "user:expired" not in token_quota.token_usage_storage
+    # Freshly minted guest keys can't push out a heavy user's usage
+    assert get_token_usage("user:heavy") == 900
+
+
+def test_guest_sessions_from_one_address_share_its_budget(clock, monkeypatch):
+    monkeypatch.setattr(token_quota, "IP_TOKEN_BUDGET", 150)
+    first = get_quota_keys({"user_type": "guest", "email": "guest_first"}, "1.2.3.4")
+    assert first == ["guest:first", "ip:1.2.3.4"]
+    for quota_key in first:
+        record_token_usage(quota_key, 100)
+    assert not check_token_budgets(first)
+
+    # A freshly minted guest session has its own budget left, but not its address
+    second = get_quota_keys({"user_type": "guest", "email": "guest_second"}, "1.2.3.4")
+    for quota_key in second:
+        record_token_usage(quota_key, 50)
+    assert check_token_budget("guest:second")
+    assert not check_token_budgets(second)
+    assert check_token_budgets(get_quota_keys({"user_type": "guest", "email": "guest_third"}, "5.6.7.8"))
+    assert check_token_budgets(get_quota_keys({"user_type": "user", "user_id": 7}, "1.2.3.4"))